@@ -0,0 +1,101 @@
+"""
+Micro-benchmark of the data collators on pre-tokenized batches: `DataCollatorWithFlattening`, and
+`DataCollatorWithPadding` / `DataCollatorForLanguageModeling` against the tokenizer's `pad` they used to rely on.
+
+Run it on its own with `python benchmark/collators.py`, or through `benchmarks_entrypoint.py` to record the
+measurements in the metrics database.
+"""
+
+import argparse
+import os
+import tempfile
+from logging import Logger
+from time import perf_counter
+
+import numpy as np
+
+from transformers import (
+    BertTokenizer,
+    DataCollatorForLanguageModeling,
+    DataCollatorWithFlattening,
+    DataCollatorWithPadding,
+)
+
+
+def _make_tokenizer() -> BertTokenizer:
+    # Only the special tokens matter for collation, a tiny vocabulary is enough
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + [f"token{i}" for i in range(95)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vocab_file = os.path.join(tmp_dir, "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(vocab))
+        return BertTokenizer(vocab_file)
+
+
+def _make_features(batch_size: int, max_length: int, as_arrays: bool, rng: np.random.Generator) -> list[dict]:
+    features = []
+    for length in rng.integers(max_length // 4, max_length + 1, size=batch_size):
+        input_ids = rng.integers(5, 100, size=length)
+        feature = {"input_ids": input_ids, "attention_mask": np.ones(length, dtype=np.int64)}
+        # Lists, like the rows of a dataset without format, or arrays, like a dataset formatted as numpy
+        features.append(feature if as_arrays else {key: value.tolist() for key, value in feature.items()})
+    return features
+
+
+def _time_collator(collator, features: list[dict], num_iterations: int) -> float:
+    collator(features)  # warmup
+    start = perf_counter()
+    for _ in range(num_iterations):
+        collator(features)
+    return (perf_counter() - start) / num_iterations
+
+
+def benchmark_collators(batch_sizes=(8, 64, 256), max_lengths=(64, 512), num_iterations=20) -> dict[str, float]:
+    """
+    Returns the mean time per call, in seconds, of every collator for every `(batch_size, max_length)` combination.
+    """
+    tokenizer = _make_tokenizer()
+    rng = np.random.default_rng(0)
+    collators = {
+        "tokenizer_pad": lambda features: tokenizer.pad(features, return_tensors="pt"),
+        "with_padding": DataCollatorWithPadding(tokenizer),
+        "language_modeling": DataCollatorForLanguageModeling(tokenizer, mlm=False),
+        "with_flattening": DataCollatorWithFlattening(return_flash_attn_kwargs=True),
+    }
+    measurements = {}
+    for max_length in max_lengths:
+        for batch_size in batch_sizes:
+            for input_type in ["lists", "arrays"]:
+                features = _make_features(batch_size, max_length, input_type == "arrays", rng)
+                for name, collator in collators.items():
+                    key = f"{name}_bs{batch_size}_len{max_length}_{input_type}_secs"
+                    measurements[key] = _time_collator(collator, features, num_iterations)
+    return measurements
+
+
+def run_benchmark(logger: Logger, repository: str, branch: str, commit_id: str, commit_msg: str, **kwargs):
+    import psycopg2
+    from benchmarks_entrypoint import MetricsRecorder
+
+    metrics_recorder = MetricsRecorder(
+        psycopg2.connect("dbname=metrics"), logger, repository, branch, commit_id, commit_msg
+    )
+    try:
+        benchmark_id = metrics_recorder.initialise_benchmark({"gpu_name": "cpu", "model_id": "data_collators"})
+        logger.info(f"running benchmark #{benchmark_id} for the data collators")
+        measurements = benchmark_collators()
+        metrics_recorder.collect_model_measurements(benchmark_id, measurements)
+    finally:
+        metrics_recorder.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the data collators on pre-tokenized batches.")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[8, 64, 256])
+    parser.add_argument("--max_lengths", type=int, nargs="+", default=[64, 512])
+    parser.add_argument("--num_iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    results = benchmark_collators(args.batch_sizes, args.max_lengths, args.num_iterations)
+    for key, seconds in results.items():
+        print(f"{key[: -len('_secs')]:<48} {seconds * 1e3:9.3f}ms")
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark of the top-p / min-p logits warpers: the sorting implementations against the sort-free ones.
+
+Run it on its own with `python benchmark/sampling.py`, or through `benchmarks_entrypoint.py` to record the
+measurements in the metrics database.
+"""
+
+import argparse
+from logging import Logger
+from time import perf_counter
+
+import torch
+
+from transformers import MinPLogitsWarper, SortFreeMinPLogitsWarper, SortFreeTopPLogitsWarper, TopPLogitsWarper
+
+
+WARPERS = {
+    "top_p": (TopPLogitsWarper, SortFreeTopPLogitsWarper, {"top_p": 0.9}),
+    "min_p": (MinPLogitsWarper, SortFreeMinPLogitsWarper, {"min_p": 0.05}),
+}
+
+
+def _time_warper(warper, scores: torch.Tensor, num_iterations: int) -> float:
+    warper(None, scores)  # warmup
+    if scores.device.type == "cuda":
+        torch.cuda.synchronize()
+    start = perf_counter()
+    for _ in range(num_iterations):
+        warper(None, scores)
+    if scores.device.type == "cuda":
+        torch.cuda.synchronize()
+    return (perf_counter() - start) / num_iterations
+
+
+def benchmark_warpers(
+    batch_sizes=(1, 8, 64), vocab_sizes=(32_000, 128_000, 256_000), num_iterations=10, device=None
+) -> dict[str, float]:
+    """
+    Returns the mean time per call, in seconds, of every warper for every `(batch_size, vocab_size)` combination.
+    """
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    measurements = {}
+    for vocab_size in vocab_sizes:
+        for batch_size in batch_sizes:
+            # LM-like logits: a peaked distribution over a long tail
+            scores = torch.randn(batch_size, vocab_size, device=device) * 3
+            for name, (sorting_class, sort_free_class, kwargs) in WARPERS.items():
+                key = f"{name}_bs{batch_size}_vocab{vocab_size}"
+                measurements[f"{key}_sort_secs"] = _time_warper(sorting_class(**kwargs), scores, num_iterations)
+                measurements[f"{key}_sort_free_secs"] = _time_warper(sort_free_class(**kwargs), scores, num_iterations)
+    return measurements
+
+
+def run_benchmark(logger: Logger, repository: str, branch: str, commit_id: str, commit_msg: str, **kwargs):
+    import psycopg2
+    from benchmarks_entrypoint import MetricsRecorder
+
+    metrics_recorder = MetricsRecorder(
+        psycopg2.connect("dbname=metrics"), logger, repository, branch, commit_id, commit_msg
+    )
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    try:
+        gpu_name = torch.cuda.get_device_name() if device == "cuda" else "cpu"
+        benchmark_id = metrics_recorder.initialise_benchmark({"gpu_name": gpu_name, "model_id": "sampling_warpers"})
+        logger.info(f"running benchmark #{benchmark_id} on {gpu_name} for the sampling warpers")
+        measurements = benchmark_warpers(device=device)
+        metrics_recorder.collect_model_measurements(benchmark_id, measurements)
+    finally:
+        metrics_recorder.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the sorting and sort-free sampling warpers.")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--vocab_sizes", type=int, nargs="+", default=[32_000, 128_000, 256_000])
+    parser.add_argument("--num_iterations", type=int, default=10)
+    parser.add_argument("--device", type=str, default=None)
+    args = parser.parse_args()
+
+    results = benchmark_warpers(args.batch_sizes, args.vocab_sizes, args.num_iterations, args.device)
+    for key in sorted(k for k in results if k.endswith("_sort_secs")):
+        sort_time = results[key]
+        sort_free_time = results[key.replace("_sort_secs", "_sort_free_secs")]
+        print(
+            f"{key[: -len('_sort_secs')]:<32} sort: {sort_time * 1e3:9.3f}ms  sort-free: {sort_free_time * 1e3:9.3f}ms"
+            f"  speedup: {sort_time / sort_free_time:5.2f}x"
+        )
@@ -156,14 +156,17 @@ _import_structure = {
         "ImageTextToTextPipeline",
         "ImageToImagePipeline",
         "ImageToTextPipeline",
+        "InMemoryPipelineCache",
         "JsonPipelineDataFormat",
         "MaskGenerationPipeline",
         "NerPipeline",
         "ObjectDetectionPipeline",
         "PipedPipelineDataFormat",
         "Pipeline",
+        "PipelineCache",
         "PipelineDataFormat",
         "QuestionAnsweringPipeline",
+        "SQLitePipelineCache",
         "SummarizationPipeline",
         "TableQuestionAnsweringPipeline",
         "Text2TextGenerationPipeline",
@@ -197,6 +200,7 @@ _import_structure = {
         "EarlyStoppingCallback",
         "PrinterCallback",
         "ProgressCallback",
+        "StepProfilerCallback",
         "TrainerCallback",
         "TrainerControl",
         "TrainerState",
@@ -389,6 +393,7 @@ else:
             "ClassifierFreeGuidanceLogitsProcessor",
             "ConstrainedBeamSearchScorer",
             "Constraint",
+            "ConstraintAutomaton",
             "ConstraintListState",
             "DisjunctiveConstraint",
             "EncoderNoRepeatNGramLogitsProcessor",
@@ -416,6 +421,8 @@ else:
             "PrefixConstrainedLogitsProcessor",
             "RepetitionPenaltyLogitsProcessor",
             "SequenceBiasLogitsProcessor",
+            "SortFreeMinPLogitsWarper",
+            "SortFreeTopPLogitsWarper",
             "StoppingCriteria",
             "StoppingCriteriaList",
             "StopStringCriteria",
@@ -467,7 +474,13 @@ else:
     _import_structure["sagemaker"] = []
     _import_structure["time_series_utils"] = []
     _import_structure["trainer"] = ["Trainer"]
-    _import_structure["trainer_pt_utils"] = ["torch_distributed_zero_first"]
+    _import_structure["trainer_pt_utils"] = [
+        "PackedTextDataset",
+        "StreamingAccuracy",
+        "StreamingMetric",
+        "StreamingPerplexity",
+        "torch_distributed_zero_first",
+    ]
     _import_structure["trainer_seq2seq"] = ["Seq2SeqTrainer"]
 
 # TensorFlow-backed objects
@@ -650,14 +663,17 @@ if TYPE_CHECKING:
         ImageTextToTextPipeline,
         ImageToImagePipeline,
         ImageToTextPipeline,
+        InMemoryPipelineCache,
         JsonPipelineDataFormat,
         MaskGenerationPipeline,
         NerPipeline,
         ObjectDetectionPipeline,
         PipedPipelineDataFormat,
         Pipeline,
+        PipelineCache,
         PipelineDataFormat,
         QuestionAnsweringPipeline,
+        SQLitePipelineCache,
         SummarizationPipeline,
         TableQuestionAnsweringPipeline,
         Text2TextGenerationPipeline,
@@ -693,6 +709,7 @@ if TYPE_CHECKING:
         EarlyStoppingCallback,
         PrinterCallback,
         ProgressCallback,
+        StepProfilerCallback,
         TrainerCallback,
         TrainerControl,
         TrainerState,
@@ -869,6 +886,7 @@ if TYPE_CHECKING:
             ClassifierFreeGuidanceLogitsProcessor,
             ConstrainedBeamSearchScorer,
             Constraint,
+            ConstraintAutomaton,
             ConstraintListState,
             DisjunctiveConstraint,
             EncoderNoRepeatNGramLogitsProcessor,
@@ -896,6 +914,8 @@ if TYPE_CHECKING:
             PrefixConstrainedLogitsProcessor,
             RepetitionPenaltyLogitsProcessor,
             SequenceBiasLogitsProcessor,
+            SortFreeMinPLogitsWarper,
+            SortFreeTopPLogitsWarper,
             StoppingCriteria,
             StoppingCriteriaList,
             StopStringCriteria,
@@ -942,7 +962,13 @@ if TYPE_CHECKING:
 
         # Trainer
         from .trainer import Trainer
-        from .trainer_pt_utils import torch_distributed_zero_first
+        from .trainer_pt_utils import (
+            PackedTextDataset,
+            StreamingAccuracy,
+            StreamingMetric,
+            StreamingPerplexity,
+            torch_distributed_zero_first,
+        )
         from .trainer_seq2seq import Seq2SeqTrainer
 
     # TensorFlow
@@ -23,7 +23,7 @@ from typing import Any, Callable, NewType, Optional, Union
 import numpy as np
 
 from ..models.bert import BertTokenizer, BertTokenizerFast
-from ..tokenization_utils_base import PreTrainedTokenizerBase
+from ..tokenization_utils_base import BatchEncoding, PreTrainedTokenizerBase
 from ..utils import PaddingStrategy
 
 
@@ -50,10 +50,121 @@ class DataCollatorMixin:
             raise ValueError(f"Framework '{return_tensors}' not recognized!")
 
 
+def _numpy_pad_sequences(sequences, length: int, padding_value: int, padding_side: str = "right") -> np.ndarray:
+    """
+    Pads the 1D integer `sequences` to `length` in a single `(len(sequences), length)` array, without any per-token
+    Python work.
+    """
+    lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int64)
+    result = np.full((len(sequences), length), padding_value, dtype=np.int64)
+    positions = np.arange(length)
+    if padding_side == "right":
+        mask = positions < lengths[:, None]
+    else:
+        mask = positions >= (length - lengths)[:, None]
+    # The mask is True in the same row-major order as the concatenated sequences
+    result[mask] = np.concatenate(sequences)
+    return result
+
+
+def _numpy_pad(
+    tokenizer,
+    encoded_inputs,
+    padding=True,
+    max_length=None,
+    pad_to_multiple_of=None,
+    padding_side=None,
+    return_attention_mask=None,
+    return_tensors=None,
+    verbose=True,
+):
+    """
+    Vectorized equivalent of `tokenizer.pad` for the common case of a list of features holding integer sequences (e.g.
+    `input_ids`, `attention_mask`) and integer values of the same shape (e.g. `labels` for sequence classification),
+    given as lists, NumPy arrays or tensors. Every key is padded in a single NumPy operation instead of one feature at a
+    time in Python.
+
+    Returns `None` whenever the result might differ from `tokenizer.pad`, so that the caller falls back to it.
+    """
+    if (
+        return_tensors not in ("pt", "np")
+        or not isinstance(tokenizer, PreTrainedTokenizerBase)
+        # Some tokenizers pad other keys (e.g. bounding boxes) in their own `_pad`
+        or type(tokenizer).pad is not PreTrainedTokenizerBase.pad
+        or type(tokenizer)._pad is not PreTrainedTokenizerBase._pad
+        or tokenizer.model_input_names[0] != "input_ids"
+        or tokenizer.pad_token is None
+        or not isinstance(encoded_inputs, (list, tuple))
+        or len(encoded_inputs) == 0
+        or not all(isinstance(feature, Mapping) for feature in encoded_inputs)
+    ):
+        return None
+    if padding is True or padding == "longest":
+        target_length = None
+    elif padding == "max_length" and max_length is not None:
+        target_length = max_length
+    else:
+        return None
+    padding_side = padding_side if padding_side is not None else tokenizer.padding_side
+    if return_attention_mask is None:
+        return_attention_mask = "attention_mask" in tokenizer.model_input_names
+
+    keys = list(encoded_inputs[0].keys())
+    if "input_ids" not in keys or any(feature.keys() != encoded_inputs[0].keys() for feature in encoded_inputs):
+        return None
+    if "attention_mask" in keys and not return_attention_mask:
+        return None
+    padding_values = {
+        "input_ids": tokenizer.pad_token_id,
+        "attention_mask": 0,
+        "token_type_ids": tokenizer.pad_token_type_id,
+        "special_tokens_mask": 1,
+    }
+
+    columns = {}
+    for key in keys:
+        values = [np.asarray(feature[key]) for feature in encoded_inputs]
+        if any(not np.issubdtype(value.dtype, np.integer) for value in values):
+            return None
+        columns[key] = values
+    lengths = np.array([len(input_ids) for input_ids in columns["input_ids"]], dtype=np.int64)
+    length = int(lengths.max()) if target_length is None else target_length
+    if lengths.max() > length:
+        return None
+    if pad_to_multiple_of is not None and length % pad_to_multiple_of != 0:
+        length = ((length // pad_to_multiple_of) + 1) * pad_to_multiple_of
+
+    batch = {}
+    for key, values in columns.items():
+        if key in padding_values:
+            if any(value.ndim != 1 for value in values) or [len(value) for value in values] != lengths.tolist():
+                return None
+            batch[key] = _numpy_pad_sequences(values, length, padding_values[key], padding_side)
+        else:
+            # Not padded by `tokenizer.pad`, so they must already have the same shape
+            if any(value.shape != values[0].shape for value in values):
+                return None
+            batch[key] = np.stack(values).astype(np.int64, copy=False)
+    if return_attention_mask and "attention_mask" not in batch:
+        batch["attention_mask"] = _numpy_pad_sequences(
+            [np.ones(sequence_length, dtype=np.int64) for sequence_length in lengths], length, 0, padding_side
+        )
+
+    if return_tensors == "pt":
+        import torch
+
+        batch = {key: torch.from_numpy(value) for key, value in batch.items()}
+    return BatchEncoding(batch)
+
+
 def pad_without_fast_tokenizer_warning(tokenizer, *pad_args, **pad_kwargs):
     """
     Pads without triggering the warning about how using the pad function is sub-optimal when using a fast tokenizer.
+    Lists of features holding integer sequences are padded with vectorized NumPy operations instead.
     """
+    padded = _numpy_pad(tokenizer, *pad_args, **pad_kwargs)
+    if padded is not None:
+        return padded
 
     # To avoid errors when using Feature extractors
     if not hasattr(tokenizer, "deprecation_warnings"):
@@ -430,9 +541,10 @@ def _torch_collate_batch(examples, tokenizer, pad_to_multiple_of: Optional[int]
     """Collate `examples` into a batch, using the information in `tokenizer` for padding if necessary."""
     import torch
 
-    # Tensorize if necessary.
+    # Lists and arrays are collated in a single NumPy pass, instead of being tensorized one by one.
     if isinstance(examples[0], (list, tuple, np.ndarray)):
-        examples = [torch.tensor(e, dtype=torch.long) for e in examples]
+        result = _numpy_collate_batch(examples, tokenizer, pad_to_multiple_of=pad_to_multiple_of)
+        return torch.from_numpy(result.astype(np.int64, copy=False))
 
     length_of_first = examples[0].size(0)
 
@@ -524,13 +636,8 @@ def _numpy_collate_batch(examples, tokenizer, pad_to_multiple_of: Optional[int]
     max_length = max(len(x) for x in examples)
     if pad_to_multiple_of is not None and (max_length % pad_to_multiple_of != 0):
         max_length = ((max_length // pad_to_multiple_of) + 1) * pad_to_multiple_of
-    result = np.full(shape=(len(examples), max_length), fill_value=tokenizer.pad_token_id, dtype=examples[0].dtype)
-    for i, example in enumerate(examples):
-        if tokenizer.padding_side == "right":
-            result[i, : example.shape[0]] = example
-        else:
-            result[i, -example.shape[0] :] = example
-    return result
+    result = _numpy_pad_sequences(examples, max_length, tokenizer.pad_token_id, tokenizer.padding_side)
+    return result.astype(examples[0].dtype, copy=False)
 
 
 @dataclass
@@ -2012,53 +2119,43 @@ class DataCollatorWithFlattening(DefaultDataCollator):
             return_tensors = self.return_tensors
         if separator_id is None:
             separator_id = self.separator_id
+        if return_tensors not in ("pt", "np"):
+            raise ValueError(f'return_tensors must be one of ("pt", "np"), {return_tensors=} not suported')
         is_labels_provided = "labels" in features[0]
-        batch = {"input_ids": [], "labels": []}
+
+        # Whole sequences are concatenated at once and everything else is computed from their lengths, so that the
+        # tokens are only ever handled by NumPy (sequences given as arrays, e.g. from Arrow, are not even copied to
+        # Python lists).
+        input_ids = [np.asarray(sample["input_ids"]) for sample in features]
+        lengths = np.array([len(sequence) for sequence in input_ids], dtype=np.int64)
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        batch = {"input_ids": np.concatenate(input_ids).astype(np.int64, copy=False)}
+        if is_labels_provided:
+            labels = np.concatenate([np.asarray(sample["labels"]) for sample in features]).astype(np.int64)
+        else:
+            labels = batch["input_ids"].copy()
+        labels[starts[lengths > 0]] = separator_id
+        batch["labels"] = labels
         if self.return_position_ids:
-            batch.update({"position_ids": []})
+            batch["position_ids"] = np.arange(ends[-1]) - np.repeat(starts, lengths)
         if self.return_seq_idx:
-            batch.update({"seq_idx": []})
+            batch["seq_idx"] = np.repeat(np.arange(len(features)), lengths)
         if self.return_flash_attn_kwargs:
-            cu_seq_lens = [0]
-            max_length = 0
-        for seq_idx, sample in enumerate(features):
-            input_ids = sample["input_ids"]
-            batch["input_ids"] += input_ids
-            if is_labels_provided:
-                batch["labels"] += [separator_id] + sample["labels"][1:]
-            else:
-                batch["labels"] += [separator_id] + input_ids[1:]
-            if self.return_position_ids:
-                batch["position_ids"] += list(range(len(input_ids)))
-            if self.return_seq_idx:
-                batch["seq_idx"] += [seq_idx for _ in range(len(input_ids))]
-            if self.return_flash_attn_kwargs:
-                cu_seq_lens.append(cu_seq_lens[-1] + len(input_ids))
-                max_length = max(max_length, len(input_ids))
+            batch["cu_seq_lens_q"] = batch["cu_seq_lens_k"] = np.concatenate([[0], ends])
+            batch["max_length_q"] = batch["max_length_k"] = int(lengths.max())
 
-        if self.return_flash_attn_kwargs:
-            batch["cu_seq_lens_q"] = batch["cu_seq_lens_k"] = cu_seq_lens
-            batch["max_length_q"] = batch["max_length_k"] = max_length
-
-        # FlashAttentionKwargs and seq_idx are expected to be int32s.
         if return_tensors == "pt":
             import torch
 
-            data_cls = torch.tensor
-            dtype_64 = torch.int64
-            dtype_32 = torch.int32
-        elif return_tensors == "np":
-            data_cls = np.array
-            dtype_64 = np.int64
-            dtype_32 = np.int32
-        else:
-            raise ValueError(f'return_tensors must be one of ("pt", "np"), {return_tensors=} not suported')
-
+        # FlashAttentionKwargs and seq_idx are expected to be int32s.
         for k, v in batch.items():
-            if k in self._batch_dim_keys:
-                v = [v]
             # Flash attention max_len_{q,k} are python ints
-            if k not in self._py_int_keys:
-                batch[k] = data_cls(v, dtype=dtype_64 if k in self._int_64_keys else dtype_32)
+            if k in self._py_int_keys:
+                continue
+            v = v.astype(np.int64 if k in self._int_64_keys else np.int32, copy=False)
+            if k in self._batch_dim_keys:
+                v = v[None]
+            batch[k] = torch.from_numpy(v) if return_tensors == "pt" else v
 
         return batch
@@ -37,6 +37,7 @@ except OptionalDependencyNotAvailable:
 else:
     _import_structure["beam_constraints"] = [
         "Constraint",
+        "ConstraintAutomaton",
         "ConstraintListState",
         "DisjunctiveConstraint",
         "PhrasalConstraint",
@@ -76,6 +77,8 @@ else:
         "PrefixConstrainedLogitsProcessor",
         "RepetitionPenaltyLogitsProcessor",
         "SequenceBiasLogitsProcessor",
+        "SortFreeMinPLogitsWarper",
+        "SortFreeTopPLogitsWarper",
         "SuppressTokensLogitsProcessor",
         "SuppressTokensAtBeginLogitsProcessor",
         "SynthIDTextWatermarkLogitsProcessor",
@@ -208,7 +211,13 @@ if TYPE_CHECKING:
     except OptionalDependencyNotAvailable:
         pass
     else:
-        from .beam_constraints import Constraint, ConstraintListState, DisjunctiveConstraint, PhrasalConstraint
+        from .beam_constraints import (
+            Constraint,
+            ConstraintAutomaton,
+            ConstraintListState,
+            DisjunctiveConstraint,
+            PhrasalConstraint,
+        )
         from .beam_search import BeamHypotheses, BeamScorer, BeamSearchScorer, ConstrainedBeamSearchScorer
         from .candidate_generator import (
             AssistedCandidateGenerator,
@@ -240,6 +249,8 @@ if TYPE_CHECKING:
             PrefixConstrainedLogitsProcessor,
             RepetitionPenaltyLogitsProcessor,
             SequenceBiasLogitsProcessor,
+            SortFreeMinPLogitsWarper,
+            SortFreeTopPLogitsWarper,
             SuppressTokensAtBeginLogitsProcessor,
             SuppressTokensLogitsProcessor,
             SynthIDTextWatermarkLogitsProcessor,
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Optional, Union
+
+import torch
 
 
 class Constraint(ABC):
@@ -345,7 +347,7 @@ class DisjunctiveConstraint(Constraint):
 
         if stateful:
             new_constraint.seq_len = self.seqlen
-            new_constraint.current_seq = self.current_seq
+            new_constraint.current_seq = list(self.current_seq)
             new_constraint.completed = self.completed
 
         return new_constraint
@@ -520,5 +522,147 @@ class ConstraintListState:
             if self.inprogress_constraint is not None:
                 new_state.inprogress_constraint = self.inprogress_constraint.copy(stateful=True)
             new_state.pending_constraints = [constraint.copy() for constraint in self.pending_constraints]
+            new_state.completed = self.completed
 
         return new_state
+
+
+class ConstraintAutomaton:
+    r"""
+    Compiles a list of constraints into a single trie automaton, shared by all the beams of a constrained beam search.
+    The progress of a beam through the constraints is an integer state tensor, so that stepping, copying and
+    reordering the states of all beams are tensor operations.
+
+    The progress of a beam follows the rules of [`ConstraintListState`]: at most one constraint is in progress, a
+    token that doesn't advance it resets its progress, and a token can only start a pending constraint when no
+    constraint is in progress. The state of a beam is a pair of integers: the trie node of the constraint in
+    progress (`0`, the root, when there is none) and the bitmask of the fulfilled constraints.
+
+    Each constraint gets its own branches of the trie, found by walking its `advance()` tokens, so any [`Constraint`]
+    can be compiled as long as it only has a finite number of ways to be fulfilled.
+
+    Args:
+        constraints (`list[Constraint]`):
+            A list of [`Constraint`] objects that must be fulfilled by the generated sequences.
+        device (`str` or `torch.device`, *optional*, defaults to `"cpu"`):
+            The device to place the automaton tensors on.
+    """
+
+    def __init__(self, constraints: list[Constraint], device: Union[str, torch.device] = "cpu"):
+        if len(constraints) == 0 or len(constraints) > 62:
+            raise ValueError(f"`constraints` must hold between 1 and 62 constraints, but holds {len(constraints)}.")
+
+        # max # of steps required to fulfill a given constraint, as in `ConstraintListState`
+        self.max_seqlen = max(c.seqlen for c in constraints)
+        self.n_constraints = len(constraints)
+
+        # node 0 is the root, the other nodes belong to a single constraint. `node_progress` is the number of steps
+        # taken through the constraint in progress, as measured by `ConstraintListState.get_bank`
+        children = [[]]
+        node_constraints = [-1]
+        node_completes = [False]
+        node_progress = [0]
+        for constraint_idx, constraint in enumerate(constraints):
+            nodes_to_expand = [(0, [])]
+            while len(nodes_to_expand) > 0:
+                node, token_ids = nodes_to_expand.pop()
+                advance = self._replay(constraint, token_ids).advance()
+                advance = [advance] if isinstance(advance, int) else advance or []
+                for token_id in advance:
+                    child_constraint = self._replay(constraint, token_ids)
+                    stepped, completed, _ = child_constraint.update(token_id)
+                    if not stepped:
+                        raise ValueError(
+                            f"{constraint.__class__.__name__} is not defined correctly: `update()` with a token from "
+                            "`advance()` must step the constraint."
+                        )
+                    child = len(children)
+                    children.append([])
+                    children[node].append((token_id, child))
+                    node_constraints.append(constraint_idx)
+                    node_completes.append(completed)
+                    node_progress.append(self.max_seqlen - child_constraint.remaining())
+                    if not completed:
+                        nodes_to_expand.append((child, token_ids + [token_id]))
+
+        # padded transition table: `child_token_ids[node, i]` leads to `child_nodes[node, i]`, padding leads to 0
+        max_children = max(len(node_children) for node_children in children)
+        self.child_token_ids = torch.full((len(children), max_children), -1, dtype=torch.long, device=device)
+        self.child_nodes = torch.zeros((len(children), max_children), dtype=torch.long, device=device)
+        for node, node_children in enumerate(children):
+            for i, (token_id, child) in enumerate(node_children):
+                self.child_token_ids[node, i] = token_id
+                self.child_nodes[node, i] = child
+        self.node_constraints = torch.tensor(node_constraints, dtype=torch.long, device=device)
+        self.node_completes = torch.tensor(node_completes, dtype=torch.bool, device=device)
+        self.node_progress = torch.tensor(node_progress, dtype=torch.long, device=device)
+        self.constraint_bits = 1 << torch.arange(self.n_constraints, dtype=torch.long, device=device)
+        self.all_completed = (1 << self.n_constraints) - 1
+
+    @staticmethod
+    def _replay(constraint: Constraint, token_ids: list[int]) -> Constraint:
+        constraint = constraint.copy(stateful=False)
+        for token_id in token_ids:
+            constraint.update(token_id)
+        return constraint
+
+    @property
+    def max_advance_tokens(self) -> int:
+        """The maximum number of tokens that advance the constraints from a single state."""
+        return self.child_token_ids.shape[1]
+
+    def _is_pending(self, states: torch.LongTensor, nodes: torch.LongTensor) -> torch.BoolTensor:
+        # whether the constraint of each node in `nodes` (shape `(..., k)`) is yet to be fulfilled in `states`
+        node_bits = self.constraint_bits[self.node_constraints[nodes].clamp(min=0)]
+        return (states[..., 1:] & node_bits) == 0
+
+    def init_states(self, input_ids: torch.LongTensor) -> torch.LongTensor:
+        """
+        Returns the states reached by reading `input_ids` (of shape `(batch_size, sequence_length)`) from the start.
+        The states are a `torch.LongTensor` of shape `(batch_size, 2)`.
+        """
+        states = torch.zeros((input_ids.shape[0], 2), dtype=torch.long, device=input_ids.device)
+        for token_ids in input_ids.T:
+            states = self.step(states, token_ids)
+        return states
+
+    def step(self, states: torch.LongTensor, token_ids: torch.LongTensor) -> torch.LongTensor:
+        """
+        Returns the states reached from `states` (of shape `(..., 2)`) by reading `token_ids` (of shape `(...)`).
+        """
+        child_token_ids = self.child_token_ids[states[..., 0]]
+        child_nodes = self.child_nodes[states[..., 0]]
+        # from the root, a token starts the first pending constraint it advances
+        matches = (child_token_ids == token_ids[..., None]) & self._is_pending(states, child_nodes)
+        has_match = matches.any(dim=-1)
+        next_nodes = torch.gather(child_nodes, -1, matches.to(torch.int8).argmax(dim=-1, keepdim=True)).squeeze(-1)
+        # a token that doesn't advance the constraint in progress resets it
+        next_nodes = torch.where(has_match, next_nodes, 0)
+
+        completes = has_match & self.node_completes[next_nodes]
+        completed = states[..., 1] | torch.where(
+            completes, self.constraint_bits[self.node_constraints[next_nodes].clamp(min=0)], 0
+        )
+        next_nodes = torch.where(completes, 0, next_nodes)
+        return torch.stack((next_nodes, completed), dim=-1)
+
+    def advance(self, states: torch.LongTensor) -> tuple[torch.LongTensor, torch.BoolTensor]:
+        """
+        Returns the tokens that advance the constraints from `states` (of shape `(..., 2)`), as a `torch.LongTensor` of
+        shape `(..., max_advance_tokens)`, and the mask of the valid ones among them.
+        """
+        child_nodes = self.child_nodes[states[..., 0]]
+        is_valid = (child_nodes > 0) & self._is_pending(states, child_nodes)
+        return self.child_token_ids[states[..., 0]], is_valid
+
+    def get_bank(self, states: torch.LongTensor) -> torch.LongTensor:
+        """
+        Returns the progress through the constraints of `states` (of shape `(..., 2)`), as in
+        [`ConstraintListState.get_bank`].
+        """
+        n_completed = ((states[..., 1:] & self.constraint_bits) != 0).sum(dim=-1)
+        return n_completed * self.max_seqlen + self.node_progress[states[..., 0]]
+
+    def is_completed(self, states: torch.LongTensor) -> torch.BoolTensor:
+        """Returns whether `states` (of shape `(..., 2)`) have fulfilled all the constraints."""
+        return states[..., 1] == self.all_completed
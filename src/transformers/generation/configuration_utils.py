@@ -211,6 +211,10 @@ class GenerationConfig(PushToHubMixin):
             Minimum token probability, which will be scaled by the probability of the most likely token. It must be a
             value between 0 and 1. Typical values are in the 0.01-0.2 range, comparably selective as setting `top_p` in
             the 0.99-0.8 range (use the opposite of normal `top_p` values).
+        sort_free_sampling (`bool`, *optional*, defaults to `False`):
+            Whether to apply `top_p` and `min_p` with [`SortFreeTopPLogitsWarper`] and [`SortFreeMinPLogitsWarper`],
+            which avoid sorting the whole vocabulary at each step. The kept tokens are the same, up to ties at the
+            cutoff probability. Recommended for models with large vocabularies.
         typical_p (`float`, *optional*, defaults to 1.0):
             Local typicality measures how similar the conditional probability of predicting a target token next is to
             the expected conditional probability of predicting a random token next, given the partial text already
@@ -284,6 +288,13 @@ class GenerationConfig(PushToHubMixin):
             Dictionary that maps a sequence of tokens to its bias term. Positive biases increase the odds of the
             sequence being selected, while negative biases do the opposite. Check
             [`~generation.SequenceBiasLogitsProcessor`] for further documentation and examples.
+        allowed_token_ids (`list[int]`, *optional*):
+            Restricts the output vocabulary to these token ids. The LM head is computed only over the corresponding
+            rows and the next-token distribution is normalized over them, which is much cheaper than the full
+            projection when generating with a large vocabulary on a small output space (e.g. classification labels or
+            a single language). Logits processors see the scores remapped to the full vocabulary, with the other
+            tokens set to `-inf`. Include the EOS token so that generation can stop before `max_length`. Only
+            supported by greedy search, sampling and beam search.
         token_healing (`bool`, *optional*, defaults to `False`):
             Heal tail tokens of prompts by replacing them with their appropriate extensions.
             This enhances the quality of completions for prompts affected by greedy tokenization bias.
@@ -314,6 +325,14 @@ class GenerationConfig(PushToHubMixin):
         output_logits (`bool`, *optional*):
             Whether or not to return the unprocessed prediction logit scores. See `logits` under returned tensors for
             more details.
+        output_logprobs (`bool`, *optional*, defaults to `False`):
+            Whether or not to return the log-probabilities of the selected tokens, recorded into preallocated buffers
+            as the tokens are generated. Unlike `output_scores`, this doesn't keep a `vocab_size` tensor per
+            generation step. Only supported by greedy search and sampling. See `logprobs` under returned tensors for
+            more details.
+        num_top_logprobs (`int`, *optional*, defaults to 0):
+            With `output_logprobs=True`, the number of most likely alternatives to record at each generation step,
+            along with their log-probabilities. See `top_logprobs` under returned tensors for more details.
         return_dict_in_generate (`bool`, *optional*, defaults to `False`):
             Whether or not to return a [`~utils.ModelOutput`], as opposed to returning exclusively the generated
             sequence. This flag must be set to `True` to return the generation cache (when `use_cache` is `True`)
@@ -386,7 +405,13 @@ class GenerationConfig(PushToHubMixin):
             need to use this flag.
     """
 
-    extra_output_flags = ("output_attentions", "output_hidden_states", "output_scores", "output_logits")
+    extra_output_flags = (
+        "output_attentions",
+        "output_hidden_states",
+        "output_scores",
+        "output_logits",
+        "output_logprobs",
+    )
 
     def __init__(self, **kwargs):
         # Parameters that control the length of the output
@@ -421,6 +446,7 @@ class GenerationConfig(PushToHubMixin):
         self.top_k = kwargs.pop("top_k", 50)
         self.top_p = kwargs.pop("top_p", 1.0)
         self.min_p = kwargs.pop("min_p", None)
+        self.sort_free_sampling = kwargs.pop("sort_free_sampling", False)
         self.typical_p = kwargs.pop("typical_p", 1.0)
         self.epsilon_cutoff = kwargs.pop("epsilon_cutoff", 0.0)
         self.eta_cutoff = kwargs.pop("eta_cutoff", 0.0)
@@ -440,6 +466,7 @@ class GenerationConfig(PushToHubMixin):
         self.suppress_tokens = kwargs.pop("suppress_tokens", None)
         self.begin_suppress_tokens = kwargs.pop("begin_suppress_tokens", None)
         self.sequence_bias = kwargs.pop("sequence_bias", None)
+        self.allowed_token_ids = kwargs.pop("allowed_token_ids", None)
         self.token_healing = kwargs.pop("token_healing", False)
         self.guidance_scale = kwargs.pop("guidance_scale", None)
         self.low_memory = kwargs.pop("low_memory", None)
@@ -457,6 +484,8 @@ class GenerationConfig(PushToHubMixin):
         self.output_hidden_states = kwargs.pop("output_hidden_states", False)
         self.output_scores = kwargs.pop("output_scores", False)
         self.output_logits = kwargs.pop("output_logits", None)
+        self.output_logprobs = kwargs.pop("output_logprobs", False)
+        self.num_top_logprobs = kwargs.pop("num_top_logprobs", 0)
         self.return_dict_in_generate = kwargs.pop("return_dict_in_generate", False)
 
         # Special tokens that can be used at generation time
@@ -602,6 +631,16 @@ class GenerationConfig(PushToHubMixin):
             raise ValueError(f"`early_stopping` must be a boolean or 'never', but is {self.early_stopping}.")
         if self.max_new_tokens is not None and self.max_new_tokens <= 0:
             raise ValueError(f"`max_new_tokens` must be greater than 0, but is {self.max_new_tokens}.")
+        if self.num_top_logprobs < 0:
+            raise ValueError(f"`num_top_logprobs` must be a non-negative integer, but is {self.num_top_logprobs}.")
+        if self.allowed_token_ids is not None and (
+            not isinstance(self.allowed_token_ids, list)
+            or len(self.allowed_token_ids) == 0
+            or any(not isinstance(token_id, int) or token_id < 0 for token_id in self.allowed_token_ids)
+        ):
+            raise ValueError(
+                f"`allowed_token_ids` must be a non-empty list of non-negative integers, but is {self.allowed_token_ids}."
+            )
         if self.pad_token_id is not None and self.pad_token_id < 0:
             minor_issues["pad_token_id"] = (
                 f"`pad_token_id` should be positive but got {self.pad_token_id}. This will cause errors when batch "
@@ -783,6 +822,12 @@ class GenerationConfig(PushToHubMixin):
                         f"`return_dict_in_generate` is not `True`, `{extra_output_flag}` is ignored."
                     )
 
+        if self.num_top_logprobs > 0 and not self.output_logprobs:
+            minor_issues["num_top_logprobs"] = (
+                f"`num_top_logprobs` is set to {self.num_top_logprobs}, but `output_logprobs` is not `True`. "
+                "`num_top_logprobs` is ignored unless `output_logprobs=True`."
+            )
+
         # 3. Check common issue: passing `generate` arguments inside the generation config
         generate_arguments = (
             "logits_processor",
@@ -492,6 +492,96 @@ class TopPLogitsWarper(LogitsProcessor):
         return scores_processed
 
 
+class SortFreeTopPLogitsWarper(LogitsProcessor):
+    """
+    [`LogitsProcessor`] that performs top-p filtering like [`TopPLogitsWarper`], without sorting the vocabulary.
+
+    Instead of sorting the probabilities and taking their cumulative sum, the probability at which the removed mass
+    would exceed `1 - top_p` is found with a radix selection. Non-negative float32 values are ordered like their int32
+    bit patterns, so the probability mass is histogrammed over the highest bits of each probability, the bucket holding
+    the cutoff is located with a cumulative sum over the (few) buckets, and the search is repeated on the lower bits of
+    that bucket only. This is exact after two `O(vocab_size)` passes and needs no host-device synchronization. Tokens
+    tied at the cutoff are either all kept or all removed, which is the only difference with [`TopPLogitsWarper`].
+    Enable it in `generate` with `sort_free_sampling=True`.
+
+    Args:
+        top_p (`float`):
+            If set to < 1, only the smallest set of most probable tokens with probabilities that add up to `top_p` or
+            higher are kept for generation.
+        filter_value (`float`, *optional*, defaults to -inf):
+            All filtered values will be set to this float value.
+        min_tokens_to_keep (`int`, *optional*, defaults to 1):
+            Minimum number of tokens that cannot be filtered.
+
+    Examples:
+
+    ```python
+    >>> import torch
+    >>> from transformers import SortFreeTopPLogitsWarper, TopPLogitsWarper
+
+    >>> scores = torch.log(torch.tensor([[0.05, 0.4, 0.1, 0.3, 0.15]]))
+    >>> SortFreeTopPLogitsWarper(top_p=0.8)(None, scores).isinf()
+    tensor([[ True, False,  True, False, False]])
+    >>> TopPLogitsWarper(top_p=0.8)(None, scores).isinf()
+    tensor([[ True, False,  True, False, False]])
+    ```
+    """
+
+    # Probabilities are in [0, 1], so their bit patterns fit in 30 bits (1.0 is 0x3F800000), split in two digits
+    _NUM_DIGIT_BITS = 15
+    _NUM_PROB_BITS = 30
+
+    def __init__(self, top_p: float, filter_value: float = -float("Inf"), min_tokens_to_keep: int = 1):
+        top_p = float(top_p)
+        if top_p < 0 or top_p > 1.0:
+            raise ValueError(f"`top_p` has to be a float > 0 and < 1, but is {top_p}")
+        if not isinstance(min_tokens_to_keep, int) or (min_tokens_to_keep < 1):
+            raise ValueError(f"`min_tokens_to_keep` has to be a positive integer, but is {min_tokens_to_keep}")
+
+        self.top_p = top_p
+        self.filter_value = filter_value
+        self.min_tokens_to_keep = min_tokens_to_keep
+
+    @add_start_docstrings(LOGITS_PROCESSOR_INPUTS_DOCSTRING)
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        probs = scores.float().softmax(dim=-1)
+        probs_bits = probs.view(torch.int32)
+        batch_size = probs.shape[0]
+        num_buckets = 1 << self._NUM_DIGIT_BITS
+        max_mass_to_remove = 1 - self.top_p
+
+        # Each row gets its own `num_buckets` slice of a flat histogram
+        row_offsets = torch.arange(batch_size, device=probs.device).unsqueeze(-1) * num_buckets
+        cutoff_bits = torch.zeros_like(probs_bits[:, :1])
+        mass_below_bucket = torch.zeros_like(probs[:, :1])
+        bucket_probs = probs
+        for shift in range(self._NUM_PROB_BITS - self._NUM_DIGIT_BITS, -1, -self._NUM_DIGIT_BITS):
+            digits = (probs_bits >> shift) & (num_buckets - 1)
+            bucket_mass = torch.zeros(batch_size * num_buckets, dtype=probs.dtype, device=probs.device)
+            bucket_mass.scatter_add_(0, (digits + row_offsets).view(-1), bucket_probs.reshape(-1))
+            cumulative_mass = mass_below_bucket + bucket_mass.view(batch_size, num_buckets).cumsum(dim=-1)
+
+            # The cutoff lies in the first bucket whose cumulative mass exceeds `1 - top_p`
+            selected_bucket = (cumulative_mass <= max_mass_to_remove).sum(dim=-1, keepdim=True)
+            selected_bucket = selected_bucket.clamp_(max=num_buckets - 1)
+            mass_below_bucket = torch.where(
+                selected_bucket > 0, cumulative_mass.gather(-1, (selected_bucket - 1).clamp(min=0)), mass_below_bucket
+            )
+            cutoff_bits |= selected_bucket.to(cutoff_bits.dtype) << shift
+            if shift > 0:
+                bucket_probs = bucket_probs.masked_fill(digits != selected_bucket, 0.0)
+
+        # The most likely token is always kept, even with `top_p=0` or rounding errors in the cumulative mass
+        cutoff_bits = torch.minimum(cutoff_bits, probs_bits.max(dim=-1, keepdim=True).values)
+        indices_to_remove = probs_bits < cutoff_bits
+        # Keep at least min_tokens_to_keep, a top-k over a handful of tokens is much cheaper than a sort
+        if self.min_tokens_to_keep > 1:
+            kth_prob = probs.topk(min(self.min_tokens_to_keep, probs.shape[-1]), dim=-1).values[..., -1:]
+            indices_to_remove &= probs < kth_prob
+        scores_processed = scores.masked_fill(indices_to_remove, self.filter_value)
+        return scores_processed
+
+
 class TopKLogitsWarper(LogitsProcessor):
     r"""
     [`LogitsProcessor`] that performs top-k, i.e. restricting to the k highest probability elements. Often used
@@ -622,6 +712,47 @@ class MinPLogitsWarper(LogitsProcessor):
         return scores_processed
 
 
+class SortFreeMinPLogitsWarper(LogitsProcessor):
+    """
+    [`LogitsProcessor`] that performs min-p filtering like [`MinPLogitsWarper`], without sorting the vocabulary. The
+    `min_tokens_to_keep` guarantee is enforced with a top-k over `min_tokens_to_keep` tokens instead of a full argsort,
+    so the whole filter is `O(vocab_size)`. Enable it in `generate` with `sort_free_sampling=True`.
+
+    Args:
+        min_p (`float`):
+            Minimum token probability, which will be scaled by the probability of the most likely token. It must be a
+            value between 0 and 1. Typical values are in the 0.01-0.2 range, comparably selective as setting `top_p` in
+            the 0.99-0.8 range (use the opposite of normal `top_p` values).
+        filter_value (`float`, *optional*, defaults to -inf):
+            All filtered values will be set to this float value.
+        min_tokens_to_keep (`int`, *optional*, defaults to 1):
+            Minimum number of tokens that cannot be filtered.
+    """
+
+    def __init__(self, min_p: float, filter_value: float = -float("Inf"), min_tokens_to_keep: int = 1):
+        if not (0 <= min_p <= 1.0):
+            raise ValueError(f"`min_p` has to be a float in the [0, 1] interval, but is {min_p}")
+        if not isinstance(min_tokens_to_keep, int) or (min_tokens_to_keep < 1):
+            raise ValueError(f"`min_tokens_to_keep` has to be a positive integer, but is {min_tokens_to_keep}")
+
+        self.min_p = min_p
+        self.filter_value = filter_value
+        self.min_tokens_to_keep = min_tokens_to_keep
+
+    @add_start_docstrings(LOGITS_PROCESSOR_INPUTS_DOCSTRING)
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        probs = torch.softmax(scores, dim=-1)
+        top_probs, _ = probs.max(dim=-1, keepdim=True)
+        tokens_to_remove = probs < self.min_p * top_probs
+
+        # The most likely token is never removed, so only larger `min_tokens_to_keep` need the k-th probability
+        if self.min_tokens_to_keep > 1:
+            kth_prob = probs.topk(min(self.min_tokens_to_keep, probs.shape[-1]), dim=-1).values[..., -1:]
+            tokens_to_remove &= probs < kth_prob
+        scores_processed = scores.masked_fill(tokens_to_remove, self.filter_value)
+        return scores_processed
+
+
 class TypicalLogitsWarper(LogitsProcessor):
     r"""
     [`LogitsProcessor`] that performs typical decoding. Inspired on how humans use language, it prioritizes tokens
@@ -1520,16 +1651,14 @@ class HammingDiversityLogitsProcessor(LogitsProcessor):
         if group_start_idx == 0:
             return scores
 
-        scores_processed = scores.clone()
-        for batch_idx in range(batch_size):
-            # predicted tokens of last time step of previous groups
-            previous_group_tokens = current_tokens[
-                batch_idx * self._num_beams : batch_idx * self._num_beams + group_start_idx
-            ]
-            token_frequency = torch.bincount(previous_group_tokens, minlength=vocab_size).to(scores.device)
-            scores_processed[batch_idx * group_size : (batch_idx + 1) * group_size] -= (
-                self._diversity_penalty * token_frequency
-            )
+        # predicted tokens of last time step of previous groups, counted per batch item with a batched bincount
+        previous_group_tokens = current_tokens.view(batch_size, self._num_beams)[:, :group_start_idx].to(scores.device)
+        token_frequency = torch.zeros((batch_size, vocab_size), dtype=scores.dtype, device=scores.device)
+        token_frequency.scatter_add_(
+            1, previous_group_tokens, torch.ones_like(previous_group_tokens, dtype=scores.dtype)
+        )
+        token_frequency = token_frequency.repeat_interleave(group_size, dim=0)
+        scores_processed = scores - self._diversity_penalty * token_frequency
 
         return scores_processed
 
@@ -13,6 +13,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import contextlib
 import copy
 import inspect
 import os
@@ -58,8 +59,7 @@ from ..utils import (
     is_torchdynamo_exporting,
     logging,
 )
-from .beam_constraints import DisjunctiveConstraint, PhrasalConstraint
-from .beam_search import BeamScorer, BeamSearchScorer, ConstrainedBeamSearchScorer
+from .beam_constraints import Constraint, ConstraintAutomaton, DisjunctiveConstraint, PhrasalConstraint
 from .candidate_generator import (
     AssistantVocabTranslatorCache,
     AssistedCandidateGenerator,
@@ -71,6 +71,7 @@ from .candidate_generator import (
     _crop_past_key_values,
     _prepare_attention_mask,
     _prepare_token_type_ids,
+    _PruneReindexingLMHead,
 )
 from .configuration_utils import (
     NEED_SETUP_CACHE_CLASSES_MAPPING,
@@ -91,6 +92,7 @@ from .logits_process import (
     HammingDiversityLogitsProcessor,
     InfNanRemoveLogitsProcessor,
     LogitNormalization,
+    LogitsProcessor,
     LogitsProcessorList,
     MinLengthLogitsProcessor,
     MinNewTokensLengthLogitsProcessor,
@@ -100,6 +102,8 @@ from .logits_process import (
     PrefixConstrainedLogitsProcessor,
     RepetitionPenaltyLogitsProcessor,
     SequenceBiasLogitsProcessor,
+    SortFreeMinPLogitsWarper,
+    SortFreeTopPLogitsWarper,
     SuppressTokensAtBeginLogitsProcessor,
     SuppressTokensLogitsProcessor,
     TemperatureLogitsWarper,
@@ -166,6 +170,15 @@ class GenerateDecoderOnlyOutput(ModelOutput):
         past_key_values (`tuple(tuple(torch.FloatTensor)))`, *optional*, returned when `use_cache=True`):
             Returns the model cache, used to speed up decoding. Different models have a different cache format, check
             the model's documentation. Usually, a [`~cache_utils.Cache`] instance.
+        logprobs (`torch.FloatTensor` of shape `(batch_size, generated_length)`, *optional*, returned when `output_logprobs=True`):
+            Log-probabilities of the generated tokens, i.e. the processed prediction scores normalized with a log
+            softmax and gathered at the generated tokens, as `compute_transition_scores(sequences, scores,
+            normalize_logits=True)` would compute them without keeping the scores. Set to 0 for the padding added
+            after a sequence is finished.
+        top_logprobs (`torch.FloatTensor` of shape `(batch_size, generated_length, num_top_logprobs)`, *optional*, returned when `output_logprobs=True` and `num_top_logprobs>0`):
+            Log-probabilities of the `num_top_logprobs` most likely tokens at each generation step.
+        top_logprobs_ids (`torch.LongTensor` of shape `(batch_size, generated_length, num_top_logprobs)`, *optional*, returned when `output_logprobs=True` and `num_top_logprobs>0`):
+            Ids of the `num_top_logprobs` most likely tokens at each generation step.
     """
 
     sequences: torch.LongTensor
@@ -174,6 +187,9 @@ class GenerateDecoderOnlyOutput(ModelOutput):
     attentions: Optional[tuple[tuple[torch.FloatTensor]]] = None
     hidden_states: Optional[tuple[tuple[torch.FloatTensor]]] = None
     past_key_values: Optional[tuple[tuple[tuple[torch.FloatTensor]]]] = None
+    logprobs: Optional[torch.FloatTensor] = None
+    top_logprobs: Optional[torch.FloatTensor] = None
+    top_logprobs_ids: Optional[torch.LongTensor] = None
 
 
 @dataclass
@@ -211,6 +227,15 @@ class GenerateEncoderDecoderOutput(ModelOutput):
         past_key_values (`tuple(tuple(torch.FloatTensor)))`, *optional*, returned when `use_cache=True` is passed or when `config.use_cache=True`):
             Returns the model cache, used to speed up decoding. Different models have a different cache format, check
             the model's documentation. Usually, a [`~cache_utils.Cache`] instance.
+        logprobs (`torch.FloatTensor` of shape `(batch_size, generated_length)`, *optional*, returned when `output_logprobs=True`):
+            Log-probabilities of the generated tokens, i.e. the processed prediction scores normalized with a log
+            softmax and gathered at the generated tokens, as `compute_transition_scores(sequences, scores,
+            normalize_logits=True)` would compute them without keeping the scores. Set to 0 for the padding added
+            after a sequence is finished.
+        top_logprobs (`torch.FloatTensor` of shape `(batch_size, generated_length, num_top_logprobs)`, *optional*, returned when `output_logprobs=True` and `num_top_logprobs>0`):
+            Log-probabilities of the `num_top_logprobs` most likely tokens at each generation step.
+        top_logprobs_ids (`torch.LongTensor` of shape `(batch_size, generated_length, num_top_logprobs)`, *optional*, returned when `output_logprobs=True` and `num_top_logprobs>0`):
+            Ids of the `num_top_logprobs` most likely tokens at each generation step.
     """
 
     sequences: torch.LongTensor
@@ -222,6 +247,9 @@ class GenerateEncoderDecoderOutput(ModelOutput):
     cross_attentions: Optional[tuple[tuple[torch.FloatTensor]]] = None
     decoder_hidden_states: Optional[tuple[tuple[torch.FloatTensor]]] = None
     past_key_values: Optional[tuple[tuple[tuple[torch.FloatTensor]]]] = None
+    logprobs: Optional[torch.FloatTensor] = None
+    top_logprobs: Optional[torch.FloatTensor] = None
+    top_logprobs_ids: Optional[torch.LongTensor] = None
 
 
 @dataclass
@@ -1285,14 +1313,18 @@ class GenerationMixin(ContinuousMixin):
                 processors.append(
                     TopKLogitsWarper(top_k=generation_config.top_k, min_tokens_to_keep=min_tokens_to_keep)
                 )
+            if generation_config.sort_free_sampling:
+                top_p_warper_class, min_p_warper_class = SortFreeTopPLogitsWarper, SortFreeMinPLogitsWarper
+            else:
+                top_p_warper_class, min_p_warper_class = TopPLogitsWarper, MinPLogitsWarper
             if generation_config.top_p is not None and generation_config.top_p < 1.0:
                 processors.append(
-                    TopPLogitsWarper(top_p=generation_config.top_p, min_tokens_to_keep=min_tokens_to_keep)
+                    top_p_warper_class(top_p=generation_config.top_p, min_tokens_to_keep=min_tokens_to_keep)
                 )
             if generation_config.min_p is not None:
                 # Applied after temperature scaling (see https://github.com/ggerganov/llama.cpp/pull/3841#issuecomment-2073826084)
                 processors.append(
-                    MinPLogitsWarper(min_p=generation_config.min_p, min_tokens_to_keep=min_tokens_to_keep)
+                    min_p_warper_class(min_p=generation_config.min_p, min_tokens_to_keep=min_tokens_to_keep)
                 )
             if generation_config.typical_p is not None and generation_config.typical_p < 1.0:
                 processors.append(
@@ -1488,36 +1520,29 @@ class GenerationMixin(ContinuousMixin):
             beam_indices = torch.arange(scores[0].shape[0]).view(-1, 1).to(sequences.device)
             beam_indices = beam_indices.expand(-1, len(scores))
 
-        # 2. reshape scores as [batch_size*vocab_size, # generation steps] with # generation steps being
-        # seq_len - input_length
-        scores = torch.stack(scores).reshape(len(scores), -1).transpose(0, 1)
-
-        # 3. Optionally normalize the logits (across the vocab dimension)
-        if normalize_logits:
-            scores = scores.reshape(-1, self.config.get_text_config().vocab_size, scores.shape[-1])
-            scores = torch.nn.functional.log_softmax(scores, dim=1)
-            scores = scores.reshape(-1, scores.shape[-1])
-
-        # 4. cut beam_indices to longest beam length
+        # 2. cut beam_indices to longest beam length
         beam_indices_mask = beam_indices < 0
-        max_beam_length = (1 - beam_indices_mask.long()).sum(-1).max()
+        max_beam_length = int((1 - beam_indices_mask.long()).sum(-1).max())
         beam_indices = beam_indices.clone()[:, :max_beam_length]
         beam_indices_mask = beam_indices_mask[:, :max_beam_length]
 
-        # 5. Set indices of beams that finished early to 0; such indices will be masked correctly afterwards
+        # 3. Set indices of beams that finished early to 0; such indices will be masked correctly afterwards
         beam_indices[beam_indices_mask] = 0
 
-        # 6. multiply beam_indices with vocab size to gather correctly from scores
-        beam_sequence_indices = beam_indices * self.config.get_text_config().vocab_size
-
-        # 7. Define which indices contributed to scores
+        # 4. Gather the scores of the generated tokens one step at a time, rather than stacking the scores of all
+        # steps into a `(# generation steps, batch_size*num_beams, vocab_size)` tensor
         cut_idx = sequences.shape[-1] - max_beam_length
-        indices = sequences[:, cut_idx:] + beam_sequence_indices
-
-        # 8. Compute scores
-        transition_scores = scores.gather(0, indices)
-
-        # 9. Mask out transition_scores of beams that stopped early
+        transition_scores = torch.zeros(beam_indices.shape, dtype=scores[0].dtype, device=sequences.device)
+        for step in range(max_beam_length):
+            step_scores = scores[step].to(sequences.device)
+            step_beam_indices = beam_indices[:, step]
+            transition_scores[:, step] = step_scores[step_beam_indices, sequences[:, cut_idx + step]]
+            # 5. Optionally normalize the logits (across the vocab dimension), which only needs the normalizer of
+            # each row
+            if normalize_logits:
+                transition_scores[:, step] -= torch.logsumexp(step_scores, dim=-1)[step_beam_indices]
+
+        # 6. Mask out transition_scores of beams that stopped early
         transition_scores[beam_indices_mask] = 0
 
         return transition_scores
@@ -2490,6 +2515,24 @@ class GenerationMixin(ContinuousMixin):
             raise ValueError(
                 "`streamer` cannot be used with beam search (yet!). Make sure that `num_beams` is set to 1."
             )
+        if generation_config.output_logprobs and generation_mode not in (
+            GenerationMode.GREEDY_SEARCH,
+            GenerationMode.SAMPLE,
+        ):
+            raise ValueError(
+                "`output_logprobs` is only supported by greedy search and sampling, but the generation mode is "
+                f"{generation_mode}. Use `output_scores=True` and `compute_transition_scores` instead."
+            )
+        if generation_config.allowed_token_ids is not None and generation_mode not in (
+            GenerationMode.GREEDY_SEARCH,
+            GenerationMode.SAMPLE,
+            GenerationMode.BEAM_SEARCH,
+            GenerationMode.BEAM_SAMPLE,
+        ):
+            raise ValueError(
+                "`allowed_token_ids` is only supported by greedy search, sampling and beam search, but the generation "
+                f"mode is {generation_mode}."
+            )
 
         if self.device.type != input_ids.device.type:
             warnings.warn(
@@ -2517,6 +2560,11 @@ class GenerationMixin(ContinuousMixin):
         prepared_stopping_criteria = self._get_stopping_criteria(
             generation_config=generation_config, stopping_criteria=stopping_criteria, tokenizer=tokenizer, **kwargs
         )
+        pruned_vocabulary_processor = self._get_pruned_vocabulary_processor(
+            generation_config, prepared_logits_processor, device=inputs_tensor.device
+        )
+        if pruned_vocabulary_processor is not None:
+            prepared_logits_processor = LogitsProcessorList([pruned_vocabulary_processor])
 
         # Set model_kwargs `use_cache` so we can use it later in forward runs
         model_kwargs["use_cache"] = generation_config.use_cache
@@ -2620,15 +2668,16 @@ class GenerationMixin(ContinuousMixin):
             )
 
             # 12. run sample (it degenerates to greedy search when `generation_config.do_sample=False`)
-            result = self._sample(
-                input_ids,
-                logits_processor=prepared_logits_processor,
-                stopping_criteria=prepared_stopping_criteria,
-                generation_config=generation_config,
-                synced_gpus=synced_gpus,
-                streamer=streamer,
-                **model_kwargs,
-            )
+            with self._prune_output_vocabulary(generation_config._allowed_token_ids_tensor):
+                result = self._sample(
+                    input_ids,
+                    logits_processor=prepared_logits_processor,
+                    stopping_criteria=prepared_stopping_criteria,
+                    generation_config=generation_config,
+                    synced_gpus=synced_gpus,
+                    streamer=streamer,
+                    **model_kwargs,
+                )
 
         elif generation_mode in (GenerationMode.BEAM_SAMPLE, GenerationMode.BEAM_SEARCH):
             # 11. interleave input_ids with `num_beams` additional sequences per batch
@@ -2639,42 +2688,31 @@ class GenerationMixin(ContinuousMixin):
                 **model_kwargs,
             )
             # 12. run beam sample
-            result = self._beam_search(
-                input_ids,
-                logits_processor=prepared_logits_processor,
-                stopping_criteria=prepared_stopping_criteria,
-                generation_config=generation_config,
-                synced_gpus=synced_gpus,
-                **model_kwargs,
-            )
+            with self._prune_output_vocabulary(generation_config._allowed_token_ids_tensor):
+                result = self._beam_search(
+                    input_ids,
+                    logits_processor=prepared_logits_processor,
+                    stopping_criteria=prepared_stopping_criteria,
+                    generation_config=generation_config,
+                    synced_gpus=synced_gpus,
+                    **model_kwargs,
+                )
 
         elif generation_mode == GenerationMode.GROUP_BEAM_SEARCH:
             logger.warning_once(
                 "Group Beam Search is scheduled to be moved to a `custom_generate` repository in v4.55.0. "
                 "To prevent loss of backward compatibility, add `trust_remote_code=True` to your `generate` call."
             )
-            # 11. prepare beam search scorer
-            beam_scorer = BeamSearchScorer(
-                batch_size=batch_size,
-                num_beams=generation_config.num_beams,
-                device=inputs_tensor.device,
-                length_penalty=generation_config.length_penalty,
-                do_early_stopping=generation_config.early_stopping,
-                num_beam_hyps_to_keep=generation_config.num_return_sequences,
-                num_beam_groups=generation_config.num_beam_groups,
-                max_length=generation_config.max_length,
-            )
-            # 12. interleave input_ids with `num_beams` additional sequences per batch
+            # 11. interleave input_ids with `num_beams` additional sequences per batch
             input_ids, model_kwargs = self._expand_inputs_for_generation(
                 input_ids=input_ids,
                 expand_size=generation_config.num_beams,
                 is_encoder_decoder=self.config.is_encoder_decoder,
                 **model_kwargs,
             )
-            # 13. run beam search
+            # 12. run group beam search
             result = self._group_beam_search(
                 input_ids,
-                beam_scorer,
                 logits_processor=prepared_logits_processor,
                 stopping_criteria=prepared_stopping_criteria,
                 generation_config=generation_config,
@@ -2727,28 +2765,17 @@ class GenerationMixin(ContinuousMixin):
                         constraint = PhrasalConstraint(word_ids)
                     final_constraints.append(constraint)
 
-            # 11. prepare beam search scorer
-            constrained_beam_scorer = ConstrainedBeamSearchScorer(
-                constraints=final_constraints,
-                batch_size=batch_size,
-                num_beams=generation_config.num_beams,
-                device=inputs_tensor.device,
-                length_penalty=generation_config.length_penalty,
-                do_early_stopping=generation_config.early_stopping,
-                num_beam_hyps_to_keep=generation_config.num_return_sequences,
-                max_length=generation_config.max_length,
-            )
-            # 12. interleave input_ids with `num_beams` additional sequences per batch
+            # 11. interleave input_ids with `num_beams` additional sequences per batch
             input_ids, model_kwargs = self._expand_inputs_for_generation(
                 input_ids=input_ids,
                 expand_size=generation_config.num_beams,
                 is_encoder_decoder=self.config.is_encoder_decoder,
                 **model_kwargs,
             )
-            # 13. run beam search
+            # 12. run constrained beam search
             result = self._constrained_beam_search(
                 input_ids,
-                constrained_beam_scorer=constrained_beam_scorer,
+                constraints=final_constraints,
                 logits_processor=prepared_logits_processor,
                 stopping_criteria=prepared_stopping_criteria,
                 generation_config=generation_config,
@@ -2756,6 +2783,12 @@ class GenerationMixin(ContinuousMixin):
                 **model_kwargs,
             )
 
+        # Scores and logits were computed over the allowed tokens only, return them over the full vocabulary
+        if pruned_vocabulary_processor is not None and isinstance(result, ModelOutput):
+            for key in ("scores", "logits"):
+                if getattr(result, key, None) is not None:
+                    setattr(result, key, tuple(pruned_vocabulary_processor.to_full_vocabulary(x) for x in result[key]))
+
         # Convert to legacy cache format if requested
         if (
             generation_config.return_legacy_cache is True
@@ -2765,6 +2798,59 @@ class GenerationMixin(ContinuousMixin):
             result.past_key_values = result.past_key_values.to_legacy_cache()
         return result
 
+    def _get_pruned_vocabulary_processor(
+        self, generation_config: GenerationConfig, logits_processor: LogitsProcessorList, device: torch.device
+    ) -> Optional["_PrunedVocabularyLogitsProcessor"]:
+        """
+        Prepares the output vocabulary pruning requested with `generation_config.allowed_token_ids`: stores the sorted
+        allowed token ids in `generation_config._allowed_token_ids_tensor`, and returns `logits_processor` wrapped so
+        that it runs on the pruned scores. Returns `None` when the vocabulary is not restricted.
+        """
+        generation_config._allowed_token_ids_tensor = None
+        if generation_config.allowed_token_ids is None:
+            return None
+
+        output_embeddings = self.get_output_embeddings()
+        if not isinstance(output_embeddings, nn.Linear) or not hasattr(self, "set_output_embeddings"):
+            raise ValueError(
+                f"`allowed_token_ids` requires a model whose output embeddings are a `nn.Linear` layer that can be "
+                f"replaced with `set_output_embeddings`, which is not the case of {self.__class__.__name__}."
+            )
+        vocab_size = output_embeddings.out_features
+        allowed_token_ids = sorted(set(generation_config.allowed_token_ids))
+        if allowed_token_ids[-1] >= vocab_size:
+            raise ValueError(
+                f"`allowed_token_ids` contains the token id {allowed_token_ids[-1]}, which is out of the model's "
+                f"vocabulary (size {vocab_size})."
+            )
+        generation_config._allowed_token_ids_tensor = torch.tensor(allowed_token_ids, dtype=torch.long, device=device)
+        return _PrunedVocabularyLogitsProcessor(
+            logits_processor, generation_config._allowed_token_ids_tensor, vocab_size=vocab_size
+        )
+
+    @contextlib.contextmanager
+    def _prune_output_vocabulary(self, token_ids: Optional[torch.LongTensor]):
+        """
+        Temporarily replaces the LM head with one that only computes the logits of `token_ids`. Does nothing if
+        `token_ids` is `None`.
+        """
+        if token_ids is None:
+            yield
+            return
+
+        output_embeddings = self.get_output_embeddings()
+        self.set_output_embeddings(_PruneReindexingLMHead(output_embeddings, token_ids))
+        # Some seq2seq models (e.g. BART, Marian) add a bias over the whole vocabulary to the LM head output
+        final_logits_bias = getattr(self, "final_logits_bias", None)
+        if final_logits_bias is not None:
+            self.final_logits_bias = final_logits_bias[..., token_ids.to(final_logits_bias.device)]
+        try:
+            yield
+        finally:
+            self.set_output_embeddings(output_embeddings)
+            if final_logits_bias is not None:
+                self.final_logits_bias = final_logits_bias
+
     def _has_unfinished_sequences(self, this_peer_finished: bool, synced_gpus: bool, device: torch.device) -> bool:
         """
         Returns whether there are still unfinished sequences in the device. The existence of unfinished sequences is
@@ -3543,9 +3629,15 @@ class GenerationMixin(ContinuousMixin):
         output_hidden_states = generation_config.output_hidden_states
         output_scores = generation_config.output_scores
         output_logits = generation_config.output_logits
+        output_logprobs = generation_config.output_logprobs
+        num_top_logprobs = generation_config.num_top_logprobs
         return_dict_in_generate = generation_config.return_dict_in_generate
         has_eos_stopping_criteria = any(hasattr(criteria, "eos_token_id") for criteria in stopping_criteria)
         do_sample = generation_config.do_sample
+        # with `allowed_token_ids`, the model outputs and the processed scores only cover these tokens
+        allowed_token_ids = getattr(generation_config, "_allowed_token_ids_tensor", None)
+        if allowed_token_ids is not None:
+            num_top_logprobs = min(num_top_logprobs, allowed_token_ids.shape[0])
 
         # init attention / hidden states / scores tuples
         scores = () if (return_dict_in_generate and output_scores) else None
@@ -3567,6 +3659,21 @@ class GenerationMixin(ContinuousMixin):
         unfinished_sequences = torch.ones(batch_size, dtype=torch.long, device=input_ids.device)
         model_kwargs = self._get_initial_cache_position(cur_len, input_ids.device, model_kwargs)
 
+        # the log-probabilities of the generated tokens (and of the top alternatives) are written in place, one column
+        # per generation step, into buffers sized for the longest possible generation
+        token_logprobs = top_logprobs = top_logprobs_ids = None
+        if return_dict_in_generate and output_logprobs:
+            prompt_len = cur_len
+            max_new_tokens = generation_config.max_length - prompt_len
+            token_logprobs = torch.zeros((batch_size, max_new_tokens), dtype=torch.float32, device=input_ids.device)
+            if num_top_logprobs > 0:
+                top_logprobs = torch.zeros(
+                    (batch_size, max_new_tokens, num_top_logprobs), dtype=torch.float32, device=input_ids.device
+                )
+                top_logprobs_ids = torch.zeros(
+                    (batch_size, max_new_tokens, num_top_logprobs), dtype=torch.long, device=input_ids.device
+                )
+
         model_forward = self.__call__
         compile_forward = self._valid_auto_compile_criteria(model_kwargs, generation_config)
         if compile_forward:
@@ -3650,6 +3757,21 @@ class GenerationMixin(ContinuousMixin):
             else:
                 next_tokens = torch.argmax(next_token_scores, dim=-1)
 
+            if token_logprobs is not None:
+                next_token_logprobs = nn.functional.log_softmax(next_token_scores, dim=-1)
+                step = cur_len - prompt_len
+                token_logprobs[:, step] = next_token_logprobs.gather(-1, next_tokens[:, None]).squeeze(-1)
+                token_logprobs[:, step] *= unfinished_sequences
+                if top_logprobs is not None:
+                    top_logprobs[:, step], top_logprobs_ids[:, step] = torch.topk(
+                        next_token_logprobs, num_top_logprobs
+                    )
+                    if allowed_token_ids is not None:
+                        top_logprobs_ids[:, step] = allowed_token_ids[top_logprobs_ids[:, step]]
+
+            if allowed_token_ids is not None:
+                next_tokens = allowed_token_ids[next_tokens]
+
             # finished sentences should have their next token be a padding token
             if has_eos_stopping_criteria:
                 next_tokens = next_tokens * unfinished_sequences + pad_token_id * (1 - unfinished_sequences)
@@ -3670,6 +3792,13 @@ class GenerationMixin(ContinuousMixin):
         if streamer is not None:
             streamer.end()
 
+        # crop the log-probability buffers to the number of generated tokens
+        if token_logprobs is not None:
+            token_logprobs = token_logprobs[:, : cur_len - prompt_len]
+            if top_logprobs is not None:
+                top_logprobs = top_logprobs[:, : cur_len - prompt_len]
+                top_logprobs_ids = top_logprobs_ids[:, : cur_len - prompt_len]
+
         if return_dict_in_generate:
             if self.config.is_encoder_decoder:
                 return GenerateEncoderDecoderOutput(
@@ -3682,6 +3811,9 @@ class GenerationMixin(ContinuousMixin):
                     cross_attentions=cross_attentions,
                     decoder_hidden_states=decoder_hidden_states,
                     past_key_values=model_kwargs.get("past_key_values"),
+                    logprobs=token_logprobs,
+                    top_logprobs=top_logprobs,
+                    top_logprobs_ids=top_logprobs_ids,
                 )
             else:
                 return GenerateDecoderOnlyOutput(
@@ -3691,6 +3823,9 @@ class GenerationMixin(ContinuousMixin):
                     attentions=decoder_attentions,
                     hidden_states=decoder_hidden_states,
                     past_key_values=model_kwargs.get("past_key_values"),
+                    logprobs=token_logprobs,
+                    top_logprobs=top_logprobs,
+                    top_logprobs_ids=top_logprobs_ids,
                 )
         else:
             return input_ids
@@ -3806,6 +3941,7 @@ class GenerationMixin(ContinuousMixin):
         num_beams: int,
         vocab_size: int,
         batch_size: int,
+        vocab_token_ids: Optional[torch.Tensor] = None,
     ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
         """
         Get top-K continuations given the accumulated log probs on the next token.
@@ -3837,6 +3973,9 @@ class GenerationMixin(ContinuousMixin):
         topk_running_beam_indices = self._gather_beams(running_beam_indices, topk_current_beam_indices)
         topk_running_sequences = self._gather_beams(running_sequences, topk_current_beam_indices)
         topk_ids = topk_indices % vocab_size
+        # The log probs may cover a subset of the vocabulary only, see `allowed_token_ids`
+        if vocab_token_ids is not None:
+            topk_ids = vocab_token_ids[topk_ids]
 
         # Update sequences for the K top-k new sequences.
         topk_running_sequences[:, :, cur_len] = topk_ids
@@ -3990,6 +4129,10 @@ class GenerationMixin(ContinuousMixin):
             vocab_size = self.get_output_embeddings().out_features
         else:
             vocab_size = self.config.get_text_config().vocab_size
+        # with `allowed_token_ids`, the model outputs and the processed scores only cover these tokens
+        allowed_token_ids = getattr(generation_config, "_allowed_token_ids_tensor", None)
+        if allowed_token_ids is not None:
+            vocab_size = allowed_token_ids.shape[0]
         decoder_prompt_len = cur_len
         this_peer_finished = False
 
@@ -4137,6 +4280,7 @@ class GenerationMixin(ContinuousMixin):
                 num_beams=num_beams,
                 vocab_size=vocab_size,
                 batch_size=batch_size,
+                vocab_token_ids=allowed_token_ids,
             )
 
             # d. Check which running sequences have finished
@@ -4248,23 +4392,25 @@ class GenerationMixin(ContinuousMixin):
     def _group_beam_search(
         self,
         input_ids: torch.LongTensor,
-        beam_scorer: BeamScorer,
         logits_processor: LogitsProcessorList,
         stopping_criteria: StoppingCriteriaList,
         generation_config: GenerationConfig,
         synced_gpus: bool,
         **model_kwargs,
-    ):
+    ) -> Union[GenerateBeamOutput, torch.LongTensor]:
         r"""
         Generates sequences of token ids for models with a language modeling head using **diverse beam search
         decoding** and can be used for text-decoder, text-to-text, speech-to-text, and vision-to-text models.
 
+        The beams are split in `num_beam_groups` groups, and each group is an independent beam search over
+        `num_beams // num_beam_groups` beams. Groups are processed one after the other at each step, so that the
+        logits processors (e.g. [`HammingDiversityLogitsProcessor`]) can penalize the tokens selected by the previous
+        groups. Within a group, all batch items are processed at once with the same static-shaped tensors as
+        [`~generation.GenerationMixin._beam_search`].
+
         Parameters:
             input_ids (`torch.LongTensor` of shape `(batch_size*num_beams, sequence_length)`):
                 The sequence used as a prompt for the generation.
-            beam_scorer (`BeamScorer`):
-                An derived instance of [`BeamScorer`] that defines how beam hypotheses are constructed, stored and
-                sorted during generation. For more information, the documentation of [`BeamScorer`] should be read.
             logits_processor (`LogitsProcessorList`):
                 An instance of [`LogitsProcessorList`]. List of instances of class derived from [`LogitsProcessor`]
                 used to modify the prediction scores of the language modeling head applied at each generation step.
@@ -4287,7 +4433,7 @@ class GenerationMixin(ContinuousMixin):
             `return_dict_in_generate=True` or a [`~generation.GenerateBeamEncoderDecoderOutput`] if
             `model.config.is_encoder_decoder=True`.
         """
-        # init values
+        # 1. init group beam search values
         pad_token_id = generation_config._pad_token_tensor
         eos_token_id = generation_config._eos_token_tensor
         output_attentions = generation_config.output_attentions
@@ -4295,28 +4441,35 @@ class GenerationMixin(ContinuousMixin):
         output_scores = generation_config.output_scores
         output_logits = generation_config.output_logits
         return_dict_in_generate = generation_config.return_dict_in_generate
-
-        num_beams = beam_scorer.num_beams
-        num_beam_groups = beam_scorer.num_beam_groups
+        early_stopping = generation_config.early_stopping
+        length_penalty = generation_config.length_penalty
+        max_length = generation_config.max_length
+        num_beams = generation_config.num_beams
+        num_beam_groups = generation_config.num_beam_groups
         num_sub_beams = num_beams // num_beam_groups
-        batch_size = len(beam_scorer._beam_hyps) // num_beam_groups
-        device = input_ids.device
+        num_return_sequences = generation_config.num_return_sequences
 
-        batch_beam_size, cur_len = input_ids.shape
-        model_kwargs = self._get_initial_cache_position(cur_len, input_ids.device, model_kwargs)
+        batch_size_unflattened, cur_len = input_ids.shape[:2]
+        batch_size = batch_size_unflattened // num_beams
+        decoder_prompt_len = cur_len
+        this_peer_finished = False
 
-        if return_dict_in_generate and output_scores:
-            beam_indices = [tuple(() for _ in range(num_sub_beams * batch_size)) for _ in range(num_beam_groups)]
-        else:
-            beam_indices = None
+        # Each group keeps the top K [K = (number of EOS tokens + 1) * `num_sub_beams`] candidates, so that at least
+        # `num_sub_beams` non-finished sequences remain in the group (see `_beam_search`)
+        n_eos_tokens = eos_token_id.shape[0] if eos_token_id is not None else 0
+        beams_to_keep = max(2, 1 + n_eos_tokens) * num_sub_beams
+        top_num_beam_mask = torch.cat(
+            (
+                torch.ones((num_sub_beams), dtype=torch.bool),
+                torch.zeros((beams_to_keep - num_sub_beams), dtype=torch.bool),
+            ),
+            dim=0,
+        ).to(input_ids.device)
 
-        if num_beams * batch_size != batch_beam_size:
-            raise ValueError(
-                f"Batch dimension of `input_ids` should be {num_beams * batch_size}, but is {batch_beam_size}."
-            )
+        model_kwargs = self._get_initial_cache_position(cur_len, input_ids.device, model_kwargs)
 
-        # init attention / hidden states / scores tuples
-        scores = () if (return_dict_in_generate and output_scores) else None
+        # 2. init output tuples
+        all_scores = () if (return_dict_in_generate and output_scores) else None
         raw_logits = () if (return_dict_in_generate and output_logits) else None
         decoder_attentions = () if (return_dict_in_generate and output_attentions) else None
         cross_attentions = () if (return_dict_in_generate and output_attentions) else None
@@ -4329,34 +4482,54 @@ class GenerationMixin(ContinuousMixin):
                 model_kwargs["encoder_outputs"].get("hidden_states") if output_hidden_states else None
             )
 
+        # 3. init running tensors and static-shaped placeholders. They hold all groups, the beams of group `g` are
+        # `[:, g * num_sub_beams : (g + 1) * num_sub_beams]`.
+        output_fill_value = pad_token_id or eos_token_id[0] if eos_token_id is not None else -1
+        running_sequences = torch.full(
+            (batch_size, num_beams, max_length),
+            fill_value=output_fill_value,
+            dtype=torch.int64,
+            device=input_ids.device,
+        )
+        running_sequences[:, :, :cur_len] = self._unflatten_beam_dim(input_ids, batch_size, num_beams)
+        sequences = running_sequences.detach().clone()
+
         # initialise score of first beam of each group with 0 and the rest with -1e9. This ensures that the beams in
         # the same group don't produce same tokens every time.
-        beam_scores = torch.full((batch_size, num_beams), -1e9, dtype=torch.float, device=device)
-        beam_scores[:, ::num_sub_beams] = 0
-        beam_scores = beam_scores.view((batch_size * num_beams,))
+        running_beam_scores = torch.full((batch_size, num_beams), -1e9, dtype=torch.float, device=input_ids.device)
+        running_beam_scores[:, ::num_sub_beams] = 0
+        beam_scores = torch.full((batch_size, num_beams), fill_value=-1e9, dtype=torch.float, device=input_ids.device)
+        is_sent_finished = torch.zeros((batch_size, num_beams), dtype=torch.bool, device=input_ids.device)
+        next_token_hits_stopping_criteria = torch.zeros(
+            (batch_size, num_beam_groups, beams_to_keep), dtype=torch.bool, device=input_ids.device
+        )
+        running_beam_indices = torch.full(
+            (batch_size, num_beams, max_length - cur_len), fill_value=-1, dtype=torch.int32, device=input_ids.device
+        )
+        beam_indices = running_beam_indices.detach().clone()
 
-        this_peer_finished = False
+        # `_get_top_k_continuations` numbers the beams of a group as `batch_idx * num_sub_beams + beam_idx`, these are
+        # the offsets to convert them to `batch_idx * num_beams + group_start_idx + beam_idx`, the index of the beam
+        # in the flattened batch
+        group_batch_offsets = torch.arange(batch_size, device=input_ids.device).view(-1, 1) * (
+            num_beams - num_sub_beams
+        )
 
-        decoder_prompt_len = input_ids.shape[1]  # record the prompt length of decoder
+        # 4. run the generation loop
         while self._has_unfinished_sequences(this_peer_finished, synced_gpus, device=input_ids.device):
-            # predicted tokens in cur_len step
-            current_tokens = torch.zeros(batch_size * num_beams, dtype=input_ids.dtype, device=device)
-
-            # indices which will form the beams in the next time step
-            reordering_indices = torch.zeros(batch_size * num_beams, dtype=torch.long, device=device)
-
-            # do one decoder step on all beams of all sentences in batch
-            model_inputs = self.prepare_inputs_for_generation(input_ids, **model_kwargs)
+            # a. Forward current tokens of all groups at once, obtain the logits
+            flat_running_sequences = self._flatten_beam_dim(running_sequences[:, :, :cur_len])
+            model_inputs = self.prepare_inputs_for_generation(flat_running_sequences, **model_kwargs)
 
             # prepare variable output controls (note: some models won't accept all output controls)
             model_inputs.update({"output_attentions": output_attentions} if output_attentions else {})
             model_inputs.update({"output_hidden_states": output_hidden_states} if output_hidden_states else {})
 
-            outputs = self(**model_inputs, return_dict=True)
+            model_outputs = self(**model_inputs, return_dict=True)
 
             # synced_gpus: don't waste resources running the code we don't need; kwargs must be updated before skipping
             model_kwargs = self._update_model_kwargs_for_generation(
-                outputs,
+                model_outputs,
                 model_kwargs,
                 is_encoder_decoder=self.config.is_encoder_decoder,
             )
@@ -4364,157 +4537,172 @@ class GenerationMixin(ContinuousMixin):
                 cur_len = cur_len + 1
                 continue
 
-            if output_scores:
-                processed_score = torch.zeros_like(outputs.logits[:, -1, :])
-            if output_logits:
-                # Copy is needed to avoid keeping a hanging ref to outputs.logits which may be very large for first iteration
-                # (the clone itself is always small)
-                raw_logit_score = outputs.logits[:, -1, :].to(copy=True, device=input_ids.device)
-
-            for beam_group_idx in range(num_beam_groups):
-                group_start_idx = beam_group_idx * num_sub_beams
-                group_end_idx = min(group_start_idx + num_sub_beams, num_beams)
-                group_size = group_end_idx - group_start_idx
-
-                # indices of beams of current group among all sentences in batch
-                batch_group_indices = []
-
-                for batch_idx in range(batch_size):
-                    batch_group_indices.extend(
-                        [batch_idx * num_beams + idx for idx in range(group_start_idx, group_end_idx)]
-                    )
-                group_input_ids = input_ids[batch_group_indices]
-
-                # select outputs of beams of current group only
-                # No need to clone() the logits here as they will not retain outputs.logits at the end of the loop
-                # .float() is needed to retain precision for later logits manipulations
-                next_token_logits = outputs.logits[batch_group_indices, -1, :].to(
-                    dtype=torch.float32, device=input_ids.device
-                )
+            # Copy is needed to avoid keeping a hanging ref
+            logits = model_outputs.logits[:, -1, :].to(copy=True, dtype=torch.float32, device=input_ids.device)
+            log_probs = nn.functional.log_softmax(logits, dim=-1)
+            vocab_size = log_probs.shape[-1]
+            log_probs = self._unflatten_beam_dim(log_probs, batch_size, num_beams)
+            processed_log_probs = torch.zeros_like(log_probs) if output_scores else None
 
-                next_token_scores = nn.functional.log_softmax(
-                    next_token_logits, dim=-1
-                )  # (batch_size * group_size, vocab_size)
-                vocab_size = next_token_scores.shape[-1]
+            # tokens selected in this step by the groups processed so far, consumed by the diversity processors
+            current_tokens = torch.zeros((batch_size, num_beams), dtype=input_ids.dtype, device=input_ids.device)
 
-                next_token_scores_processed = logits_processor(
-                    group_input_ids, next_token_scores, current_tokens=current_tokens, beam_group_idx=beam_group_idx
+            # b. Run one beam search step per group
+            for beam_group_idx in range(num_beam_groups):
+                group = slice(beam_group_idx * num_sub_beams, (beam_group_idx + 1) * num_sub_beams)
+                group_running_sequences = running_sequences[:, group]
+
+                group_log_probs = logits_processor(
+                    self._flatten_beam_dim(group_running_sequences[:, :, :cur_len]),
+                    self._flatten_beam_dim(log_probs[:, group]),
+                    current_tokens=current_tokens.view(-1),
+                    beam_group_idx=beam_group_idx,
                 )
-                next_token_scores = next_token_scores_processed + beam_scores[batch_group_indices].unsqueeze(-1)
-                next_token_scores = next_token_scores.expand_as(next_token_scores_processed)
-
+                group_log_probs = self._unflatten_beam_dim(group_log_probs, batch_size, num_sub_beams)
                 if output_scores:
-                    processed_score[batch_group_indices] = next_token_scores_processed
-
-                # reshape for beam search
-                next_token_scores = next_token_scores.view(batch_size, group_size * vocab_size)
+                    processed_log_probs[:, group] = group_log_probs
 
-                # Sample 1 + len(eos_token_id) next tokens for each beam so we have at least 1 non eos token per beam.
-                n_eos_tokens = eos_token_id.shape[0] if eos_token_id is not None else 0
-                next_token_scores, next_tokens = torch.topk(
-                    next_token_scores, max(2, 1 + n_eos_tokens) * group_size, dim=1, largest=True, sorted=True
-                )
+                group_log_probs = group_log_probs + running_beam_scores[:, group, None]
+                group_log_probs = torch.reshape(group_log_probs, (batch_size, num_sub_beams * vocab_size))
 
-                next_indices = torch.div(next_tokens, vocab_size, rounding_mode="floor")
-                next_tokens = next_tokens % vocab_size
-
-                # stateless
-                process_beam_indices = sum(beam_indices, ()) if beam_indices is not None else None
-                beam_outputs = beam_scorer.process(
-                    group_input_ids,
-                    next_token_scores,
-                    next_tokens,
-                    next_indices,
-                    pad_token_id=pad_token_id,
-                    eos_token_id=eos_token_id,
-                    beam_indices=process_beam_indices,
-                    group_index=beam_group_idx,
+                # Retrieve top-K continuations within the group
+                topk_log_probs, topk_running_sequences, topk_running_beam_indices = self._get_top_k_continuations(
+                    accumulated_log_probs=group_log_probs,
+                    running_sequences=group_running_sequences,
+                    running_beam_indices=running_beam_indices[:, group],
+                    cur_len=cur_len,
                     decoder_prompt_len=decoder_prompt_len,
+                    do_sample=False,
+                    beams_to_keep=beams_to_keep,
+                    num_beams=num_sub_beams,
+                    vocab_size=vocab_size,
+                    batch_size=batch_size,
                 )
-                beam_scores[batch_group_indices] = beam_outputs["next_beam_scores"]
-                beam_next_tokens = beam_outputs["next_beam_tokens"]
-                beam_idx = beam_outputs["next_beam_indices"]
-
-                if return_dict_in_generate and output_scores:
-                    beam_indices[beam_group_idx] = tuple(
-                        beam_indices[beam_group_idx][beam_idx[i]] + (beam_idx[i],) for i in range(len(beam_indices[0]))
-                    )
+                topk_running_beam_indices[:, :, cur_len - decoder_prompt_len] += (
+                    group_batch_offsets + group.start
+                ).to(topk_running_beam_indices.dtype)
+
+                # Check which running sequences have finished
+                group_hits_stopping_criteria = stopping_criteria(
+                    self._flatten_beam_dim(topk_running_sequences[:, :, : cur_len + 1]),
+                    all_scores,
+                )
+                group_hits_stopping_criteria = self._unflatten_beam_dim(
+                    group_hits_stopping_criteria, batch_size, beams_to_keep
+                )
+                next_token_hits_stopping_criteria[:, beam_group_idx] = group_hits_stopping_criteria
 
-                input_ids[batch_group_indices] = group_input_ids[beam_idx]
-                group_input_ids = torch.cat([group_input_ids[beam_idx, :], beam_next_tokens.unsqueeze(-1)], dim=-1)
-                current_tokens[batch_group_indices] = group_input_ids[:, -1]
+                # Get the non-finished running sequences of the group for the next generation step
+                (
+                    running_sequences[:, group],
+                    running_beam_scores[:, group],
+                    running_beam_indices[:, group],
+                ) = self._get_running_beams_for_next_iteration(
+                    topk_log_probs=topk_log_probs,
+                    topk_running_sequences=topk_running_sequences,
+                    topk_running_beam_indices=topk_running_beam_indices,
+                    next_token_hits_stopping_criteria=group_hits_stopping_criteria,
+                    num_beams=num_sub_beams,
+                )
 
-                # (beam_idx // group_size) -> batch_idx
-                # (beam_idx % group_size) -> offset of idx inside the group
-                reordering_indices[batch_group_indices] = (
-                    num_beams * torch.div(beam_idx, group_size, rounding_mode="floor")
-                    + group_start_idx
-                    + (beam_idx % group_size)
+                # Update the completed beams of the group if a new high score in a finished sequence is found
+                (
+                    sequences[:, group],
+                    beam_scores[:, group],
+                    beam_indices[:, group],
+                    is_sent_finished[:, group],
+                ) = self._update_finished_beams(
+                    sequences=sequences[:, group],
+                    topk_running_sequences=topk_running_sequences,
+                    beam_scores=beam_scores[:, group],
+                    topk_log_probs=topk_log_probs,
+                    beam_indices=beam_indices[:, group],
+                    topk_running_beam_indices=topk_running_beam_indices,
+                    is_sent_finished=is_sent_finished[:, group],
+                    next_token_hits_stopping_criteria=group_hits_stopping_criteria,
+                    top_num_beam_mask=top_num_beam_mask,
+                    num_beams=num_sub_beams,
+                    cur_len=cur_len,
+                    decoder_prompt_len=decoder_prompt_len,
+                    length_penalty=length_penalty,
+                    early_stopping=early_stopping,
                 )
+                current_tokens[:, group] = running_sequences[:, group, cur_len]
 
             # Store scores, attentions and hidden_states when required
             if return_dict_in_generate:
                 if output_scores:
-                    scores += (processed_score,)
+                    all_scores += (self._flatten_beam_dim(processed_log_probs),)
                 if output_logits:
-                    raw_logits += (raw_logit_score,)
+                    raw_logits += (logits,)
                 if output_attentions:
                     decoder_attentions += (
-                        (outputs.decoder_attentions,) if self.config.is_encoder_decoder else (outputs.attentions,)
+                        (model_outputs.decoder_attentions,)
+                        if self.config.is_encoder_decoder
+                        else (model_outputs.attentions,)
                     )
                     if self.config.is_encoder_decoder:
-                        cross_attentions += (outputs.cross_attentions,)
+                        cross_attentions += (model_outputs.cross_attentions,)
 
                 if output_hidden_states:
                     decoder_hidden_states += (
-                        (outputs.decoder_hidden_states,)
+                        (model_outputs.decoder_hidden_states,)
                         if self.config.is_encoder_decoder
-                        else (outputs.hidden_states,)
+                        else (model_outputs.hidden_states,)
                     )
 
-            input_ids = torch.cat([input_ids, current_tokens.unsqueeze(-1)], dim=-1)
-
-            # This is needed to properly delete outputs.logits which may be very large for first iteration
+            # This is needed to properly delete logits which may be very large for first iteration
             # Otherwise a reference to outputs is kept which keeps the logits alive in the next iteration
-            # IMPORTANT: Note that this should appear BEFORE the call to _reorder_cache() to save the maximum memory
-            # (that way the memory peak does not include outputs.logits)
-            del outputs
+            del model_outputs
 
+            # c. Prepare remaining data for the next iteration. The cache of all groups is reordered at once.
             if model_kwargs.get("past_key_values", None) is not None:
                 model_kwargs["past_key_values"] = self._temporary_reorder_cache(
-                    model_kwargs["past_key_values"], reordering_indices
+                    past_key_values=model_kwargs["past_key_values"],
+                    beam_idx=self._flatten_beam_dim(running_beam_indices[..., cur_len - decoder_prompt_len]),
                 )
 
-            # increase cur_len
             cur_len = cur_len + 1
+            # the search goes on as long as one of the groups can still improve its finished beams
+            this_peer_finished = True
+            for beam_group_idx in range(num_beam_groups):
+                group = slice(beam_group_idx * num_sub_beams, (beam_group_idx + 1) * num_sub_beams)
+                this_peer_finished &= not self._beam_search_has_unfinished_sequences(
+                    running_beam_scores[:, group],
+                    beam_scores[:, group],
+                    is_sent_finished[:, group],
+                    next_token_hits_stopping_criteria[:, beam_group_idx],
+                    cur_len,
+                    max_length,
+                    decoder_prompt_len,
+                    early_stopping,
+                    length_penalty,
+                )
 
-            if beam_scorer.is_done or all(stopping_criteria(input_ids, scores)):
-                this_peer_finished = True
-
-        final_beam_indices = sum(beam_indices, ()) if beam_indices is not None else None
-        sequence_outputs = beam_scorer.finalize(
-            input_ids,
-            beam_scores,
-            next_tokens,
-            next_indices,
-            pad_token_id=pad_token_id,
-            eos_token_id=eos_token_id,
-            max_length=stopping_criteria.max_length,
-            beam_indices=final_beam_indices,
-            decoder_prompt_len=decoder_prompt_len,
-        )
+        # 5. prepare outputs
+        # Take best beams for each batch across all groups
+        sorted_indices = torch.argsort(beam_scores, dim=1, descending=True, stable=True)[:, :num_return_sequences]
+        sequences = self._flatten_beam_dim(self._gather_beams(sequences, sorted_indices))
+        beam_scores = self._flatten_beam_dim(self._gather_beams(beam_scores, sorted_indices))
+        beam_indices = self._flatten_beam_dim(self._gather_beams(beam_indices, sorted_indices))
+
+        # Crop the static-shaped tensors to the actual size (see `_beam_search`)
+        max_generated_length = ((beam_indices + 1).bool()).sum(dim=1).max()
+        output_length = decoder_prompt_len + max_generated_length
+        sequences = sequences[:, :output_length]
+        beam_indices = beam_indices[:, :max_generated_length]
 
         if return_dict_in_generate:
             if not output_scores:
-                sequence_outputs["sequence_scores"] = None
+                beam_scores = None
 
             if self.config.is_encoder_decoder:
                 return GenerateBeamEncoderDecoderOutput(
-                    sequences=sequence_outputs["sequences"],
-                    sequences_scores=sequence_outputs["sequence_scores"],
-                    scores=scores,
+                    sequences=sequences,
+                    sequences_scores=beam_scores,
+                    scores=all_scores,
                     logits=raw_logits,
-                    beam_indices=sequence_outputs["beam_indices"],
+                    beam_indices=beam_indices,
                     encoder_attentions=encoder_attentions,
                     encoder_hidden_states=encoder_hidden_states,
                     decoder_attentions=decoder_attentions,
@@ -4524,22 +4712,55 @@ class GenerationMixin(ContinuousMixin):
                 )
             else:
                 return GenerateBeamDecoderOnlyOutput(
-                    sequences=sequence_outputs["sequences"],
-                    sequences_scores=sequence_outputs["sequence_scores"],
-                    scores=scores,
+                    sequences=sequences,
+                    sequences_scores=beam_scores,
+                    scores=all_scores,
                     logits=raw_logits,
-                    beam_indices=sequence_outputs["beam_indices"],
+                    beam_indices=beam_indices,
                     attentions=decoder_attentions,
                     hidden_states=decoder_hidden_states,
                     past_key_values=model_kwargs.get("past_key_values"),
                 )
         else:
-            return sequence_outputs["sequences"]
+            return sequences
+
+    def _get_constrained_beam_order(
+        self,
+        candidate_log_probs: torch.Tensor,
+        candidate_banks: torch.Tensor,
+        is_valid_candidate: torch.Tensor,
+        num_beams: int,
+    ) -> torch.Tensor:
+        """
+        Selects the `num_beams` candidates that continue a constrained beam search, returning their indices.
+
+        The candidates are ranked by `bank * 100 + log_prob`, where the bank is a measure of the progress through the
+        constraints. Taking the top `num_beams` of that ranking would fill the beams with the candidates of the
+        highest bank alone, so the ranking is visited in a round-robin fashion instead: first the best candidate of
+        each run of equal banks, then the second best of each run, and so on.
+        """
+        num_candidates = candidate_log_probs.shape[1]
+        candidate_banks = candidate_banks.masked_fill(~is_valid_candidate, -1)
+        sort_keys = (candidate_banks * 100 + candidate_log_probs).masked_fill(~is_valid_candidate, -float("inf"))
+        sorted_indices = torch.sort(sort_keys, dim=1, descending=True, stable=True)[1]
+        sorted_banks = torch.gather(candidate_banks, 1, sorted_indices)
+
+        # position of each sorted candidate within its run of equal banks
+        positions = torch.arange(num_candidates, device=candidate_banks.device).expand_as(sorted_banks)
+        is_run_start = torch.ones_like(sorted_banks, dtype=torch.bool)
+        is_run_start[:, 1:] = sorted_banks[:, 1:] != sorted_banks[:, :-1]
+        run_start_positions = torch.where(is_run_start, positions, 0).cummax(dim=1)[0]
+        position_in_run = positions - run_start_positions
+        # invalid candidates (padding) go last
+        position_in_run += (~torch.gather(is_valid_candidate, 1, sorted_indices)) * num_candidates
+
+        round_robin_indices = torch.sort(position_in_run, dim=1, stable=True)[1]
+        return torch.gather(sorted_indices, 1, round_robin_indices)[:, :num_beams]
 
     def _constrained_beam_search(
         self,
         input_ids: torch.LongTensor,
-        constrained_beam_scorer: ConstrainedBeamSearchScorer,
+        constraints: list[Constraint],
         logits_processor: LogitsProcessorList,
         stopping_criteria: StoppingCriteriaList,
         generation_config: GenerationConfig,
@@ -4550,13 +4771,18 @@ class GenerationMixin(ContinuousMixin):
         Generates sequences of token ids for models with a language modeling head using **constrained beam search
         decoding** and can be used for text-decoder, text-to-text, speech-to-text, and vision-to-text models.
 
+        The search runs on the same static-shaped tensors as [`~generation.GenerationMixin._beam_search`]. At each
+        step, the candidates are the best `num_beams` non-finished continuations plus the tokens that advance the
+        constraints of each running beam, and the next running beams are picked among them by
+        `_get_constrained_beam_order`. The progress of the beams through the constraints is tracked by a
+        [`ConstraintAutomaton`]. Only sequences that fulfill all the constraints become finished hypotheses;
+        open beams that don't are kept aside as a fallback, returned if there are not enough finished hypotheses.
+
         Parameters:
             input_ids (`torch.LongTensor` of shape `(batch_size*num_beams, sequence_length)`):
                 The sequence used as a prompt for the generation.
-            constrained_beam_scorer (`ConstrainedBeamSearchScorer`):
-                A derived instance of [`BeamScorer`] that defines how beam hypotheses are constructed, stored and
-                sorted during generation, while satisfying a list of positive constraints. For more information, the
-                documentation of [`ConstrainedBeamSearchScorer`] should be read.
+            constraints (`list[Constraint]`):
+                The positive constraints that the generated sequences must fulfill. See [`Constraint`].
             logits_processor (`LogitsProcessorList`):
                 An instance of [`LogitsProcessorList`]. List of instances of class derived from [`LogitsProcessor`]
                 used to modify the prediction scores of the language modeling head applied at each generation step.
@@ -4579,7 +4805,7 @@ class GenerationMixin(ContinuousMixin):
             `return_dict_in_generate=True` or a [`~generation.GenerateBeamEncoderDecoderOutput`] if
             `model.config.is_encoder_decoder=True`.
         """
-        # init values
+        # 1. init constrained beam search values
         pad_token_id = generation_config._pad_token_tensor
         eos_token_id = generation_config._eos_token_tensor
         output_attentions = generation_config.output_attentions
@@ -4587,24 +4813,33 @@ class GenerationMixin(ContinuousMixin):
         output_scores = generation_config.output_scores
         output_logits = generation_config.output_logits
         return_dict_in_generate = generation_config.return_dict_in_generate
+        early_stopping = generation_config.early_stopping
+        length_penalty = generation_config.length_penalty
+        max_length = generation_config.max_length
+        num_beams = generation_config.num_beams
+        num_return_sequences = generation_config.num_return_sequences
 
-        batch_size = len(constrained_beam_scorer._beam_hyps)
-        num_beams = constrained_beam_scorer.num_beams
+        batch_size_unflattened, cur_len = input_ids.shape[:2]
+        batch_size = batch_size_unflattened // num_beams
+        decoder_prompt_len = cur_len
+        this_peer_finished = False
 
-        batch_beam_size, cur_len = input_ids.shape[:2]
-        model_kwargs = self._get_initial_cache_position(cur_len, input_ids.device, model_kwargs)
+        n_eos_tokens = eos_token_id.shape[0] if eos_token_id is not None else 0
+        beams_to_keep = max(2, 1 + n_eos_tokens) * num_beams
+        top_num_beam_mask = torch.cat(
+            (
+                torch.ones((num_beams), dtype=torch.bool),
+                torch.zeros((beams_to_keep - num_beams), dtype=torch.bool),
+            ),
+            dim=0,
+        ).to(input_ids.device)
+        all_beams_mask = torch.ones((num_beams), dtype=torch.bool, device=input_ids.device)
 
-        if num_beams * batch_size != batch_beam_size:
-            raise ValueError(
-                f"Batch dimension of `input_ids` should be {num_beams * batch_size}, but is {batch_beam_size}."
-            )
+        model_kwargs = self._get_initial_cache_position(cur_len, input_ids.device, model_kwargs)
 
-        # init attention / hidden states / scores tuples
-        scores = () if (return_dict_in_generate and output_scores) else None
+        # 2. init output tuples
+        all_scores = () if (return_dict_in_generate and output_scores) else None
         raw_logits = () if (return_dict_in_generate and output_logits) else None
-        beam_indices = (
-            tuple(() for _ in range(batch_beam_size)) if (return_dict_in_generate and output_scores) else None
-        )
         decoder_attentions = () if (return_dict_in_generate and output_attentions) else None
         cross_attentions = () if (return_dict_in_generate and output_attentions) else None
         decoder_hidden_states = () if (return_dict_in_generate and output_hidden_states) else None
@@ -4616,27 +4851,55 @@ class GenerationMixin(ContinuousMixin):
                 model_kwargs["encoder_outputs"].get("hidden_states") if output_hidden_states else None
             )
 
+        # 3. init running tensors and static-shaped placeholders (see `_beam_search`)
+        output_fill_value = pad_token_id or eos_token_id[0] if eos_token_id is not None else -1
+        running_sequences = torch.full(
+            (batch_size, num_beams, max_length),
+            fill_value=output_fill_value,
+            dtype=torch.int64,
+            device=input_ids.device,
+        )
+        running_sequences[:, :, :cur_len] = self._unflatten_beam_dim(input_ids, batch_size, num_beams)
+        sequences = running_sequences.detach().clone()
+        fallback_sequences = running_sequences.detach().clone()
+
         # initialise score of first beam with 0 and the rest with -1e9. This makes sure that only tokens
         # of the first beam are considered to avoid sampling the exact same tokens across all beams.
-        beam_scores = torch.zeros((batch_size, num_beams), dtype=torch.float, device=input_ids.device)
-        beam_scores[:, 1:] = -1e9
-        beam_scores = beam_scores.view((batch_size * num_beams,))
-
-        this_peer_finished = False
+        running_beam_scores = torch.zeros((batch_size, num_beams), dtype=torch.float, device=input_ids.device)
+        running_beam_scores[:, 1:] = -1e9
+        beam_scores = torch.full((batch_size, num_beams), fill_value=-1e9, dtype=torch.float, device=input_ids.device)
+        fallback_beam_scores = beam_scores.detach().clone()
+        is_sent_finished = torch.zeros((batch_size, num_beams), dtype=torch.bool, device=input_ids.device)
+        is_fallback_finished = is_sent_finished.detach().clone()
+        running_beam_indices = torch.full(
+            (batch_size, num_beams, max_length - cur_len), fill_value=-1, dtype=torch.int32, device=input_ids.device
+        )
+        beam_indices = running_beam_indices.detach().clone()
+        fallback_beam_indices = running_beam_indices.detach().clone()
+
+        # the progress through the constraints of each running beam, prompt included, as the integer states of the
+        # automaton compiled from the constraints
+        constraint_automaton = ConstraintAutomaton(constraints, device=input_ids.device)
+        constraint_states = constraint_automaton.init_states(input_ids)
+        advance_source_beams = torch.arange(batch_size * num_beams, device=input_ids.device).view(
+            batch_size, num_beams, 1
+        )
 
-        decoder_prompt_len = input_ids.shape[1]  # record the prompt length of decoder
+        # 4. run the generation loop
         while self._has_unfinished_sequences(this_peer_finished, synced_gpus, device=input_ids.device):
-            model_inputs = self.prepare_inputs_for_generation(input_ids, **model_kwargs)
+            # a. Forward current tokens, obtain the logits
+            flat_running_sequences = self._flatten_beam_dim(running_sequences[:, :, :cur_len])
+            model_inputs = self.prepare_inputs_for_generation(flat_running_sequences, **model_kwargs)
 
             # prepare variable output controls (note: some models won't accept all output controls)
             model_inputs.update({"output_attentions": output_attentions} if output_attentions else {})
             model_inputs.update({"output_hidden_states": output_hidden_states} if output_hidden_states else {})
 
-            outputs = self(**model_inputs, return_dict=True)
+            model_outputs = self(**model_inputs, return_dict=True)
 
             # synced_gpus: don't waste resources running the code we don't need; kwargs must be updated before skipping
             model_kwargs = self._update_model_kwargs_for_generation(
-                outputs,
+                model_outputs,
                 model_kwargs,
                 is_encoder_decoder=self.config.is_encoder_decoder,
             )
@@ -4644,115 +4907,234 @@ class GenerationMixin(ContinuousMixin):
                 cur_len = cur_len + 1
                 continue
 
-            # Copy is needed to avoid keeping a hanging ref to outputs.logits which may be very large for first iteration
-            # (the clone itself is always small)
-            # .float() is needed to retain precision for later logits manipulations
-            next_token_logits = outputs.logits[:, -1, :].to(copy=True, dtype=torch.float32, device=input_ids.device)
-            next_token_scores = nn.functional.log_softmax(
-                next_token_logits, dim=-1
-            )  # (batch_size * num_beams, vocab_size)
-
-            next_token_scores_processed = logits_processor(input_ids, next_token_scores)
-
-            next_token_scores = next_token_scores_processed + beam_scores[:, None].expand_as(
-                next_token_scores_processed
-            )
+            # Copy is needed to avoid keeping a hanging ref
+            logits = model_outputs.logits[:, -1, :].to(copy=True, dtype=torch.float32, device=input_ids.device)
 
-            scores_for_all_vocab = next_token_scores.clone()
+            # b. Compute log probs -- get log probabilities from logits, process logits with processors (*e.g.*
+            # `temperature`, ...), and add new logprobs to existing running logprobs scores.
+            log_probs = nn.functional.log_softmax(logits, dim=-1)
+            log_probs = logits_processor(flat_running_sequences, log_probs)
 
             # Store scores, attentions and hidden_states when required
             if return_dict_in_generate:
-                if output_scores:
-                    scores += (next_token_scores,)
                 if output_logits:
-                    raw_logits += (next_token_logits,)
+                    raw_logits += (logits,)
+                if output_scores:
+                    all_scores += (log_probs,)
+
                 if output_attentions:
                     decoder_attentions += (
-                        (outputs.decoder_attentions,) if self.config.is_encoder_decoder else (outputs.attentions,)
+                        (model_outputs.decoder_attentions,)
+                        if self.config.is_encoder_decoder
+                        else (model_outputs.attentions,)
                     )
                     if self.config.is_encoder_decoder:
-                        cross_attentions += (outputs.cross_attentions,)
+                        cross_attentions += (model_outputs.cross_attentions,)
 
                 if output_hidden_states:
                     decoder_hidden_states += (
-                        (outputs.decoder_hidden_states,)
+                        (model_outputs.decoder_hidden_states,)
                         if self.config.is_encoder_decoder
-                        else (outputs.hidden_states,)
+                        else (model_outputs.hidden_states,)
                     )
 
-            # reshape for beam search
-            vocab_size = next_token_scores.shape[-1]
-            next_token_scores = next_token_scores.view(batch_size, num_beams * vocab_size)
+            # This is needed to properly delete logits which may be very large for first iteration
+            # Otherwise a reference to outputs is kept which keeps the logits alive in the next iteration
+            del model_outputs
 
-            # Sample 1 + len(eos_token_id) next tokens for each beam so we have at least 1 non eos token per beam.
-            n_eos_tokens = eos_token_id.shape[0] if eos_token_id is not None else 0
-            next_token_scores, next_tokens = torch.topk(
-                next_token_scores, max(2, 1 + n_eos_tokens) * num_beams, dim=1, largest=True, sorted=True
-            )
+            vocab_size = log_probs.shape[-1]
+            accumulated_log_probs = log_probs + self._flatten_beam_dim(running_beam_scores)[:, None]
 
-            next_indices = (next_tokens / vocab_size).long()
-            next_tokens = next_tokens % vocab_size
+            # c. Retrieve top-K continuations, i.e. select the next token (greedy or sampling) and then keep the best
+            # continuations among all beams based on the accumulated scores.
+            topk_log_probs, topk_running_sequences, topk_running_beam_indices = self._get_top_k_continuations(
+                accumulated_log_probs=torch.reshape(accumulated_log_probs, (batch_size, num_beams * vocab_size)),
+                running_sequences=running_sequences,
+                running_beam_indices=running_beam_indices,
+                cur_len=cur_len,
+                decoder_prompt_len=decoder_prompt_len,
+                do_sample=False,
+                beams_to_keep=beams_to_keep,
+                num_beams=num_beams,
+                vocab_size=vocab_size,
+                batch_size=batch_size,
+            )
+            topk_ids = topk_running_sequences[:, :, cur_len]
+            topk_source_beams = topk_running_beam_indices[:, :, cur_len - decoder_prompt_len].long()
 
-            # stateless
-            beam_outputs = constrained_beam_scorer.process(
-                input_ids,
-                next_token_scores,
-                next_tokens,
-                next_indices,
-                scores_for_all_vocab,
-                pad_token_id=pad_token_id,
-                eos_token_id=eos_token_id,
+            # d. EOS continuations within the top `num_beams` become finished hypotheses, as long as their beam has
+            # fulfilled all the constraints
+            if eos_token_id is not None:
+                topk_is_eos = isin_mps_friendly(topk_ids, eos_token_id.to(topk_ids.device))
+            else:
+                topk_is_eos = torch.zeros_like(topk_ids, dtype=torch.bool)
+            is_beam_completed = constraint_automaton.is_completed(constraint_states)
+            sequences, beam_scores, beam_indices, is_sent_finished = self._update_finished_beams(
+                sequences=sequences,
+                topk_running_sequences=topk_running_sequences,
+                beam_scores=beam_scores,
+                topk_log_probs=topk_log_probs,
                 beam_indices=beam_indices,
+                topk_running_beam_indices=topk_running_beam_indices,
+                is_sent_finished=is_sent_finished,
+                next_token_hits_stopping_criteria=topk_is_eos & is_beam_completed[topk_source_beams],
+                top_num_beam_mask=top_num_beam_mask,
+                num_beams=num_beams,
+                cur_len=cur_len,
                 decoder_prompt_len=decoder_prompt_len,
+                length_penalty=length_penalty,
+                early_stopping=early_stopping,
             )
-            beam_scores = beam_outputs["next_beam_scores"]
-            beam_next_tokens = beam_outputs["next_beam_tokens"]
-            beam_idx = beam_outputs["next_beam_indices"]
 
-            input_ids = torch.cat([input_ids[beam_idx, :], beam_next_tokens.unsqueeze(-1)], dim=-1)
+            # e. Gather the candidates for the next running beams: the best `num_beams` non-EOS continuations, plus
+            # the tokens that advance the constraints of each running beam
+            non_eos_indices = torch.sort(topk_is_eos.to(torch.int8), dim=1, stable=True)[1][:, :num_beams]
+            topk_candidate_source_beams = torch.gather(topk_source_beams, 1, non_eos_indices)
+            topk_candidate_ids = torch.gather(topk_ids, 1, non_eos_indices)
 
-            # This is needed to properly delete outputs.logits which may be very large for first iteration
-            # Otherwise a reference to outputs is kept which keeps the logits alive in the next iteration
-            # IMPORTANT: Note that this should appear BEFORE the call to _reorder_cache() to save the maximum memory
-            # (that way the memory peak does not include outputs.logits)
-            del outputs
+            advance_ids, is_valid_advance = constraint_automaton.advance(
+                self._unflatten_beam_dim(constraint_states, batch_size, num_beams)
+            )
+            # skip the placeholder beams, the tokens advancing several constraints at once and the continuations
+            # that are already candidates
+            is_valid_advance &= (running_beam_scores > -1e9)[:, :, None]
+            is_repeated_advance = (advance_ids[..., :, None] == advance_ids[..., None, :]) & is_valid_advance[
+                ..., None, :
+            ]
+            is_valid_advance &= ~torch.tril(is_repeated_advance, diagonal=-1).any(dim=-1)
+            is_topk_candidate = (advance_source_beams[..., None] == topk_candidate_source_beams[:, None, None, :]) & (
+                advance_ids[..., None] == topk_candidate_ids[:, None, None, :]
+            )
+            is_valid_advance &= ~is_topk_candidate.any(dim=-1)
+
+            candidate_source_beams = torch.cat(
+                (topk_candidate_source_beams, advance_source_beams.expand_as(advance_ids).reshape(batch_size, -1)),
+                dim=1,
+            )
+            candidate_ids = torch.cat((topk_candidate_ids, advance_ids.reshape(batch_size, -1).clamp(min=0)), dim=1)
+            is_valid_candidate = torch.cat(
+                (torch.ones_like(topk_candidate_ids, dtype=torch.bool), is_valid_advance.reshape(batch_size, -1)),
+                dim=1,
+            )
+            candidate_log_probs = accumulated_log_probs[candidate_source_beams, candidate_ids]
+            candidate_states = constraint_automaton.step(constraint_states[candidate_source_beams], candidate_ids)
+            candidate_banks = constraint_automaton.get_bank(candidate_states)
+
+            # f. Select the running beams for the next iteration, balancing the progress through the constraints
+            selected_indices = self._get_constrained_beam_order(
+                candidate_log_probs, candidate_banks, is_valid_candidate, num_beams
+            )
+            selected_source_beams = torch.gather(candidate_source_beams, 1, selected_indices)
+            running_sequences = self._flatten_beam_dim(running_sequences)[selected_source_beams]
+            running_sequences[:, :, cur_len] = torch.gather(candidate_ids, 1, selected_indices)
+            running_beam_indices = self._flatten_beam_dim(running_beam_indices)[selected_source_beams]
+            running_beam_indices[:, :, cur_len - decoder_prompt_len] = selected_source_beams.to(torch.int32)
+            running_beam_scores = torch.gather(candidate_log_probs, 1, selected_indices)
+            constraint_states = self._flatten_beam_dim(
+                torch.gather(candidate_states, 1, selected_indices[:, :, None].expand(-1, -1, 2))
+            )
 
+            # g. Running beams that hit a stopping criteria (e.g. `max_length`) end here. They become finished
+            # hypotheses if they fulfill all the constraints, fallback hypotheses otherwise
+            next_token_hits_stopping_criteria = stopping_criteria(
+                self._flatten_beam_dim(running_sequences[:, :, : cur_len + 1]), all_scores
+            )
+            next_token_hits_stopping_criteria = self._unflatten_beam_dim(
+                next_token_hits_stopping_criteria, batch_size, num_beams
+            )
+            is_beam_completed = self._unflatten_beam_dim(
+                constraint_automaton.is_completed(constraint_states), batch_size, num_beams
+            )
+            sequences, beam_scores, beam_indices, is_sent_finished = self._update_finished_beams(
+                sequences=sequences,
+                topk_running_sequences=running_sequences,
+                beam_scores=beam_scores,
+                topk_log_probs=running_beam_scores,
+                beam_indices=beam_indices,
+                topk_running_beam_indices=running_beam_indices,
+                is_sent_finished=is_sent_finished,
+                next_token_hits_stopping_criteria=next_token_hits_stopping_criteria & is_beam_completed,
+                top_num_beam_mask=all_beams_mask,
+                num_beams=num_beams,
+                cur_len=cur_len,
+                decoder_prompt_len=decoder_prompt_len,
+                length_penalty=length_penalty,
+                early_stopping=early_stopping,
+            )
+            fallback_sequences, fallback_beam_scores, fallback_beam_indices, is_fallback_finished = (
+                self._update_finished_beams(
+                    sequences=fallback_sequences,
+                    topk_running_sequences=running_sequences,
+                    beam_scores=fallback_beam_scores,
+                    topk_log_probs=running_beam_scores,
+                    beam_indices=fallback_beam_indices,
+                    topk_running_beam_indices=running_beam_indices,
+                    is_sent_finished=is_fallback_finished,
+                    next_token_hits_stopping_criteria=next_token_hits_stopping_criteria & ~is_beam_completed,
+                    top_num_beam_mask=all_beams_mask,
+                    num_beams=num_beams,
+                    cur_len=cur_len,
+                    decoder_prompt_len=decoder_prompt_len,
+                    length_penalty=length_penalty,
+                    early_stopping=early_stopping,
+                )
+            )
+            running_beam_scores = running_beam_scores + next_token_hits_stopping_criteria.to(torch.float32) * -1.0e9
+
+            # h. Prepare remaining data for the next iteration, including computing the stopping condition for
+            # beam search as a whole (as opposed to individual beams, i.e. `stopping_criteria`)
             if model_kwargs.get("past_key_values", None) is not None:
                 model_kwargs["past_key_values"] = self._temporary_reorder_cache(
-                    model_kwargs["past_key_values"], beam_idx
+                    past_key_values=model_kwargs["past_key_values"],
+                    beam_idx=self._flatten_beam_dim(running_beam_indices[..., cur_len - decoder_prompt_len]),
                 )
 
-            if return_dict_in_generate and output_scores:
-                beam_indices = tuple(beam_indices[beam_idx[i]] + (beam_idx[i],) for i in range(len(beam_indices)))
-
-            # increase cur_len
             cur_len = cur_len + 1
+            # the running beams are ordered by progress through the constraints, not by score
+            this_peer_finished = not self._beam_search_has_unfinished_sequences(
+                running_beam_scores.max(dim=1, keepdim=True)[0],
+                beam_scores,
+                is_sent_finished,
+                next_token_hits_stopping_criteria,
+                cur_len,
+                max_length,
+                decoder_prompt_len,
+                early_stopping,
+                length_penalty,
+            )
 
-            if constrained_beam_scorer.is_done or all(stopping_criteria(input_ids, scores)):
-                this_peer_finished = True
-
-        sequence_outputs = constrained_beam_scorer.finalize(
-            input_ids,
-            beam_scores,
-            next_tokens,
-            next_indices,
-            pad_token_id=pad_token_id,
-            eos_token_id=eos_token_id,
-            max_length=stopping_criteria.max_length,
-            beam_indices=beam_indices,
-            decoder_prompt_len=decoder_prompt_len,
+        # 5. prepare outputs
+        # Take best beams for each batch. The fallback hypotheses only compete when there are not enough sequences
+        # fulfilling the constraints.
+        has_enough_finished = is_sent_finished.sum(dim=1, keepdim=True) >= num_return_sequences
+        fallback_beam_scores = fallback_beam_scores + has_enough_finished.to(torch.float32) * -1.0e9
+        merged_scores = torch.cat((beam_scores, fallback_beam_scores), dim=1)
+        sorted_indices = torch.argsort(merged_scores, dim=1, descending=True, stable=True)[:, :num_return_sequences]
+        sequences = self._flatten_beam_dim(
+            self._gather_beams(torch.cat((sequences, fallback_sequences), dim=1), sorted_indices)
+        )
+        beam_scores = self._flatten_beam_dim(self._gather_beams(merged_scores, sorted_indices))
+        beam_indices = self._flatten_beam_dim(
+            self._gather_beams(torch.cat((beam_indices, fallback_beam_indices), dim=1), sorted_indices)
         )
 
+        # Crop the static-shaped tensors to the actual size (see `_beam_search`)
+        max_generated_length = ((beam_indices + 1).bool()).sum(dim=1).max()
+        output_length = decoder_prompt_len + max_generated_length
+        sequences = sequences[:, :output_length]
+        beam_indices = beam_indices[:, :max_generated_length]
+
         if return_dict_in_generate:
             if not output_scores:
-                sequence_outputs["sequence_scores"] = None
+                beam_scores = None
+
             if self.config.is_encoder_decoder:
                 return GenerateBeamEncoderDecoderOutput(
-                    sequences=sequence_outputs["sequences"],
-                    sequences_scores=sequence_outputs["sequence_scores"],
-                    scores=scores,
+                    sequences=sequences,
+                    sequences_scores=beam_scores,
+                    scores=all_scores,
                     logits=raw_logits,
-                    beam_indices=sequence_outputs["beam_indices"],
+                    beam_indices=beam_indices,
                     encoder_attentions=encoder_attentions,
                     encoder_hidden_states=encoder_hidden_states,
                     decoder_attentions=decoder_attentions,
@@ -4762,17 +5144,17 @@ class GenerationMixin(ContinuousMixin):
                 )
             else:
                 return GenerateBeamDecoderOnlyOutput(
-                    sequences=sequence_outputs["sequences"],
-                    sequences_scores=sequence_outputs["sequence_scores"],
-                    scores=scores,
+                    sequences=sequences,
+                    sequences_scores=beam_scores,
+                    scores=all_scores,
                     logits=raw_logits,
-                    beam_indices=sequence_outputs["beam_indices"],
+                    beam_indices=beam_indices,
                     attentions=decoder_attentions,
                     hidden_states=decoder_hidden_states,
                     past_key_values=model_kwargs.get("past_key_values"),
                 )
         else:
-            return sequence_outputs["sequences"]
+            return sequences
 
     def _assisted_decoding(
         self,
@@ -5423,3 +5805,64 @@ def _dola_select_contrast(
     final_logits, base_logits = _relative_top_filter(final_logits, base_logits)
     logits = final_logits - base_logits
     return logits
+
+
+# Processors that only look at the score values, and therefore give the same result on the scores of a subset of the
+# vocabulary as on the full-vocabulary scores with the other tokens set to `-inf`
+_VOCABULARY_AGNOSTIC_PROCESSORS = (
+    EpsilonLogitsWarper,
+    EtaLogitsWarper,
+    LogitNormalization,
+    MinPLogitsWarper,
+    SortFreeMinPLogitsWarper,
+    SortFreeTopPLogitsWarper,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+    TypicalLogitsWarper,
+)
+
+
+class _PrunedVocabularyLogitsProcessor(LogitsProcessor):
+    """
+    Applies `logits_processor` to scores computed over a subset of the vocabulary, as used with
+    `generation_config.allowed_token_ids`. Processors that only depend on the score values run on the pruned scores
+    directly. The others may index the scores with token ids, so they see the scores remapped to the full vocabulary,
+    with the pruned tokens set to `-inf`.
+
+    Args:
+        logits_processor (`LogitsProcessorList`):
+            The processors to apply.
+        token_ids (`torch.LongTensor` of shape `(num_allowed_tokens,)`):
+            The sorted token ids the scores are computed over.
+        vocab_size (`int`):
+            The size of the full vocabulary.
+    """
+
+    def __init__(self, logits_processor: LogitsProcessorList, token_ids: torch.LongTensor, vocab_size: int):
+        self.logits_processor = logits_processor
+        self.token_ids = token_ids
+        self.vocab_size = vocab_size
+
+    def to_full_vocabulary(self, scores: torch.FloatTensor) -> torch.FloatTensor:
+        full_scores = scores.new_full((scores.shape[0], self.vocab_size), -float("inf"))
+        full_scores[:, self.token_ids] = scores
+        return full_scores
+
+    def _apply_on_full_vocabulary(self, logits_processor, input_ids, scores):
+        if len(logits_processor) == 0:
+            return scores
+        full_scores = logits_processor(input_ids, self.to_full_vocabulary(scores))
+        return full_scores[:, self.token_ids]
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        # consecutive processors that need the full vocabulary share a single remapping
+        full_vocabulary_processors = LogitsProcessorList()
+        for processor in self.logits_processor:
+            if isinstance(processor, _VOCABULARY_AGNOSTIC_PROCESSORS):
+                scores = self._apply_on_full_vocabulary(full_vocabulary_processors, input_ids, scores)
+                full_vocabulary_processors = LogitsProcessorList()
+                scores = processor(input_ids, scores)
+            else:
+                full_vocabulary_processors.append(processor)
+        return self._apply_on_full_vocabulary(full_vocabulary_processors, input_ids, scores)
@@ -11,6 +11,8 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import torch
@@ -354,11 +356,48 @@ class HungarianMatcher(nn.Module):
 
         # Final cost matrix
         cost_matrix = self.bbox_cost * bbox_cost + self.class_cost * class_cost + self.giou_cost * giou_cost
-        cost_matrix = cost_matrix.view(batch_size, num_queries, -1).cpu()
+        cost_matrix = cost_matrix.view(batch_size, num_queries, -1)
 
         sizes = [len(v["boxes"]) for v in targets]
-        indices = [linear_sum_assignment(c[i]) for i, c in enumerate(cost_matrix.split(sizes, -1))]
-        return [(torch.as_tensor(i, dtype=torch.int64), torch.as_tensor(j, dtype=torch.int64)) for i, j in indices]
+        return batched_linear_sum_assignment(cost_matrix, sizes)
+
+
+def batched_linear_sum_assignment(cost_matrix: Tensor, sizes: list[int]) -> list[tuple[Tensor, Tensor]]:
+    """
+    Solves the assignment problem of every image of a batch with `scipy.optimize.linear_sum_assignment`.
+
+    Args:
+        cost_matrix (`torch.Tensor`):
+            Tensor of dim [batch_size, num_queries, sum(sizes)] with the matching costs between the predictions of
+            every image and the targets of the whole batch.
+        sizes (`list[int]`):
+            The number of targets of every image.
+
+    Returns:
+        `list[Tuple]`: A list of size `batch_size`, containing tuples of (index_i, index_j) of the selected predictions
+        and the corresponding selected targets.
+    """
+    batch_size, num_queries = cost_matrix.shape[:2]
+    max_size = max(sizes, default=0)
+    if max_size == 0:
+        empty = torch.empty(0, dtype=torch.int64)
+        return [(empty, empty) for _ in range(batch_size)]
+
+    # Only the costs of the targets of each image are needed: they are gathered, padded to the largest number of
+    # targets, so that a single batch_size x num_queries x max_size transfer to the CPU is done
+    offsets = torch.tensor([0] + sizes[:-1], device=cost_matrix.device).cumsum(0)
+    columns = (offsets[:, None] + torch.arange(max_size, device=cost_matrix.device)).clamp(max=sum(sizes) - 1)
+    cost_matrix = cost_matrix.gather(2, columns[:, None, :].expand(batch_size, num_queries, max_size)).cpu()
+    costs = [cost_matrix[i, :, :size] for i, size in enumerate(sizes)]
+
+    # scipy releases the GIL while solving, so the images are solved in parallel
+    num_workers = min(batch_size, os.cpu_count() or 1)
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            indices = list(executor.map(linear_sum_assignment, costs))
+    else:
+        indices = [linear_sum_assignment(c) for c in costs]
+    return [(torch.as_tensor(i, dtype=torch.int64), torch.as_tensor(j, dtype=torch.int64)) for i, j in indices]
 
 
 # below: bounding box utilities taken from https://github.com/facebookresearch/detr/blob/master/util/box_ops.py
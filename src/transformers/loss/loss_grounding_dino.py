@@ -15,12 +15,13 @@ import torch
 import torch.nn as nn
 
 from ..image_transforms import center_to_corners_format
-from ..utils import is_scipy_available
-from .loss_for_object_detection import HungarianMatcher, ImageLoss, _set_aux_loss, generalized_box_iou
-
-
-if is_scipy_available():
-    from scipy.optimize import linear_sum_assignment
+from .loss_for_object_detection import (
+    HungarianMatcher,
+    ImageLoss,
+    _set_aux_loss,
+    batched_linear_sum_assignment,
+    generalized_box_iou,
+)
 
 
 # Similar to the one used in `DeformableDetr` but we reduce with sum and normalize by num_boxes
@@ -118,11 +119,10 @@ class GroundingDinoHungarianMatcher(HungarianMatcher):
 
         # Final cost matrix
         cost_matrix = self.bbox_cost * bbox_cost + self.class_cost * class_cost + self.giou_cost * giou_cost
-        cost_matrix = cost_matrix.view(batch_size, num_queries, -1).cpu()
+        cost_matrix = cost_matrix.view(batch_size, num_queries, -1)
 
         sizes = [len(v["boxes"]) for v in targets]
-        indices = [linear_sum_assignment(c[i]) for i, c in enumerate(cost_matrix.split(sizes, -1))]
-        return [(torch.as_tensor(i, dtype=torch.int64), torch.as_tensor(j, dtype=torch.int64)) for i, j in indices]
+        return batched_linear_sum_assignment(cost_matrix, sizes)
 
 
 class GroundingDinoImageLoss(ImageLoss):
@@ -16,8 +16,9 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
-from ..utils import is_scipy_available, is_vision_available, requires_backends
+from ..utils import is_vision_available, requires_backends
 from .loss_for_object_detection import (
+    batched_linear_sum_assignment,
     box_iou,
     dice_loss,
     generalized_box_iou,
@@ -26,10 +27,6 @@ from .loss_for_object_detection import (
 )
 
 
-if is_scipy_available():
-    from scipy.optimize import linear_sum_assignment
-
-
 if is_vision_available():
     from transformers.image_transforms import center_to_corners_format
 
@@ -116,12 +113,10 @@ class RTDetrHungarianMatcher(nn.Module):
         giou_cost = -generalized_box_iou(center_to_corners_format(out_bbox), center_to_corners_format(target_bbox))
         # Compute the final cost matrix
         cost_matrix = self.bbox_cost * bbox_cost + self.class_cost * class_cost + self.giou_cost * giou_cost
-        cost_matrix = cost_matrix.view(batch_size, num_queries, -1).cpu()
+        cost_matrix = cost_matrix.view(batch_size, num_queries, -1)
 
         sizes = [len(v["boxes"]) for v in targets]
-        indices = [linear_sum_assignment(c[i]) for i, c in enumerate(cost_matrix.split(sizes, -1))]
-
-        return [(torch.as_tensor(i, dtype=torch.int64), torch.as_tensor(j, dtype=torch.int64)) for i, j in indices]
+        return batched_linear_sum_assignment(cost_matrix, sizes)
 
 
 class RTDetrLoss(nn.Module):
@@ -68,6 +68,158 @@ def ForCausalLMLoss(
     return loss
 
 
+class ChunkedCrossEntropyFunction(torch.autograd.Function):
+    """
+    Sum of the cross-entropy losses of `logits` against `targets`, computed over chunks of `chunk_size` rows. Only one
+    chunk is upcast to float32 at a time, in the forward as well as in the backward pass, instead of the full logits
+    and their log-softmax.
+    """
+
+    @staticmethod
+    def forward(ctx, logits, targets, ignore_index, chunk_size):
+        lse = torch.empty(logits.shape[0], dtype=torch.float32, device=logits.device)
+        loss = torch.zeros((), dtype=torch.float32, device=logits.device)
+        for start in range(0, logits.shape[0], chunk_size):
+            chunk_loss, lse[start : start + chunk_size] = _cross_entropy_sum(
+                logits[start : start + chunk_size].float(), targets[start : start + chunk_size], ignore_index
+            )
+            loss += chunk_loss
+        ctx.save_for_backward(logits, targets, lse)
+        ctx.ignore_index = ignore_index
+        ctx.chunk_size = chunk_size
+        return loss
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        logits, targets, lse = ctx.saved_tensors
+        grad_logits = torch.empty_like(logits)
+        for start in range(0, logits.shape[0], ctx.chunk_size):
+            chunk_grad = _cross_entropy_grad(
+                logits[start : start + ctx.chunk_size].float(),
+                targets[start : start + ctx.chunk_size],
+                lse[start : start + ctx.chunk_size],
+                ctx.ignore_index,
+            )
+            grad_logits[start : start + ctx.chunk_size] = chunk_grad * grad_output
+        return grad_logits, None, None, None
+
+
+class ChunkedLinearCrossEntropyFunction(torch.autograd.Function):
+    """
+    Sum of the cross-entropy losses of the logits `hidden_states @ weight.T + bias` against `targets`, without ever
+    materializing the logits: they are computed, and differentiated, over chunks of `chunk_size` rows. The gradients
+    are computed in the forward pass, the chunk logits being discarded right away, and rescaled in the backward pass.
+    """
+
+    @staticmethod
+    def forward(ctx, hidden_states, weight, bias, targets, ignore_index, chunk_size):
+        needs_grad_hidden_states, needs_grad_weight, needs_grad_bias = ctx.needs_input_grad[:3]
+        grad_hidden_states = torch.empty_like(hidden_states) if needs_grad_hidden_states else None
+        # The gradients of the LM head are accumulated in place over the chunks
+        grad_weight = torch.zeros_like(weight) if needs_grad_weight else None
+        grad_bias = torch.zeros_like(bias) if needs_grad_bias else None
+
+        loss = torch.zeros((), dtype=torch.float32, device=hidden_states.device)
+        for start in range(0, hidden_states.shape[0], chunk_size):
+            chunk_hidden_states = hidden_states[start : start + chunk_size]
+            chunk_targets = targets[start : start + chunk_size]
+            chunk_logits = nn.functional.linear(chunk_hidden_states, weight, bias).float()
+            chunk_loss, lse = _cross_entropy_sum(chunk_logits, chunk_targets, ignore_index)
+            loss += chunk_loss
+
+            if not any(ctx.needs_input_grad[:3]):
+                continue
+            chunk_grad = _cross_entropy_grad(chunk_logits, chunk_targets, lse, ignore_index).to(weight.dtype)
+            del chunk_logits
+            if needs_grad_hidden_states:
+                grad_hidden_states[start : start + chunk_size] = chunk_grad @ weight
+            if needs_grad_weight:
+                grad_weight.addmm_(chunk_grad.T, chunk_hidden_states)
+            if needs_grad_bias:
+                grad_bias += chunk_grad.sum(dim=0)
+
+        ctx.save_for_backward(grad_hidden_states, grad_weight, grad_bias)
+        return loss
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        grads = [None if grad is None else grad * grad_output.to(grad.dtype) for grad in ctx.saved_tensors]
+        return *grads, None, None, None
+
+
+def _cross_entropy_sum(logits, targets, ignore_index):
+    # Summed cross-entropy of float32 `logits`, along with their log-sum-exp
+    valid = targets != ignore_index
+    lse = torch.logsumexp(logits, dim=-1)
+    target_logits = logits.gather(1, targets.masked_fill(~valid, 0)[:, None]).squeeze(1)
+    return ((lse - target_logits) * valid).sum(), lse
+
+
+def _chunked_linear_cross_entropy(hidden_states, weight, bias, targets, ignore_index, chunk_size):
+    # Forward of `ChunkedLinearCrossEntropyFunction` without the gradients, e.g. for evaluation
+    loss = torch.zeros((), dtype=torch.float32, device=hidden_states.device)
+    for start in range(0, hidden_states.shape[0], chunk_size):
+        chunk_logits = nn.functional.linear(hidden_states[start : start + chunk_size], weight, bias).float()
+        loss += _cross_entropy_sum(chunk_logits, targets[start : start + chunk_size], ignore_index)[0]
+    return loss
+
+
+def _cross_entropy_grad(logits, targets, lse, ignore_index):
+    # Gradient of the summed cross-entropy with respect to float32 `logits`: softmax minus the one-hot targets
+    valid = targets != ignore_index
+    grad = torch.exp(logits - lse[:, None])
+    grad[torch.arange(len(targets), device=targets.device), targets.masked_fill(~valid, 0)] -= 1
+    return grad * valid[:, None]
+
+
+def ForCausalLMChunkedLoss(
+    logits=None,
+    labels=None,
+    vocab_size: Optional[int] = None,
+    num_items_in_batch: Optional[torch.Tensor] = None,
+    ignore_index: int = -100,
+    shift_labels: Optional[torch.Tensor] = None,
+    hidden_states: Optional[torch.Tensor] = None,
+    lm_head_weight: Optional[torch.Tensor] = None,
+    lm_head_bias: Optional[torch.Tensor] = None,
+    chunk_size: int = 1024,
+    **kwargs,
+) -> torch.Tensor:
+    """
+    Same loss as `ForCausalLMLoss`, computed over chunks of `chunk_size` tokens so that the float32 logits (and their
+    gradient) of a whole batch never exist at once, which dominates the memory of the loss with large vocabularies.
+    Select it with `model.loss_type = "ForCausalLMChunked"`.
+
+    When `hidden_states` and `lm_head_weight` (and `lm_head_bias`, if any) are passed instead of `logits`, the
+    projection to the vocabulary is fused in the chunks as well, so that the logits are not materialized at all.
+    """
+    if shift_labels is None:
+        # Shift so that tokens < n predict n
+        labels = nn.functional.pad(labels, (0, 1), value=ignore_index)
+        shift_labels = labels[..., 1:].contiguous()
+
+    if hidden_states is not None and lm_head_weight is not None:
+        hidden_states = hidden_states.reshape(-1, hidden_states.shape[-1])
+        shift_labels = shift_labels.view(-1).to(hidden_states.device)
+        inputs = (hidden_states, lm_head_weight, lm_head_bias)
+        # `ctx.needs_input_grad` ignores `torch.no_grad()`, so evaluation would compute the gradients in the forward
+        if torch.is_grad_enabled() and any(tensor is not None and tensor.requires_grad for tensor in inputs):
+            loss = ChunkedLinearCrossEntropyFunction.apply(*inputs, shift_labels, ignore_index, chunk_size)
+        else:
+            loss = _chunked_linear_cross_entropy(*inputs, shift_labels, ignore_index, chunk_size)
+    else:
+        logits = logits.view(-1, vocab_size)
+        shift_labels = shift_labels.view(-1).to(logits.device)
+        loss = ChunkedCrossEntropyFunction.apply(logits, shift_labels, ignore_index, chunk_size)
+
+    if num_items_in_batch is None:
+        # Mean over the tokens that are not ignored, like `fixed_cross_entropy`
+        num_items_in_batch = (shift_labels != ignore_index).sum()
+    if torch.is_tensor(num_items_in_batch):
+        num_items_in_batch = num_items_in_batch.to(loss.device)
+    return loss / num_items_in_batch
+
+
 def ForMaskedLMLoss(
     logits: torch.Tensor,
     labels: torch.Tensor,
@@ -146,6 +298,7 @@ def ForTokenClassification(logits: torch.Tensor, labels, config, **kwargs):
 
 LOSS_MAPPING = {
     "ForCausalLM": ForCausalLMLoss,
+    "ForCausalLMChunked": ForCausalLMChunkedLoss,
     "ForMaskedLM": ForMaskedLMLoss,
     "ForQuestionAnswering": ForQuestionAnsweringLoss,
     "ForSequenceClassification": ForSequenceClassificationLoss,
@@ -60,6 +60,7 @@ from .base import (
     get_default_model_and_revision,
     infer_framework_load_model,
 )
+from .cache import InMemoryPipelineCache, PipelineCache, SQLitePipelineCache
 from .depth_estimation import DepthEstimationPipeline
 from .document_question_answering import DocumentQuestionAnsweringPipeline
 from .feature_extraction import FeatureExtractionPipeline
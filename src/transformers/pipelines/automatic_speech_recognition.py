@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from itertools import groupby
 from typing import TYPE_CHECKING, Any, Optional, Union
 
 import numpy as np
@@ -84,6 +86,48 @@ def chunk_iter(inputs, feature_extractor, chunk_len, stride_left, stride_right,
             break
 
 
+def chunk_stream_iter(buffers, feature_extractor, chunk_len, stride_left, stride_right, dtype=None):
+    """
+    Same as `chunk_iter`, but over an iterator of audio `buffers` whose total length is not known in advance. The
+    chunks are identical to the ones `chunk_iter` yields on the concatenated buffers, while only holding about one
+    chunk of audio in memory at a time.
+    """
+    step = chunk_len - stride_left - stride_right
+    audio = np.zeros(0, dtype=np.float32)
+    _stride_left = 0
+
+    def process(chunk, stride, is_last):
+        processed = feature_extractor(
+            chunk,
+            sampling_rate=feature_extractor.sampling_rate,
+            return_tensors="pt",
+            return_attention_mask=True,
+        )
+        if dtype is not None:
+            processed = processed.to(dtype=dtype)
+        return {"is_last": is_last, "stride": stride, **processed}
+
+    # Reads from a pipe or a socket can end in the middle of a sample, whose bytes are kept for the next buffer
+    partial_sample = b""
+    for buffer in buffers:
+        if isinstance(buffer, bytes):
+            buffer = partial_sample + buffer if partial_sample else buffer
+            num_bytes = len(buffer) - len(buffer) % audio.itemsize
+            buffer, partial_sample = np.frombuffer(buffer[:num_bytes], dtype=np.float32), buffer[num_bytes:]
+        audio = np.concatenate([audio, buffer])
+        # A chunk is only known not to be the last one once audio past its end has been received
+        while audio.shape[0] > chunk_len:
+            yield process(audio[:chunk_len], (chunk_len, _stride_left, stride_right), is_last=False)
+            _stride_left = stride_left
+            audio = audio[step:]
+    if partial_sample:
+        raise ValueError(
+            f"The audio stream ended with {len(partial_sample)} bytes, not a whole number of float32 samples."
+        )
+    if audio.shape[0] > _stride_left:
+        yield process(audio, (audio.shape[0], _stride_left, 0), is_last=True)
+
+
 def _find_longest_common_sequence(sequences, tokenizer):
     # TODO  Use a faster algorithm this can probably be done in O(n)
     # using suffix array.
@@ -349,6 +393,108 @@ class AutomaticSpeechRecognitionPipeline(ChunkPipeline):
 
         return preprocess_params, forward_params, postprocess_params
 
+    def _get_chunk_lengths(self, chunk_length_s, stride_length_s=None):
+        """Converts the chunk and stride lengths from seconds to a number of samples."""
+        if stride_length_s is None:
+            stride_length_s = chunk_length_s / 6
+
+        if isinstance(stride_length_s, (int, float)):
+            stride_length_s = [stride_length_s, stride_length_s]
+
+        # XXX: Carefully, this variable will not exist in `seq2seq` setting.
+        # Currently chunking is not possible at this level for `seq2seq` so
+        # it's ok.
+        align_to = getattr(self.model.config, "inputs_to_logits_ratio", 1)
+        chunk_len = int(round(chunk_length_s * self.feature_extractor.sampling_rate / align_to) * align_to)
+        stride_left = int(round(stride_length_s[0] * self.feature_extractor.sampling_rate / align_to) * align_to)
+        stride_right = int(round(stride_length_s[1] * self.feature_extractor.sampling_rate / align_to) * align_to)
+
+        if chunk_len < stride_left + stride_right:
+            raise ValueError("Chunk length must be superior to stride length")
+        return chunk_len, stride_left, stride_right
+
+    def stream(
+        self, inputs: Iterable[Union[np.ndarray, bytes]], chunk_length_s: float, stride_length_s=None
+    ) -> Iterator[dict[str, str]]:
+        """
+        Transcribes an audio stream incrementally, for instance read from a file or a socket, yielding the text as soon
+        as it can no longer change. The audio is chunked on the fly like with `chunk_length_s`, so that long
+        recordings are transcribed with a bounded amount of memory, and the first words come out after the first
+        chunk. Only available for CTC models without language model.
+
+        Args:
+            inputs (`Iterable[np.ndarray]` or `Iterable[bytes]`):
+                The audio buffers, of any length, sampled at the sampling rate of the feature extractor. `bytes` are
+                read as raw `float32` samples, as produced by *ffmpeg* with the `f32le` format.
+            chunk_length_s (`float`):
+                The input length for in each chunk.
+            stride_length_s (`float`, *optional*, defaults to `chunk_length_s / 6`):
+                The length of stride on the left and right of each chunk.
+
+        Return:
+            A generator of `dict` with a single key, **text** (`str`): the next piece of the transcript, made of whole
+            words. Concatenating the pieces gives the same transcript as calling the pipeline on the whole audio
+            with the same `chunk_length_s` and `stride_length_s`.
+        """
+        if self.type != "ctc":
+            raise ValueError(
+                "Streaming transcription relies on CTC outputs, which stay exact when cut at chunk boundaries, and is "
+                f"not available for {self.model.__class__.__name__}. Use `chunk_length_s` on the whole audio instead."
+            )
+        _, forward_params, _ = self._sanitize_parameters()
+        forward_params = {**self._forward_params, **forward_params}
+        chunk_len, stride_left, stride_right = self._get_chunk_lengths(chunk_length_s, stride_length_s)
+
+        # The text is only decoded up to the last word delimiter (or CTC blank when words are not delimited), so
+        # that repeated tokens are never grouped across two pieces. Decoding strips the delimiters at both ends of a
+        # piece, so they are counted and written back in front of the next word, like in the whole transcript.
+        word_delimiter_token_id = getattr(self.tokenizer, "word_delimiter_token_id", None)
+        boundary_token_id = (
+            word_delimiter_token_id if word_delimiter_token_id is not None else self.tokenizer.pad_token_id
+        )
+        pending_tokens = []
+        previous_token = None
+        num_spaces = 0
+        has_text = False
+        for chunk in chunk_stream_iter(
+            inputs, self.feature_extractor, chunk_len, stride_left, stride_right, self.torch_dtype
+        ):
+            outputs = self.forward(chunk, **forward_params)
+            total_n, left, right = outputs["stride"]
+            pending_tokens.extend(outputs["tokens"][0, left : total_n - right].tolist())
+
+            if outputs["is_last"]:
+                resolved_tokens, pending_tokens = pending_tokens, []
+            else:
+                boundaries = [i for i, token in enumerate(pending_tokens) if token == boundary_token_id]
+                if not boundaries:
+                    continue
+                resolved_tokens = pending_tokens[: boundaries[-1] + 1]
+                pending_tokens = pending_tokens[boundaries[-1] + 1 :]
+
+            # A run of the same token across two pieces is grouped into a single one by CTC decoding
+            start = 0
+            while start < len(resolved_tokens) and resolved_tokens[start] == previous_token:
+                start += 1
+            if resolved_tokens:
+                previous_token = resolved_tokens[-1]
+            resolved_tokens = resolved_tokens[start:]
+
+            is_delimiter = [
+                token == word_delimiter_token_id
+                for token, _ in groupby(resolved_tokens)
+                if token != self.tokenizer.pad_token_id
+            ]
+            text = self.tokenizer.decode(resolved_tokens, skip_special_tokens=False)
+            if not text:
+                num_spaces += sum(is_delimiter)
+                continue
+            if has_text:
+                text = " " * (num_spaces + is_delimiter.index(False)) + text
+            num_spaces = is_delimiter[::-1].index(False)
+            has_text = True
+            yield {"text": text}
+
     def preprocess(self, inputs, chunk_length_s=0, stride_length_s=None):
         if isinstance(inputs, str):
             if inputs.startswith("http://") or inputs.startswith("https://"):
@@ -413,23 +559,7 @@ class AutomaticSpeechRecognitionPipeline(ChunkPipeline):
             raise ValueError("We expect a single channel audio input for AutomaticSpeechRecognitionPipeline")
 
         if chunk_length_s:
-            if stride_length_s is None:
-                stride_length_s = chunk_length_s / 6
-
-            if isinstance(stride_length_s, (int, float)):
-                stride_length_s = [stride_length_s, stride_length_s]
-
-            # XXX: Carefully, this variable will not exist in `seq2seq` setting.
-            # Currently chunking is not possible at this level for `seq2seq` so
-            # it's ok.
-            align_to = getattr(self.model.config, "inputs_to_logits_ratio", 1)
-            chunk_len = int(round(chunk_length_s * self.feature_extractor.sampling_rate / align_to) * align_to)
-            stride_left = int(round(stride_length_s[0] * self.feature_extractor.sampling_rate / align_to) * align_to)
-            stride_right = int(round(stride_length_s[1] * self.feature_extractor.sampling_rate / align_to) * align_to)
-
-            if chunk_len < stride_left + stride_right:
-                raise ValueError("Chunk length must be superior to stride length")
-
+            chunk_len, stride_left, stride_right = self._get_chunk_lengths(chunk_length_s, stride_length_s)
             for item in chunk_iter(
                 inputs, self.feature_extractor, chunk_len, stride_left, stride_right, self.torch_dtype
             ):
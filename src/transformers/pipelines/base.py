@@ -15,7 +15,11 @@
 import collections
 import copy
 import csv
+import functools
+import hashlib
 import importlib
+import inspect
+import itertools
 import json
 import os
 import pickle
@@ -23,12 +27,15 @@ import sys
 import traceback
 import types
 import warnings
+import weakref
 from abc import ABC, abstractmethod
 from collections import UserDict
 from contextlib import contextmanager
 from os.path import abspath, exists
 from typing import TYPE_CHECKING, Any, Optional, Union
 
+import numpy as np
+
 from ..dynamic_module_utils import custom_object_save
 from ..feature_extraction_utils import PreTrainedFeatureExtractor
 from ..generation import GenerationConfig
@@ -54,10 +61,12 @@ from ..utils import (
     is_torch_xpu_available,
     logging,
 )
+from .cache import InMemoryPipelineCache, PipelineCache, SQLitePipelineCache
 
 
 GenericTensor = Union[list["GenericTensor"], "torch.Tensor", "tf.Tensor"]
 
+
 if is_tf_available():
     import tensorflow as tf
 
@@ -90,6 +99,49 @@ def no_collate_fn(items):
     return items[0]
 
 
+# Pipeline used by the current worker process of `Pipeline(num_processes=...)`, inherited through `fork`
+_process_pipeline = None
+
+
+def _init_pipeline_process(pipeline_ref, num_threads):
+    global _process_pipeline
+    _process_pipeline = pipeline_ref()
+    torch.set_num_threads(num_threads)
+
+
+def _run_pipeline_process(task):
+    inputs, batch_size, preprocess_params, forward_params, postprocess_params, iterator_kwargs = task
+    return list(
+        _process_pipeline.get_iterator(
+            inputs, 0, batch_size, preprocess_params, forward_params, postprocess_params, **iterator_kwargs
+        )
+    )
+
+
+def _update_cache_digest(digest, value):
+    """Feeds `value` (preprocessed model inputs) to `digest`, raising a `TypeError` for values that can't be hashed."""
+    if isinstance(value, torch.Tensor):
+        digest.update(f"tensor:{value.dtype}:{tuple(value.shape)}".encode())
+        digest.update(value.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy())
+    elif isinstance(value, np.ndarray):
+        digest.update(f"ndarray:{value.dtype}:{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value))
+    elif isinstance(value, (dict, UserDict)):
+        digest.update(f"{value.__class__.__name__}:{len(value)}".encode())
+        for key, item in value.items():
+            _update_cache_digest(digest, key)
+            _update_cache_digest(digest, item)
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{value.__class__.__name__}:{len(value)}".encode())
+        for item in value:
+            _update_cache_digest(digest, item)
+    else:
+        try:
+            digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except (pickle.PicklingError, AttributeError) as e:
+            raise TypeError(f"Can't hash {value.__class__.__name__}") from e
+
+
 def _pad(items, key, padding_value, padding_side):
     batch_size = len(items)
     if isinstance(items[0][key], torch.Tensor):
@@ -853,6 +905,33 @@ def build_pipeline_init_args(
             When the pipeline will use *DataLoader* (when passing a dataset, on GPU for a Pytorch model), the size of
             the batch to use, for inference this is not always beneficial, please read [Batching with
             pipelines](https://huggingface.co/transformers/main_classes/pipelines.html#pipeline-batching) .
+        max_batch_tokens (`int`, *optional*):
+            When the pipeline will use *DataLoader* (when passing a dataset, on GPU for a Pytorch model), batches
+            inputs dynamically instead of by `batch_size`: inputs are sorted by length within a window, and grouped
+            into batches of at most `max_batch_tokens` tokens, padding included. Outputs are returned in the order of
+            the inputs.
+        padding_free (`bool`, *optional*, defaults to `False`):
+            When the pipeline will use *DataLoader*, concatenates the sequences of a batch into a single row instead of
+            padding them, with `position_ids` restarting at every sequence and a block-diagonal attention mask. The
+            batch holds `batch_size` sequences, or as many consecutive sequences as fit in `max_batch_tokens`. Only
+            supported by pipelines relying on per-token outputs (e.g. `token-classification`, `fill-mask`,
+            `feature-extraction`) and by models accepting `position_ids` and 3D attention masks.
+        postprocess_workers (`int`, *optional*, defaults to 0):
+            When the pipeline will use *DataLoader*, the number of threads running `postprocess` while the next batches
+            go through the model. Preprocessing is then also run ahead in a background thread if `num_workers=0`, so
+            that the three stages overlap. Outputs are returned in the order of the inputs.
+        cache (`bool`, `str` or [`~pipelines.PipelineCache`], *optional*):
+            Caches the model outputs, keyed by a hash of the preprocessed inputs, of the model weights and of the
+            forward parameters, so that inputs seen before skip the model, and duplicated inputs within a batch only go
+            through it once. Postprocessing still runs on every input. `True` uses an in-memory [`~pipelines.InMemoryPipelineCache`],
+            a path uses an on-disk [`~pipelines.SQLitePipelineCache`] stored there. Only use it with deterministic
+            models and parameters (e.g. not with sampling), and with PyTorch models.
+        num_processes (`int`, *optional*, defaults to 1):
+            When the pipeline is given a list, a dataset or a generator, on CPU with a Pytorch model, the number of
+            worker processes to spread the batches across. The model weights are moved to shared memory once and the
+            workers are forked from the current process, so they all map the same weights instead of loading their
+            own copy. The intra-op threads are split between the workers. Outputs are returned in the order of the
+            inputs.
         args_parser ([`~pipelines.ArgumentHandler`], *optional*):
             Reference to the object in charge of parsing supplied pipeline parameters.
         device (`int`, *optional*, defaults to -1):
@@ -896,10 +975,15 @@ SUPPORTED_PEFT_TASKS = {
 
 if is_torch_available():
     from transformers.pipelines.pt_utils import (
+        PipelineCacheIterator,
         PipelineChunkIterator,
         PipelineDataset,
+        PipelineDynamicBatchIterator,
         PipelineIterator,
+        PipelinePackedIterator,
         PipelinePackIterator,
+        PipelinePrefetchIterator,
+        PipelineThreadPoolIterator,
     )
 
 
@@ -944,6 +1028,10 @@ class Pipeline(_ScikitCompat, PushToHubMixin):
     # Pipelines that call `generate` have shared logic, e.g. preparing the generation config.
     _pipeline_calls_generate = False
 
+    # Pipelines whose `_forward` and `postprocess` only use per-token outputs can pack sequences together instead of
+    # padding them, see `padding_free`.
+    _supports_padding_free = False
+
     default_input_names = None
 
     def __init__(
@@ -1106,6 +1194,14 @@ class Pipeline(_ScikitCompat, PushToHubMixin):
         self.call_count = 0
         self._batch_size = kwargs.pop("batch_size", None)
         self._num_workers = kwargs.pop("num_workers", None)
+        self._max_batch_tokens = kwargs.pop("max_batch_tokens", None)
+        self._padding_free = kwargs.pop("padding_free", False)
+        self._postprocess_workers = kwargs.pop("postprocess_workers", 0)
+        self._num_processes = kwargs.pop("num_processes", 1)
+        self._cache = self._get_cache(kwargs.pop("cache", None))
+        self._model_fingerprint = None
+        self._process_pool = None
+        self._process_pool_size = None
         self._preprocess_params, self._forward_params, self._postprocess_params = self._sanitize_parameters(**kwargs)
 
         # In processor only mode, we can get the modality processors from the processor
@@ -1375,7 +1471,16 @@ class Pipeline(_ScikitCompat, PushToHubMixin):
         return model_outputs
 
     def get_iterator(
-        self, inputs, num_workers: int, batch_size: int, preprocess_params, forward_params, postprocess_params
+        self,
+        inputs,
+        num_workers: int,
+        batch_size: int,
+        preprocess_params,
+        forward_params,
+        postprocess_params,
+        max_batch_tokens: Optional[int] = None,
+        padding_free: bool = False,
+        postprocess_workers: int = 0,
     ):
         if isinstance(inputs, collections.abc.Sized):
             dataset = PipelineDataset(inputs, self.preprocess, preprocess_params)
@@ -1393,13 +1498,197 @@ class Pipeline(_ScikitCompat, PushToHubMixin):
             os.environ["TOKENIZERS_PARALLELISM"] = "false"
         # TODO hack by collating feature_extractor and image_processor
         feature_extractor = self.feature_extractor if self.feature_extractor is not None else self.image_processor
-        collate_fn = no_collate_fn if batch_size == 1 else pad_collate_fn(self.tokenizer, feature_extractor)
-        dataloader = DataLoader(dataset, num_workers=num_workers, batch_size=batch_size, collate_fn=collate_fn)
-        model_iterator = PipelineIterator(dataloader, self.forward, forward_params, loader_batch_size=batch_size)
-        final_iterator = PipelineIterator(model_iterator, self.postprocess, postprocess_params)
+        # With postprocessing workers, preprocessing is also moved off the thread running the forward passes
+        prefetch = postprocess_workers > 0
+        if self._cache is not None:
+            dataloader = self._get_dataloader(dataset, num_workers, 1, no_collate_fn, prefetch=prefetch)
+            model_iterator = self._get_cache_iterator(
+                dataloader, forward_params, batch_size, max_batch_tokens, padding_free
+            )
+        elif padding_free:
+            dataloader = self._get_dataloader(dataset, num_workers, 1, no_collate_fn, prefetch=prefetch)
+            model_iterator = self._get_packed_iterator(dataloader, forward_params, batch_size, max_batch_tokens)
+        elif max_batch_tokens is not None:
+            # Items are preprocessed one by one, and batched by length after the DataLoader
+            dataloader = self._get_dataloader(dataset, num_workers, 1, no_collate_fn, prefetch=prefetch)
+            collate_fn = pad_collate_fn(self.tokenizer, feature_extractor)
+            model_iterator = PipelineDynamicBatchIterator(
+                dataloader, self.forward, forward_params, collate_fn, max_batch_tokens=max_batch_tokens
+            )
+        else:
+            collate_fn = no_collate_fn if batch_size == 1 else pad_collate_fn(self.tokenizer, feature_extractor)
+            dataloader = self._get_dataloader(dataset, num_workers, batch_size, collate_fn, prefetch=prefetch)
+            model_iterator = PipelineIterator(dataloader, self.forward, forward_params, loader_batch_size=batch_size)
+        final_iterator = self._get_postprocess_iterator(model_iterator, postprocess_params, postprocess_workers)
         return final_iterator
 
-    def __call__(self, inputs, *args, num_workers=None, batch_size=None, **kwargs):
+    def _get_cache(self, cache) -> Optional[PipelineCache]:
+        if cache is None or cache is False:
+            return None
+        if self.framework != "pt":
+            raise ValueError("`cache` is only supported for PyTorch pipelines.")
+        if cache is True:
+            return InMemoryPipelineCache()
+        if isinstance(cache, (str, os.PathLike)):
+            return SQLitePipelineCache(cache)
+        if not isinstance(cache, PipelineCache):
+            raise ValueError(
+                f"`cache` must be a boolean, a path or a `PipelineCache`, got {cache.__class__.__name__}."
+            )
+        return cache
+
+    def _get_model_fingerprint(self) -> str:
+        """
+        Identifies the weights of the model, so that cached outputs are never shared by different weights: the commit
+        of a model loaded from the Hub, the weight files of a model loaded from a local directory, and otherwise (e.g.
+        for a model built from a config) a hash of the state dict. Computed once, changing the weights in place
+        afterwards requires a new pipeline or clearing the cache.
+        """
+        if self._model_fingerprint is not None:
+            return self._model_fingerprint
+        commit_hash = getattr(self.model.config, "_commit_hash", None)
+        name_or_path = self.model.config._name_or_path
+        weight_files = []
+        if commit_hash is None and name_or_path and os.path.isdir(name_or_path):
+            weight_files = [
+                (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+                for entry in os.scandir(name_or_path)
+                if entry.name.endswith((".safetensors", ".bin", ".pt", ".pth"))
+            ]
+        if commit_hash is not None:
+            fingerprint = f"commit:{commit_hash}"
+        elif weight_files:
+            fingerprint = f"files:{sorted(weight_files)}"
+        else:
+            digest = hashlib.sha256()
+            for name, tensor in self.model.state_dict().items():
+                digest.update(name.encode())
+                _update_cache_digest(digest, tensor)
+            fingerprint = f"weights:{digest.hexdigest()}"
+        self._model_fingerprint = fingerprint
+        return fingerprint
+
+    def _get_cache_key_prefix(self, forward_params) -> Optional[str]:
+        """
+        Hashes everything besides the model inputs that the model outputs depend on, or returns `None` when the forward
+        parameters can't be hashed, in which case nothing is cached.
+        """
+        digest = hashlib.sha256()
+        try:
+            _update_cache_digest(
+                digest,
+                [
+                    self.__class__.__name__,
+                    self.model.__class__.__name__,
+                    self.model.config._name_or_path,
+                    self._get_model_fingerprint(),
+                    str(self.model.dtype),
+                    sorted(forward_params.items(), key=lambda item: item[0]),
+                ],
+            )
+        except TypeError:
+            logger.warning_once("The forward parameters of the pipeline can't be hashed, the cache is not used.")
+            return None
+        return digest.hexdigest()
+
+    def _get_cache_key(self, model_inputs, prefix: str) -> Optional[str]:
+        digest = hashlib.sha256(prefix.encode())
+        try:
+            _update_cache_digest(digest, model_inputs)
+        except TypeError:
+            return None
+        return digest.hexdigest()
+
+    def _get_cache_iterator(
+        self,
+        loader,
+        forward_params,
+        batch_size: int = 1,
+        max_batch_tokens: Optional[int] = None,
+        padding_free: bool = False,
+    ):
+        """
+        Wraps an iterator of (unbatched) preprocessed items into an iterator of their (unbatched) model outputs, where
+        only the items missing from `self._cache` go through the model, batched as they would be without the cache.
+        """
+
+        def model_iterator_fn(items):
+            if padding_free:
+                return self._get_packed_iterator(items, forward_params, batch_size, max_batch_tokens)
+            if batch_size == 1 and max_batch_tokens is None:
+                return PipelineIterator(items, self.forward, forward_params)
+            feature_extractor = self.feature_extractor if self.feature_extractor is not None else self.image_processor
+            collate_fn = pad_collate_fn(self.tokenizer, feature_extractor)
+            if max_batch_tokens is not None:
+                return PipelineDynamicBatchIterator(
+                    items, self.forward, forward_params, collate_fn, max_batch_tokens=max_batch_tokens
+                )
+            dataloader = DataLoader(items, batch_size=batch_size, collate_fn=collate_fn)
+            return PipelineIterator(dataloader, self.forward, forward_params, loader_batch_size=batch_size)
+
+        prefix = self._get_cache_key_prefix(forward_params)
+        if prefix is None:
+            get_key = lambda model_inputs: None  # noqa: E731
+        else:
+            get_key = functools.partial(self._get_cache_key, prefix=prefix)
+        # Same window as dynamic batching, so that the batches of missing items are as tight as without the cache
+        window_size = batch_size if max_batch_tokens is None else 512
+        return PipelineCacheIterator(loader, self._cache, get_key, model_iterator_fn, window_size=window_size)
+
+    def _get_dataloader(self, dataset, num_workers: int, batch_size: int, collate_fn, prefetch: bool = False):
+        dataloader = DataLoader(dataset, num_workers=num_workers, batch_size=batch_size, collate_fn=collate_fn)
+        if prefetch and num_workers == 0:
+            # Without DataLoader workers, preprocessing would run on the main thread between two forward passes
+            dataloader = PipelinePrefetchIterator(dataloader)
+        return dataloader
+
+    def _get_postprocess_iterator(self, model_iterator, postprocess_params, postprocess_workers: int):
+        if postprocess_workers > 0:
+            return PipelineThreadPoolIterator(
+                model_iterator, self.postprocess, postprocess_params, num_threads=postprocess_workers
+            )
+        return PipelineIterator(model_iterator, self.postprocess, postprocess_params)
+
+    def _get_packed_iterator(self, dataloader, forward_params, batch_size: int, max_batch_tokens: Optional[int]):
+        if not self._supports_padding_free:
+            raise ValueError(f"{self.__class__.__name__} does not support `padding_free`.")
+        if self.model.config._attn_implementation not in ("eager", "sdpa"):
+            raise ValueError(
+                "`padding_free` relies on a block-diagonal attention mask, which is not supported by the "
+                f"`{self.model.config._attn_implementation}` attention implementation. Load the model with "
+                "`attn_implementation='sdpa'` or `attn_implementation='eager'`."
+            )
+        forward_signature = inspect.signature(self.model.forward).parameters
+        if "position_ids" not in forward_signature:
+            raise ValueError(
+                f"`padding_free` requires a model accepting `position_ids`, {self.model.__class__.__name__} does not."
+            )
+        # RoBERTa-like embeddings count positions from `padding_idx + 1`
+        padding_idx = getattr(getattr(self.model.base_model, "embeddings", None), "padding_idx", None)
+        return PipelinePackedIterator(
+            dataloader,
+            self.forward,
+            forward_params,
+            # when batching by number of tokens, `batch_size` doesn't limit the number of sequences
+            max_batch_size=batch_size if max_batch_tokens is None else None,
+            max_batch_tokens=max_batch_tokens,
+            position_offset=0 if padding_idx is None else padding_idx + 1,
+            # the buffered default `token_type_ids` of BERT-like models are only as long as the position embeddings
+            add_token_type_ids="token_type_ids" in forward_signature,
+        )
+
+    def __call__(
+        self,
+        inputs,
+        *args,
+        num_workers=None,
+        batch_size=None,
+        max_batch_tokens=None,
+        padding_free=None,
+        postprocess_workers=None,
+        num_processes=None,
+        **kwargs,
+    ):
         if args:
             logger.warning(f"Ignoring args : {args}")
 
@@ -1413,6 +1702,14 @@ class Pipeline(_ScikitCompat, PushToHubMixin):
                 batch_size = 1
             else:
                 batch_size = self._batch_size
+        if max_batch_tokens is None:
+            max_batch_tokens = self._max_batch_tokens
+        if padding_free is None:
+            padding_free = self._padding_free
+        if postprocess_workers is None:
+            postprocess_workers = self._postprocess_workers
+        if num_processes is None:
+            num_processes = self._num_processes
 
         preprocess_params, forward_params, postprocess_params = self._sanitize_parameters(**kwargs)
 
@@ -1437,10 +1734,31 @@ class Pipeline(_ScikitCompat, PushToHubMixin):
         # TODO make the get_iterator work also for `tf` (and `flax`).
         can_use_iterator = self.framework == "pt" and (is_dataset or is_generator or is_list)
 
+        if num_processes > 1 and is_iterable:
+            outputs = self._run_in_processes(
+                inputs,
+                num_processes,
+                batch_size,
+                preprocess_params,
+                forward_params,
+                postprocess_params,
+                max_batch_tokens=max_batch_tokens,
+                padding_free=padding_free,
+                postprocess_workers=postprocess_workers,
+            )
+            return list(outputs) if is_list else outputs
         if is_list:
             if can_use_iterator:
                 final_iterator = self.get_iterator(
-                    inputs, num_workers, batch_size, preprocess_params, forward_params, postprocess_params
+                    inputs,
+                    num_workers,
+                    batch_size,
+                    preprocess_params,
+                    forward_params,
+                    postprocess_params,
+                    max_batch_tokens=max_batch_tokens,
+                    padding_free=padding_free,
+                    postprocess_workers=postprocess_workers,
                 )
                 outputs = list(final_iterator)
                 return outputs
@@ -1448,7 +1766,15 @@ class Pipeline(_ScikitCompat, PushToHubMixin):
                 return self.run_multi(inputs, preprocess_params, forward_params, postprocess_params)
         elif can_use_iterator:
             return self.get_iterator(
-                inputs, num_workers, batch_size, preprocess_params, forward_params, postprocess_params
+                inputs,
+                num_workers,
+                batch_size,
+                preprocess_params,
+                forward_params,
+                postprocess_params,
+                max_batch_tokens=max_batch_tokens,
+                padding_free=padding_free,
+                postprocess_workers=postprocess_workers,
             )
         elif is_iterable:
             return self.iterate(inputs, preprocess_params, forward_params, postprocess_params)
@@ -1456,19 +1782,73 @@ class Pipeline(_ScikitCompat, PushToHubMixin):
             return next(
                 iter(
                     self.get_iterator(
-                        [inputs], num_workers, batch_size, preprocess_params, forward_params, postprocess_params
+                        [inputs],
+                        num_workers,
+                        batch_size,
+                        preprocess_params,
+                        forward_params,
+                        postprocess_params,
+                        max_batch_tokens=max_batch_tokens,
+                        padding_free=padding_free,
+                        postprocess_workers=postprocess_workers,
                     )
                 )
             )
         else:
             return self.run_single(inputs, preprocess_params, forward_params, postprocess_params)
 
+    def _get_process_pool(self, num_processes: int):
+        if self.framework != "pt" or self.device.type != "cpu":
+            raise ValueError("`num_processes` is only supported for PyTorch pipelines running on CPU.")
+        if "fork" not in torch.multiprocessing.get_all_start_methods():
+            raise ValueError("`num_processes` relies on forking the current process, which this platform lacks.")
+        if self._process_pool is not None and self._process_pool_size != num_processes:
+            self._process_pool.terminate()
+            self._process_pool = None
+        if self._process_pool is None:
+            # The workers are forked after this, so they all map the same shared storage instead of copying the weights
+            self.model.share_memory()
+            num_threads = max(1, torch.get_num_threads() // num_processes)
+            # The workers only hold a weak reference to the pipeline, so that the pool does not keep it alive
+            self._process_pool = torch.multiprocessing.get_context("fork").Pool(
+                num_processes, initializer=_init_pipeline_process, initargs=(weakref.ref(self), num_threads)
+            )
+            self._process_pool_size = num_processes
+            weakref.finalize(self, self._process_pool.terminate)
+        return self._process_pool
+
+    def _run_in_processes(
+        self,
+        inputs,
+        num_processes: int,
+        batch_size: int,
+        preprocess_params,
+        forward_params,
+        postprocess_params,
+        **iterator_kwargs,
+    ):
+        """
+        Runs `get_iterator` in `num_processes` forked workers, sending them the inputs in groups of at least
+        `batch_size`, and returns an iterator over the outputs in the order of the inputs.
+        """
+        pool = self._get_process_pool(num_processes)
+        inputs = iter(inputs)
+        group_size = max(batch_size, 8)
+        tasks = (
+            (group, batch_size, preprocess_params, forward_params, postprocess_params, iterator_kwargs)
+            for group in iter(lambda: list(itertools.islice(inputs, group_size)), [])
+        )
+        return itertools.chain.from_iterable(pool.imap(_run_pipeline_process, tasks))
+
     def run_multi(self, inputs, preprocess_params, forward_params, postprocess_params):
         return [self.run_single(item, preprocess_params, forward_params, postprocess_params) for item in inputs]
 
     def run_single(self, inputs, preprocess_params, forward_params, postprocess_params):
         model_inputs = self.preprocess(inputs, **preprocess_params)
-        model_outputs = self.forward(model_inputs, **forward_params)
+        if self._cache is not None:
+            model_outputs = next(iter(self._get_cache_iterator([model_inputs], forward_params)))
+        else:
+            model_outputs = self.forward(model_inputs, **forward_params)
         outputs = self.postprocess(model_outputs, **postprocess_params)
         return outputs
 
@@ -1496,7 +1876,16 @@ class ChunkPipeline(Pipeline):
         return outputs
 
     def get_iterator(
-        self, inputs, num_workers: int, batch_size: int, preprocess_params, forward_params, postprocess_params
+        self,
+        inputs,
+        num_workers: int,
+        batch_size: int,
+        preprocess_params,
+        forward_params,
+        postprocess_params,
+        max_batch_tokens: Optional[int] = None,
+        padding_free: bool = False,
+        postprocess_workers: int = 0,
     ):
         if "TOKENIZERS_PARALLELISM" not in os.environ:
             logger.info("Disabling tokenizer parallelism, we're using DataLoader multithreading already")
@@ -1511,10 +1900,33 @@ class ChunkPipeline(Pipeline):
 
         # TODO hack by collating feature_extractor and image_processor
         feature_extractor = self.feature_extractor if self.feature_extractor is not None else self.image_processor
-        collate_fn = no_collate_fn if batch_size == 1 else pad_collate_fn(self.tokenizer, feature_extractor)
-        dataloader = DataLoader(dataset, num_workers=num_workers, batch_size=batch_size, collate_fn=collate_fn)
-        model_iterator = PipelinePackIterator(dataloader, self.forward, forward_params, loader_batch_size=batch_size)
-        final_iterator = PipelineIterator(model_iterator, self.postprocess, postprocess_params)
+        # With postprocessing workers, preprocessing is also moved off the thread running the forward passes
+        prefetch = postprocess_workers > 0
+        if self._cache is not None:
+            dataloader = self._get_dataloader(dataset, num_workers, 1, no_collate_fn, prefetch=prefetch)
+            chunk_iterator = self._get_cache_iterator(
+                dataloader, forward_params, batch_size, max_batch_tokens, padding_free
+            )
+            model_iterator = PipelinePackIterator(chunk_iterator, lambda item: item, {})
+        elif padding_free:
+            dataloader = self._get_dataloader(dataset, num_workers, 1, no_collate_fn, prefetch=prefetch)
+            chunk_iterator = self._get_packed_iterator(dataloader, forward_params, batch_size, max_batch_tokens)
+            model_iterator = PipelinePackIterator(chunk_iterator, lambda item: item, {})
+        elif max_batch_tokens is not None:
+            # Chunks are batched by length, then regrouped by input once they are back in order
+            dataloader = self._get_dataloader(dataset, num_workers, 1, no_collate_fn, prefetch=prefetch)
+            collate_fn = pad_collate_fn(self.tokenizer, feature_extractor)
+            chunk_iterator = PipelineDynamicBatchIterator(
+                dataloader, self.forward, forward_params, collate_fn, max_batch_tokens=max_batch_tokens
+            )
+            model_iterator = PipelinePackIterator(chunk_iterator, lambda item: item, {})
+        else:
+            collate_fn = no_collate_fn if batch_size == 1 else pad_collate_fn(self.tokenizer, feature_extractor)
+            dataloader = self._get_dataloader(dataset, num_workers, batch_size, collate_fn, prefetch=prefetch)
+            model_iterator = PipelinePackIterator(
+                dataloader, self.forward, forward_params, loader_batch_size=batch_size
+            )
+        final_iterator = self._get_postprocess_iterator(model_iterator, postprocess_params, postprocess_workers)
         return final_iterator
 
 
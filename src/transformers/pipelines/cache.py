@@ -0,0 +1,181 @@
+# coding=utf-8
+# Copyright 2025 The HuggingFace Inc. team.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Union
+
+
+class PipelineCache(ABC):
+    """
+    Base class for the caches of model outputs used by [`Pipeline`] when instantiated with `cache`. Keys are
+    hexadecimal digests of the preprocessed model inputs, and values are the serialized model outputs. When the total
+    size of the values exceeds `max_size` bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(self, max_size: int):
+        if max_size <= 0:
+            raise ValueError(f"`max_size` must be a positive number of bytes, got {max_size}.")
+        self.max_size = max_size
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the value stored for `key`, or `None` if there is none."""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes) -> None:
+        """Stores `value` for `key`, evicting the least recently used entries if the cache grows over `max_size`."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Removes all the entries of the cache."""
+
+
+class InMemoryPipelineCache(PipelineCache):
+    """
+    In-memory least recently used cache of model outputs, for [`Pipeline`].
+
+    Args:
+        max_size (`int`, *optional*, defaults to 1GB):
+            The maximum total size of the cached model outputs, in bytes.
+    """
+
+    def __init__(self, max_size: int = 2**30):
+        super().__init__(max_size)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_size:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class SQLitePipelineCache(PipelineCache):
+    """
+    On-disk least recently used cache of model outputs, for [`Pipeline`], stored in a SQLite database. The cache
+    persists across sessions and can be shared by several processes.
+
+    Args:
+        path (`str` or `os.PathLike`):
+            The path of the database file, created if it does not exist.
+        max_size (`int`, *optional*, defaults to 10GB):
+            The maximum total size of the cached model outputs, in bytes.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike], max_size: int = 10 * 2**30):
+        super().__init__(max_size)
+        self.path = os.fspath(path)
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not be shared with forked processes (e.g. the workers of `num_processes`)
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access INTEGER NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            # Total size of the values, kept up to date by `set` so that it never requires a full scan
+            self._connection.execute("CREATE TABLE IF NOT EXISTS total (size INTEGER NOT NULL)")
+            self._connection.execute(
+                "INSERT INTO total (size) SELECT COALESCE(SUM(size), 0) FROM entries "
+                "WHERE NOT EXISTS (SELECT 1 FROM total)"
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _next_access(self, connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT COALESCE(MAX(last_access), 0) + 1 FROM entries").fetchone()[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (self._next_access(connection), key)
+            )
+            return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_size:
+            return
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                previous = connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, len(value), self._next_access(connection)),
+                )
+                connection.execute(
+                    "UPDATE total SET size = size + ?", (len(value) - (previous[0] if previous else 0),)
+                )
+                excess = connection.execute("SELECT size FROM total").fetchone()[0] - self.max_size
+                if excess > 0:
+                    evicted, evicted_size = [], 0
+                    for evicted_key, size in connection.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                        if evicted_size >= excess:
+                            break
+                        evicted.append((evicted_key,))
+                        evicted_size += size
+                    connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+                    connection.execute("UPDATE total SET size = size - ?", (evicted_size,))
+
+    def clear(self) -> None:
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.execute("DELETE FROM entries")
+                connection.execute("UPDATE total SET size = 0")
@@ -1,16 +1,63 @@
-from typing import Any, Union
+import itertools
+import json
+import os
+from collections.abc import Iterable
+from typing import Any, Optional, Union
 
-from ..utils import add_end_docstrings
+import numpy as np
+
+from ..utils import add_end_docstrings, is_torch_available
 from .base import GenericTensor, Pipeline, build_pipeline_init_args
 
 
+if is_torch_available():
+    import torch
+
+
+SAFETENSORS_DTYPES = {np.dtype("float16"): "F16", np.dtype("float32"): "F32", np.dtype("float64"): "F64"}
+
+
+def _create_embeddings_file(path: str, shape: tuple[int, int], dtype: np.dtype) -> np.ndarray:
+    """Preallocates a file of `shape` embeddings (`.npy` or `.safetensors`) and memory-maps it."""
+    if not path.endswith(".safetensors"):
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+    if dtype not in SAFETENSORS_DTYPES:
+        raise ValueError(f"Can't save embeddings of dtype {dtype} with safetensors.")
+    nbytes = shape[0] * shape[1] * dtype.itemsize
+    header = json.dumps(
+        {"embeddings": {"dtype": SAFETENSORS_DTYPES[dtype], "shape": list(shape), "data_offsets": [0, nbytes]}}
+    ).encode()
+    # The data must start on an 8-byte boundary, the header is padded with spaces like safetensors does
+    header += b" " * (-len(header) % 8)
+    with open(path, "wb") as f:
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        f.truncate(8 + len(header) + nbytes)
+    return np.memmap(path, mode="r+", dtype=dtype, offset=8 + len(header), shape=shape)
+
+
+def _open_embeddings_file(path: str, mode: str = "r") -> np.ndarray:
+    """Memory-maps a file of embeddings created by [`FeatureExtractionPipeline.save_embeddings`]."""
+    if not path.endswith(".safetensors"):
+        return np.load(path, mmap_mode=mode)
+    with open(path, "rb") as f:
+        header_size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_size))["embeddings"]
+    dtype = {name: dtype for dtype, name in SAFETENSORS_DTYPES.items()}[header["dtype"]]
+    return np.memmap(path, mode=mode, dtype=dtype, offset=8 + header_size, shape=tuple(header["shape"]))
+
+
 @add_end_docstrings(
     build_pipeline_init_args(has_tokenizer=True, supports_binary_output=False),
     r"""
         tokenize_kwargs (`dict`, *optional*):
                 Additional dictionary of keyword arguments passed along to the tokenizer.
         return_tensors (`bool`, *optional*):
-            If `True`, returns a tensor according to the specified framework, otherwise returns a list.""",
+            If `True`, returns a tensor according to the specified framework, otherwise returns a list.
+        pooling (`str`, *optional*):
+            If set, pools the hidden states of every input into a single embedding on the device of the model, instead
+            of returning one feature vector per token. Can be one of `"mean"` (average over the non-padding tokens),
+            `"cls"` (first token) or `"last"` (last non-padding token). Only supported in PyTorch.""",
 )
 class FeatureExtractionPipeline(Pipeline):
     """
@@ -37,7 +84,9 @@ class FeatureExtractionPipeline(Pipeline):
     [huggingface.co/models](https://huggingface.co/models).
     """
 
-    def _sanitize_parameters(self, truncation=None, tokenize_kwargs=None, return_tensors=None, **kwargs):
+    _supports_padding_free = True
+
+    def _sanitize_parameters(self, truncation=None, tokenize_kwargs=None, return_tensors=None, pooling=None, **kwargs):
         if tokenize_kwargs is None:
             tokenize_kwargs = {}
 
@@ -50,28 +99,74 @@ class FeatureExtractionPipeline(Pipeline):
 
         preprocess_params = tokenize_kwargs
 
+        forward_params = {}
         postprocess_params = {}
+        if pooling is not None:
+            if pooling not in {"mean", "cls", "last"}:
+                raise ValueError(f"`pooling` must be one of 'mean', 'cls' or 'last', got {pooling}.")
+            if self.framework != "pt":
+                raise ValueError("`pooling` is only supported in PyTorch.")
+            forward_params["pooling"] = pooling
+            postprocess_params["pooling"] = pooling
         if return_tensors is not None:
             postprocess_params["return_tensors"] = return_tensors
 
-        return preprocess_params, {}, postprocess_params
+        return preprocess_params, forward_params, postprocess_params
 
     def preprocess(self, inputs, **tokenize_kwargs) -> dict[str, GenericTensor]:
         model_inputs = self.tokenizer(inputs, return_tensors=self.framework, **tokenize_kwargs)
         return model_inputs
 
-    def _forward(self, model_inputs):
+    def _forward(self, model_inputs, pooling=None):
         model_outputs = self.model(**model_inputs)
+        if pooling is not None:
+            # [0] is the first available tensor, logits or last_hidden_state.
+            return {"embeddings": self._pool(model_outputs[0], model_inputs, pooling)}
         return model_outputs
 
-    def postprocess(self, model_outputs, return_tensors=False):
+    def _pool(self, hidden_states, model_inputs, pooling):
+        attention_mask = model_inputs.get("attention_mask")
+        if attention_mask is not None and attention_mask.dim() == 3:
+            # Padding-free: the sequences are packed in a single row, with position ids restarting at every sequence.
+            # The embeddings are returned as a list, so that they are split back per sequence.
+            hidden_states = hidden_states[0]
+            position_ids = model_inputs["position_ids"][0]
+            starts = torch.ones_like(position_ids, dtype=torch.bool)
+            starts[1:] = position_ids[1:] <= position_ids[:-1]
+            if pooling == "mean":
+                sequence_ids = starts.cumsum(0) - 1
+                num_sequences = int(starts.sum())
+                sums = hidden_states.new_zeros((num_sequences, hidden_states.shape[-1]))
+                sums.index_add_(0, sequence_ids, hidden_states)
+                embeddings = sums / torch.bincount(sequence_ids, minlength=num_sequences)[:, None]
+            elif pooling == "cls":
+                embeddings = hidden_states[starts]
+            else:
+                ends = torch.cat([starts[1:], starts.new_ones(1)])
+                embeddings = hidden_states[ends]
+            return list(embeddings.split(1))
+
+        if pooling == "cls":
+            return hidden_states[:, 0]
+        if attention_mask is None:
+            return hidden_states.mean(dim=1) if pooling == "mean" else hidden_states[:, -1]
+        attention_mask = attention_mask.to(hidden_states.dtype)
+        if pooling == "mean":
+            masked_sum = (hidden_states * attention_mask[:, :, None]).sum(dim=1)
+            return masked_sum / attention_mask.sum(dim=1, keepdim=True).clamp(min=1)
+        # The last non-padding token, whatever the padding side
+        last_indices = attention_mask.shape[1] - 1 - attention_mask.flip(1).argmax(dim=1)
+        return hidden_states[torch.arange(hidden_states.shape[0], device=hidden_states.device), last_indices]
+
+    def postprocess(self, model_outputs, return_tensors=False, pooling=None):
         # [0] is the first available tensor, logits or last_hidden_state.
+        outputs = model_outputs["embeddings"] if pooling is not None else model_outputs[0]
         if return_tensors:
-            return model_outputs[0]
+            return outputs
         if self.framework == "pt":
-            return model_outputs[0].tolist()
+            return outputs.tolist()
         elif self.framework == "tf":
-            return model_outputs[0].numpy().tolist()
+            return outputs.numpy().tolist()
 
     def __call__(self, *args: Union[str, list[str]], **kwargs: Any) -> Union[Any, list[Any]]:
         """
@@ -84,3 +179,104 @@ class FeatureExtractionPipeline(Pipeline):
             A nested list of `float`: The features computed by the model.
         """
         return super().__call__(*args, **kwargs)
+
+    def save_embeddings(
+        self,
+        inputs: Iterable[str],
+        path: Union[str, os.PathLike],
+        pooling: str = "mean",
+        dtype: Union[str, np.dtype] = "float32",
+        num_inputs: Optional[int] = None,
+        resume: bool = True,
+        checkpoint_interval: int = 4096,
+        **kwargs,
+    ) -> np.ndarray:
+        """
+        Embeds a large number of texts straight into a memory-mapped file, with one row per text. The hidden states
+        are pooled on the device of the model, and every embedding is written into the preallocated file as a row of
+        `dtype`, without ever being converted to Python lists. The progress is saved regularly, so that an interrupted
+        run resumes where it stopped.
+
+        Args:
+            inputs (`Iterable[str]`):
+                The texts to embed, e.g. a list, a [`~datasets.Dataset`] column or a generator. Iterating over `inputs`
+                must give the same texts in the same order on every run for resuming to be correct.
+            path (`str` or `os.PathLike`):
+                The file to write the embeddings to, either a `.npy` file or a `.safetensors` file with a single
+                `"embeddings"` tensor of shape `(num_inputs, hidden_size)`.
+            pooling (`str`, *optional*, defaults to `"mean"`):
+                How the hidden states are pooled, one of `"mean"`, `"cls"` or `"last"`.
+            dtype (`str` or `np.dtype`, *optional*, defaults to `"float32"`):
+                The dtype of the saved embeddings.
+            num_inputs (`int`, *optional*):
+                The number of texts, required when `inputs` has no length (e.g. a generator).
+            resume (`bool`, *optional*, defaults to `True`):
+                Whether to resume from the progress saved by a previous run writing to `path`, or to start from
+                scratch.
+            checkpoint_interval (`int`, *optional*, defaults to 4096):
+                The number of embeddings written between two saves of the progress.
+            kwargs:
+                Additional keyword arguments passed along to the pipeline call, e.g. `batch_size` or
+                `max_batch_tokens`.
+
+        Return:
+            `np.ndarray`: The read-only memory-mapped embeddings, of shape `(num_inputs, hidden_size)`.
+        """
+        if self.framework != "pt":
+            raise ValueError("`save_embeddings` is only supported in PyTorch.")
+        if num_inputs is None:
+            if not hasattr(inputs, "__len__"):
+                raise ValueError("`num_inputs` is required when `inputs` has no length.")
+            num_inputs = len(inputs)
+        if num_inputs == 0:
+            raise ValueError("There are no inputs to embed.")
+        path = os.fspath(path)
+        dtype = np.dtype(dtype)
+        # The number of embeddings already written to `path`, only present while the file is incomplete
+        progress_path = f"{path}.progress"
+
+        embeddings = None
+        start = 0
+        if resume and os.path.exists(path):
+            if os.path.exists(progress_path):
+                with open(progress_path) as f:
+                    start = json.load(f)["num_rows"]
+            else:
+                start = num_inputs
+            embeddings = _open_embeddings_file(path, mode="r+" if start < num_inputs else "r")
+            if embeddings.shape[0] != num_inputs or embeddings.dtype != dtype:
+                raise ValueError(
+                    f"Can't resume writing {num_inputs} embeddings of dtype {dtype} to {path}, which holds "
+                    f"{embeddings.shape[0]} embeddings of dtype {embeddings.dtype}. Use `resume=False` to overwrite it."
+                )
+        elif os.path.exists(progress_path):
+            os.remove(progress_path)
+
+        def save_progress(num_rows):
+            embeddings.flush()
+            # Written to a temporary file first so that the progress is never corrupted by an interruption
+            with open(f"{progress_path}.tmp", "w") as f:
+                json.dump({"num_rows": num_rows}, f)
+            os.replace(f"{progress_path}.tmp", progress_path)
+
+        torch_dtype = torch.from_numpy(np.empty(0, dtype=dtype)).dtype
+        # A generator, so that the pipeline streams the outputs instead of gathering them in a list
+        remaining_inputs = (text for text in itertools.islice(inputs, start, num_inputs))
+        outputs = self(remaining_inputs, pooling=pooling, return_tensors=True, **kwargs)
+        row = start
+        for row, output in enumerate(outputs, start=start + 1):
+            if embeddings is None:
+                embeddings = _create_embeddings_file(path, (num_inputs, output.shape[-1]), dtype)
+                save_progress(0)
+            embeddings[row - 1] = output[0].to(torch_dtype).numpy()
+            if row % checkpoint_interval == 0 and row < num_inputs:
+                save_progress(row)
+
+        if row < num_inputs:
+            if embeddings is not None:
+                save_progress(row)
+            raise ValueError(f"`inputs` only holds {row} texts, less than `num_inputs={num_inputs}`.")
+        if embeddings is not None and start < num_inputs:
+            embeddings.flush()
+            os.remove(progress_path)
+        return _open_embeddings_file(path)
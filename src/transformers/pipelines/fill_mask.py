@@ -84,6 +84,8 @@ class FillMaskPipeline(Pipeline):
 
     """
 
+    _supports_padding_free = True
+
     def get_masked_index(self, input_ids: GenericTensor) -> np.ndarray:
         if self.framework == "tf":
             masked_index = tf.where(input_ids == self.tokenizer.mask_token_id).numpy()
@@ -1,10 +1,27 @@
+import copy
+import importlib
+import json
+import queue
+import struct
+import threading
+from collections import UserDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Optional
+
 import numpy as np
 import torch
+from safetensors.torch import load as safetensors_load
+from safetensors.torch import save as safetensors_save
 from torch.utils.data import Dataset, IterableDataset
 
+from ..utils import logging
 from ..utils.generic import ModelOutput
 
 
+logger = logging.get_logger(__name__)
+
+
 class PipelineDataset(Dataset):
     def __init__(self, dataset, process, params):
         self.dataset = dataset
@@ -151,6 +168,115 @@ class PipelineIterator(IterableDataset):
             return processed
 
 
+class PipelinePrefetchIterator(IterableDataset):
+    def __init__(self, loader, max_prefetch: int = 2):
+        """
+        Iterates over `loader` in a background thread, keeping up to `max_prefetch` items ready in a bounded queue, so
+        that producing the next items (e.g. preprocessing in a `DataLoader` without workers) overlaps with the
+        consumer (e.g. the forward pass). Exceptions raised by `loader` are raised again while iterating.
+
+                Arguments:
+                    loader (`torch.utils.data.DataLoader` or `Iterable`):
+                        The iterator to prefetch from.
+                    max_prefetch (`int`, *optional*, defaults to 2):
+                        The maximum number of items produced ahead of the consumer.
+        """
+        self.loader = loader
+        self.max_prefetch = max_prefetch
+
+    def __len__(self):
+        return len(self.loader)
+
+    def _produce(self, iterator, items: queue.Queue, stop: threading.Event):
+        try:
+            # Not a `for` loop, which would call `iter()` again: `PipelineIterator.__iter__` restarts the iteration
+            while True:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                while not stop.is_set():
+                    try:
+                        items.put((item, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            items.put((StopIteration, None))
+        except Exception as e:
+            items.put((None, e))
+
+    def __iter__(self):
+        # Like in `PipelineThreadPoolIterator`, the iterator of `loader` exists before the length of `self` is read
+        return self._iterate(iter(self.loader))
+
+    def _iterate(self, iterator):
+        items = queue.Queue(maxsize=self.max_prefetch)
+        stop = threading.Event()
+        threading.Thread(target=self._produce, args=(iterator, items, stop), daemon=True).start()
+        try:
+            while True:
+                item, exception = items.get()
+                if exception is not None:
+                    raise exception
+                if item is StopIteration:
+                    return
+                yield item
+        finally:
+            # also stops the producer when the consumer is closed early
+            stop.set()
+
+
+class PipelineThreadPoolIterator(PipelineIterator):
+    def __init__(self, loader, infer, params, num_threads: int, max_pending: Optional[int] = None):
+        """
+        Roughly equivalent to `PipelineIterator`, but `infer` runs in a pool of `num_threads` threads while the next
+        items of `loader` are produced, e.g. to postprocess outputs while the model runs the next forward pass. Up to
+        `max_pending` items are in flight at once, and results are returned in the order of `loader`.
+
+                Arguments:
+                    loader (`torch.utils.data.DataLoader` or `Iterable`):
+                        The iterator that will be used to apply `infer` on.
+                    infer (any function):
+                        The function to apply of each element of `loader`. It must be thread-safe.
+                    params (`dict`):
+                        The parameters passed to `infer` along with every item
+                    num_threads (`int`):
+                        The number of threads running `infer`.
+                    max_pending (`int`, *optional*):
+                        The maximum number of items submitted to the pool and not returned yet. Defaults to twice
+                        `num_threads`.
+        """
+        super().__init__(loader, infer, params)
+        self.num_threads = num_threads
+        self.max_pending = max_pending if max_pending is not None else 2 * num_threads
+
+    def __iter__(self):
+        # The iterator of `loader` is created right away, before `list()` asks for the length of `self`: a `DataLoader`
+        # over an `IterableDataset` whose length was read before creating its iterator warns for every extra item
+        return self._iterate(iter(self.loader))
+
+    def _iterate(self, iterator):
+        executor = ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix="pipeline")
+        pending = deque()
+        try:
+            # Not a `for` loop, which would call `iter()` again: `PipelineIterator.__iter__` restarts the iteration
+            while True:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                pending.append(executor.submit(self.infer, item, **self.params))
+                if len(pending) >= self.max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # also cancels the queued items when the consumer is closed early or `infer` raises
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
 class PipelineChunkIterator(PipelineIterator):
     def __init__(self, loader, infer, params, loader_batch_size=None):
         """
@@ -196,6 +322,405 @@ class PipelineChunkIterator(PipelineIterator):
         return processed
 
 
+class PipelineDynamicBatchIterator(PipelineIterator):
+    def __init__(self, loader, infer, params, collate_fn, max_batch_tokens: int, window_size: int = 512):
+        """
+        Roughly equivalent to
+
+        ```
+        for window in chunks of `window_size` items of loader:
+            outputs = {}
+            for indices in batches of `window` items of similar length, with at most `max_batch_tokens` tokens:
+                batch_outputs = infer(collate_fn([window[i] for i in indices]), **params)
+                for i, output in zip(indices, batch_outputs):
+                    outputs[i] = output
+            for i in range(len(window)):
+                yield outputs[i]
+        ```
+
+        Within a window, items are sorted by length (longest first) and batches are formed greedily so that the padded
+        batch, `batch_size * longest_length`, stays under `max_batch_tokens`. An item longer than the budget gets a
+        batch of its own. Items are yielded in the order of `loader`.
+
+                Arguments:
+                    loader (`torch.utils.data.DataLoader` or `Iterable`):
+                        The iterator of (unbatched) preprocessed items.
+                    infer (any function):
+                        The function to apply on every batch.
+                    params (`dict`):
+                        The parameters passed to `infer` along with every batch.
+                    collate_fn (any function):
+                        The function used to pad a list of items into a batch.
+                    max_batch_tokens (`int`):
+                        The maximum number of tokens, padding included, in a batch.
+                    window_size (`int`, *optional*, defaults to 512):
+                        The number of items sorted together. Larger windows give tighter batches, but delay the first
+                        outputs when iterating over a stream.
+        """
+        super().__init__(loader, infer, params)
+        self.collate_fn = collate_fn
+        self.max_batch_tokens = max_batch_tokens
+        self.window_size = window_size
+
+    def __iter__(self):
+        self.iterator = iter(self.loader)
+        self._window_outputs = deque()
+        return self
+
+    @staticmethod
+    def _get_item_length(item) -> int:
+        for key in ("input_ids", "input_values", "input_features"):
+            if key in item and isinstance(item[key], torch.Tensor):
+                return item[key].shape[-1]
+        raise ValueError(
+            "Batching by number of tokens requires preprocessed inputs with `input_ids`, `input_values` or "
+            f"`input_features`, got {list(item.keys())}."
+        )
+
+    def _get_batches(self, lengths: list[int]) -> list[list[int]]:
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches = []
+        for i in order:
+            # items come longest first, so the first item of a batch sets its padded length
+            if batches and (len(batches[-1]) + 1) * lengths[batches[-1][0]] <= self.max_batch_tokens:
+                batches[-1].append(i)
+            else:
+                batches.append([i])
+        return batches
+
+    def __next__(self):
+        if not self._window_outputs:
+            window = list(islice(self.iterator, self.window_size))
+            if not window:
+                raise StopIteration
+            outputs = [None] * len(window)
+            for indices in self._get_batches([self._get_item_length(item) for item in window]):
+                processed = self.infer(self.collate_fn([window[i] for i in indices]), **self.params)
+                # Unbatch with the same logic as `PipelineIterator`
+                self._loader_batch_data = processed[0] if isinstance(processed, tuple) else processed
+                self._loader_batch_index = 0
+                for i in indices:
+                    outputs[i] = self.loader_batch_item()
+            self._window_outputs.extend(outputs)
+        return self._window_outputs.popleft()
+
+
+def _encode_model_outputs(value, tensors: dict, inputs=None):
+    """
+    Encodes `value` as JSON-serializable data, moving its tensors and arrays to `tensors`. The values of a `value`
+    dictionary that are the very objects of `inputs` under the same key are only encoded as a reference to it.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (np.ndarray, np.generic)):
+        if value.dtype.kind not in "biuf":
+            raise TypeError(f"Can't serialize arrays of dtype {value.dtype}")
+        tensors[str(len(tensors))] = torch.from_numpy(np.array(value))
+        return {"ndarray" if isinstance(value, np.ndarray) else "scalar": len(tensors) - 1}
+    if isinstance(value, torch.Tensor):
+        # Copied so that no two tensors share their storage, which safetensors does not allow
+        tensors[str(len(tensors))] = value.detach().to("cpu", copy=True).contiguous()
+        return {"tensor": len(tensors) - 1}
+    if type(value) in (list, tuple):
+        return {value.__class__.__name__: [_encode_model_outputs(item, tensors) for item in value]}
+    if isinstance(value, (dict, UserDict)):
+        inputs = inputs if isinstance(inputs, (dict, UserDict)) else {}
+        items = [
+            [
+                _encode_model_outputs(key, tensors),
+                {"input": None} if key in inputs and item is inputs[key] else _encode_model_outputs(item, tensors),
+            ]
+            for key, item in value.items()
+        ]
+        if type(value) is dict:
+            return {"dict": items}
+        if not value.__class__.__module__.startswith("transformers."):
+            raise TypeError(f"Can't serialize {value.__class__.__name__}")
+        return {"dict": items, "class": f"{value.__class__.__module__}:{value.__class__.__qualname__}"}
+    raise TypeError(f"Can't serialize {value.__class__.__name__}")
+
+
+def _decode_model_outputs(value, tensors: dict, inputs=None):
+    if not isinstance(value, dict):
+        return value
+    if "tensor" in value:
+        return tensors[str(value["tensor"])]
+    if "ndarray" in value:
+        return tensors[str(value["ndarray"])].numpy()
+    if "scalar" in value:
+        return tensors[str(value["scalar"])].numpy()[()]
+    if "list" in value:
+        return [_decode_model_outputs(item, tensors) for item in value["list"]]
+    if "tuple" in value:
+        return tuple(_decode_model_outputs(item, tensors) for item in value["tuple"])
+    items = {}
+    for key, item in value["dict"]:
+        key = _decode_model_outputs(key, tensors)
+        items[key] = (
+            inputs[key] if isinstance(item, dict) and "input" in item else _decode_model_outputs(item, tensors)
+        )
+    if "class" not in value:
+        return items
+    # Only the dictionary classes of Transformers (e.g. `ModelOutput`) are rebuilt
+    module_name, class_name = value["class"].split(":")
+    if not module_name.startswith("transformers."):
+        raise ValueError(f"Can't deserialize {value['class']}")
+    cls = importlib.import_module(module_name)
+    for name in class_name.split("."):
+        cls = getattr(cls, name)
+    if not isinstance(cls, type) or not issubclass(cls, (dict, UserDict)):
+        raise ValueError(f"Can't deserialize {value['class']}")
+    return cls(**items) if issubclass(cls, ModelOutput) else cls(items)
+
+
+def serialize_model_outputs(outputs, inputs=None) -> bytes:
+    """
+    Serializes (unbatched) model outputs made of tensors, arrays, Python scalars, lists, tuples and dictionaries
+    (including `ModelOutput`) without pickle: the tensors are stored with safetensors, and the structure as JSON in its
+    metadata. Raises a `TypeError` for outputs holding any other object.
+
+    The values of an `outputs` dictionary passed through from the model `inputs` dictionary (the same object under the
+    same key, like the `SquadExample` of question answering) are not stored, but taken from the `inputs` given to
+    `deserialize_model_outputs`.
+    """
+    tensors = {}
+    structure = _encode_model_outputs(outputs, tensors, inputs=inputs)
+    return safetensors_save(tensors, metadata={"structure": json.dumps(structure)})
+
+
+def deserialize_model_outputs(data: bytes, inputs=None):
+    """Loads outputs serialized with `serialize_model_outputs`, with the values passed through from `inputs`."""
+    (header_size,) = struct.unpack("<Q", data[:8])
+    structure = json.loads(json.loads(data[8 : 8 + header_size])["__metadata__"]["structure"])
+    return _decode_model_outputs(structure, safetensors_load(data), inputs=inputs)
+
+
+class PipelineCacheIterator(IterableDataset):
+    def __init__(self, loader, cache, get_key: Callable, model_iterator_fn: Callable, window_size: int):
+        """
+        Roughly equivalent to
+
+        ```
+        for window in chunks of `window_size` items of loader:
+            keys = [get_key(item) for item in window]
+            missing = {key: item for key, item in zip(keys, window) if key not in cache}
+            for key, output in zip(missing, model_iterator_fn(list(missing.values()))):
+                cache[key] = output
+            for key in keys:
+                yield cache[key]
+        ```
+
+        Items sharing the same key within a window only go through the model once, and items whose key is `None`
+        always do. The outputs are stored serialized with `serialize_model_outputs`, without the values passed through
+        from the items (e.g. the `SquadExample` of question answering), and every cached output is yielded as a fresh
+        copy, so that postprocessing can modify it.
+
+                Arguments:
+                    loader (`torch.utils.data.DataLoader` or `Iterable`):
+                        The iterator of (unbatched) preprocessed items.
+                    cache ([`~pipelines.PipelineCache`]):
+                        The cache of serialized model outputs.
+                    get_key (any function):
+                        The function computing the cache key of an item, or `None` if the item can't be cached.
+                    model_iterator_fn (any function):
+                        The function returning an iterator of the (unbatched) model outputs of a list of items.
+                    window_size (`int`):
+                        The number of items looked up together.
+        """
+        self.loader = loader
+        self.cache = cache
+        self.get_key = get_key
+        self.model_iterator_fn = model_iterator_fn
+        self.window_size = window_size
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        # Like in `PipelineThreadPoolIterator`, the iterator of `loader` exists before the length of `self` is read
+        return self._iterate(iter(self.loader))
+
+    def _iterate(self, iterator):
+        while window := list(islice(iterator, self.window_size)):
+            keys = [self.get_key(item) for item in window]
+            cached = {}
+            missing = {}
+            for i, key in enumerate(keys):
+                if key is None:
+                    missing[i] = window[i]
+                elif key not in cached and key not in missing:
+                    value = self.cache.get(key)
+                    if value is None:
+                        missing[key] = window[i]
+                    else:
+                        cached[key] = value
+
+            outputs = {}
+            uncached = {}
+            model_outputs = self.model_iterator_fn(list(missing.values())) if missing else ()
+            for (key, item), output in zip(missing.items(), model_outputs):
+                if isinstance(key, str):
+                    try:
+                        cached[key] = serialize_model_outputs(output, inputs=item)
+                        self.cache.set(key, cached[key])
+                    except TypeError as e:
+                        # Not cached, but still computed once for the items of the window sharing the key
+                        logger.warning_once(f"The model outputs can't be cached: {e}.")
+                        uncached[key] = copy.deepcopy(output)
+                outputs[key] = output
+
+            for i, key in enumerate(keys):
+                if key is None:
+                    yield outputs.pop(i)
+                elif key in outputs:
+                    # The first item with this key gets the output itself, the next ones get copies
+                    yield outputs.pop(key)
+                elif key in uncached:
+                    yield copy.deepcopy(uncached[key])
+                else:
+                    # The values passed through from the item are its own, like without cache
+                    yield deserialize_model_outputs(cached[key], inputs=window[i])
+
+
+class PipelinePackedIterator(PipelineIterator):
+    def __init__(
+        self,
+        loader,
+        infer,
+        params,
+        max_batch_size: Optional[int] = None,
+        max_batch_tokens: Optional[int] = None,
+        position_offset: int = 0,
+        add_token_type_ids: bool = False,
+    ):
+        """
+        Roughly equivalent to
+
+        ```
+        for items in groups of consecutive items of loader:
+            outputs = infer(pack(items), **params)
+            yield from unpack(outputs)
+        ```
+
+        but without any padding: the `input_ids` (and every other per-token input) of a group are concatenated into a
+        single row, with `position_ids` restarting at every sequence and a block-diagonal `attention_mask` so that
+        sequences don't attend to each other. Per-token outputs are split back per sequence; outputs over the whole
+        row (e.g. pooled outputs) are dropped since they are not defined per sequence.
+
+                Arguments:
+                    loader (`torch.utils.data.DataLoader` or `Iterable`):
+                        The iterator of (unbatched) preprocessed items.
+                    infer (any function):
+                        The function to apply on every packed group.
+                    params (`dict`):
+                        The parameters passed to `infer` along with every packed group.
+                    max_batch_size (`int`, *optional*):
+                        The maximum number of sequences packed together.
+                    max_batch_tokens (`int`, *optional*):
+                        The maximum number of tokens packed together. A sequence longer than this is packed alone.
+                    position_offset (`int`, *optional*, defaults to 0):
+                        The position id of the first token of a sequence.
+                    add_token_type_ids (`bool`, *optional*, defaults to `False`):
+                        Whether to add all-zero `token_type_ids` when the items don't have any.
+        """
+        super().__init__(loader, infer, params)
+        if max_batch_size is None and max_batch_tokens is None:
+            raise ValueError("Packing sequences requires `max_batch_size` or `max_batch_tokens`.")
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.position_offset = position_offset
+        self.add_token_type_ids = add_token_type_ids
+
+    def __iter__(self):
+        self.iterator = iter(self.loader)
+        self._next_item = None
+        self._outputs = deque()
+        return self
+
+    def _next_group(self) -> list:
+        items = []
+        num_tokens = 0
+        while self.max_batch_size is None or len(items) < self.max_batch_size:
+            if self._next_item is None:
+                try:
+                    self._next_item = next(self.iterator)
+                except StopIteration:
+                    break
+            length = self._next_item["input_ids"].shape[-1]
+            if items and self.max_batch_tokens is not None and num_tokens + length > self.max_batch_tokens:
+                break
+            items.append(self._next_item)
+            num_tokens += length
+            self._next_item = None
+        if not items:
+            raise StopIteration
+        return items
+
+    def _pack(self, items: list, lengths: list[int]) -> dict:
+        packed = {}
+        for key in items[0].keys():
+            values = [item[key] for item in items]
+            if key == "attention_mask":
+                continue
+            if isinstance(values[0], torch.Tensor) and all(
+                value.dim() >= 2 and value.shape[1] == length for value, length in zip(values, lengths)
+            ):
+                packed[key] = torch.cat(values, dim=1)
+            else:
+                packed[key] = values
+
+        sequence_ids = torch.repeat_interleave(torch.arange(len(lengths)), torch.tensor(lengths))
+        attention_mask_dtype = items[0]["attention_mask"].dtype if "attention_mask" in items[0] else torch.long
+        packed["attention_mask"] = (sequence_ids[None, :, None] == sequence_ids[None, None, :]).to(
+            attention_mask_dtype
+        )
+        packed["position_ids"] = torch.cat([torch.arange(length) for length in lengths])[None] + self.position_offset
+        if self.add_token_type_ids and "token_type_ids" not in packed:
+            packed["token_type_ids"] = torch.zeros_like(packed["position_ids"])
+        return packed
+
+    @classmethod
+    def _unpack_value(cls, key, value, index: int, start: int, end: int, num_tokens: int, num_sequences: int):
+        if isinstance(value, torch.Tensor):
+            if key == "attention_mask":
+                return value.new_ones((1, end - start))
+            if value.dim() >= 2 and value.shape[0] == 1 and value.shape[1] == num_tokens:
+                return value[:, start:end]
+            return None
+        if isinstance(value, tuple):
+            # e.g. `hidden_states`
+            unpacked = tuple(
+                cls._unpack_value(None, element, index, start, end, num_tokens, num_sequences) for element in value
+            )
+            return None if any(element is None for element in unpacked) else unpacked
+        if isinstance(value, list) and len(value) == num_sequences:
+            return value[index]
+        return value
+
+    def _unpack(self, processed, lengths: list[int]) -> list:
+        processed = processed[0] if isinstance(processed, tuple) else processed
+        num_tokens = sum(lengths)
+        outputs = []
+        start = 0
+        for index, length in enumerate(lengths):
+            unpacked = {
+                key: self._unpack_value(key, value, index, start, start + length, num_tokens, len(lengths))
+                for key, value in processed.items()
+            }
+            # Recreate the element by reusing the original class, like `PipelineIterator.loader_batch_item`
+            outputs.append(processed.__class__(unpacked))
+            start += length
+        return outputs
+
+    def __next__(self):
+        if not self._outputs:
+            items = self._next_group()
+            lengths = [item["input_ids"].shape[-1] for item in items]
+            processed = self.infer(self._pack(items, lengths), **self.params)
+            self._outputs.extend(self._unpack(processed, lengths))
+        return self._outputs.popleft()
+
+
 class PipelinePackIterator(PipelineIterator):
     """
     Roughly equivalent to
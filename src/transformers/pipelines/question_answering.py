@@ -147,6 +147,65 @@ def select_starts_ends(
     return starts, ends, scores, min_null_score
 
 
+def select_starts_ends_batched(
+    start: "torch.Tensor",
+    end: "torch.Tensor",
+    p_mask: "torch.Tensor",
+    attention_mask: Optional["torch.Tensor"] = None,
+    top_k: int = 1,
+    handle_impossible_answer: bool = False,
+    max_answer_len: int = 15,
+) -> tuple:
+    """
+    Batched PyTorch equivalent of `select_starts_ends()`, decoding the spans of all the chunks of a document at once.
+    Rather than the full `(seq_len, seq_len)` outer product of start and end probabilities, only the band of spans no
+    longer than `max_answer_len` is computed, before taking the `top_k` spans of every chunk.
+
+    Args:
+        start (`torch.Tensor` of shape `(num_chunks, seq_len)`): Individual start logits for each token.
+        end (`torch.Tensor` of shape `(num_chunks, seq_len)`): Individual end logits for each token.
+        p_mask (`torch.Tensor` of shape `(num_chunks, seq_len)`): A mask with 1 for values that cannot be in the
+            answer, including the padding of shorter chunks.
+        attention_mask (`torch.Tensor` of shape `(num_chunks, seq_len)`, *optional*): The attention mask generated by
+            the tokenizer.
+        top_k (`int`): Indicates how many possible answer span(s) to extract from each chunk.
+        handle_impossible_answer(`bool`): Whether to allow null (empty) answers
+        max_answer_len (`int`): Maximum size of the answer to extract from the model's output.
+
+    Returns:
+        `tuple(torch.Tensor)`: the `starts`, `ends` and `scores` of shape `(num_chunks, top_k)` of the best spans of
+        every chunk, sorted by decreasing score, a boolean mask of the same shape with `False` for spans that are not
+        valid answers, and the minimum null (empty) answer score over the chunks.
+    """
+    desired_tokens = p_mask == 0
+    if attention_mask is not None:
+        desired_tokens &= attention_mask.bool()
+
+    # Make sure non-context indexes in the tensor cannot contribute to the softmax
+    start = torch.where(desired_tokens, start.float(), -10000.0).softmax(-1)
+    end = torch.where(desired_tokens, end.float(), -10000.0).softmax(-1)
+
+    min_null_score = 1000000  # large and positive
+    if handle_impossible_answer:
+        min_null_score = min(min_null_score, (start[:, 0] * end[:, 0]).min().item())
+
+    # Mask CLS
+    start[:, 0] = end[:, 0] = 0.0
+
+    # scores[:, i, j] is the score of the span starting at token i and ending at token i + j
+    num_chunks, seq_len = start.shape
+    end_band = torch.nn.functional.pad(end, (0, max_answer_len - 1)).unfold(-1, max_answer_len, 1)
+    scores = (start.unsqueeze(-1) * end_band).flatten(1)
+
+    scores, indices = scores.topk(min(top_k, scores.shape[-1]), dim=-1)
+    starts = torch.div(indices, max_answer_len, rounding_mode="floor")
+    ends = starts + indices % max_answer_len
+
+    desired_tokens = torch.nn.functional.pad(desired_tokens, (0, max_answer_len - 1))
+    is_valid = desired_tokens.gather(1, starts) & desired_tokens.gather(1, ends)
+    return starts, ends, scores, is_valid, min_null_score
+
+
 class QuestionAnsweringArgumentHandler(ArgumentHandler):
     """
     QuestionAnsweringPipeline requires the user to provide multiple arguments (i.e. question & context) to be mapped to
@@ -536,27 +595,40 @@ class QuestionAnsweringPipeline(ChunkPipeline):
         max_answer_len=15,
         align_to_words=True,
     ):
-        min_null_score = 1000000  # large and positive
-        answers = []
-        for output in model_outputs:
-            if self.framework == "pt" and output["start"].dtype == torch.bfloat16:
-                start_ = output["start"].to(torch.float32)
-                end_ = output["end"].to(torch.float32)
-            else:
-                start_ = output["start"]
-                end_ = output["end"]
-            example = output["example"]
-            p_mask = output["p_mask"]
-            attention_mask = (
-                output["attention_mask"].numpy() if output.get("attention_mask", None) is not None else None
+        if self.framework == "pt":
+            spans, min_null_score = self._select_spans_pt(
+                model_outputs, top_k, handle_impossible_answer, max_answer_len
             )
+        else:
+            min_null_score = 1000000  # large and positive
+            spans = []
+            for output in model_outputs:
+                attention_mask = (
+                    output["attention_mask"].numpy() if output.get("attention_mask", None) is not None else None
+                )
+                starts, ends, scores, min_null_score = select_starts_ends(
+                    output["start"],
+                    output["end"],
+                    output["p_mask"],
+                    attention_mask,
+                    min_null_score,
+                    top_k,
+                    handle_impossible_answer,
+                    max_answer_len,
+                )
+                spans.append((starts.tolist(), ends.tolist(), scores.tolist()))
 
-            starts, ends, scores, min_null_score = select_starts_ends(
-                start_, end_, p_mask, attention_mask, min_null_score, top_k, handle_impossible_answer, max_answer_len
-            )
+        answers = []
+        # answers found in several chunks are merged on their lowercased text
+        answers_by_text = {}
+        char_to_word = None
+        for output, (starts, ends, scores) in zip(model_outputs, spans):
+            example = output["example"]
 
             if not self.tokenizer.is_fast:
-                char_to_word = np.array(example.char_to_word_offset)
+                if char_to_word is None:
+                    # all the chunks come from the same example
+                    char_to_word = np.array(example.char_to_word_offset)
 
                 # Convert the answer (tokens) back to the original text
                 # Score: score from the model
@@ -565,11 +637,12 @@ class QuestionAnsweringPipeline(ChunkPipeline):
                 # Answer: Plain text of the answer
                 for s, e, score in zip(starts, ends, scores):
                     token_to_orig_map = output["token_to_orig_map"]
+                    # `char_to_word` is sorted: look up the first and last characters of the words with a binary search
                     answers.append(
                         {
-                            "score": score.item(),
-                            "start": np.where(char_to_word == token_to_orig_map[s])[0][0].item(),
-                            "end": np.where(char_to_word == token_to_orig_map[e])[0][-1].item(),
+                            "score": score,
+                            "start": np.searchsorted(char_to_word, token_to_orig_map[s], side="left").item(),
+                            "end": np.searchsorted(char_to_word, token_to_orig_map[e], side="right").item() - 1,
                             "answer": " ".join(example.doc_tokens[token_to_orig_map[s] : token_to_orig_map[e] + 1]),
                         }
                     )
@@ -603,19 +676,19 @@ class QuestionAnsweringPipeline(ChunkPipeline):
                     start_index, end_index = self.get_indices(enc, s, e, sequence_index, align_to_words)
 
                     target_answer = example.context_text[start_index:end_index]
-                    answer = self.get_answer(answers, target_answer)
+                    answer = answers_by_text.get(target_answer.lower())
 
                     if answer:
-                        answer["score"] += score.item()
+                        answer["score"] += score
                     else:
-                        answers.append(
-                            {
-                                "score": score.item(),
-                                "start": start_index,
-                                "end": end_index,
-                                "answer": example.context_text[start_index:end_index],
-                            }
-                        )
+                        answer = {
+                            "score": score,
+                            "start": start_index,
+                            "end": end_index,
+                            "answer": example.context_text[start_index:end_index],
+                        }
+                        answers.append(answer)
+                        answers_by_text[target_answer.lower()] = answer
 
         if handle_impossible_answer:
             answers.append({"score": min_null_score, "start": 0, "end": 0, "answer": ""})
@@ -624,6 +697,39 @@ class QuestionAnsweringPipeline(ChunkPipeline):
             return answers[0]
         return answers
 
+    def _select_spans_pt(self, model_outputs, top_k, handle_impossible_answer, max_answer_len):
+        """
+        Decodes the best spans of all the chunks of a document with `select_starts_ends_batched()`, and returns the
+        `(starts, ends, scores)` of the valid ones as lists for every chunk, along with the minimum null answer score.
+        """
+
+        def pad(key, padding_value):
+            tensors = [torch.as_tensor(output[key]).reshape(-1) for output in model_outputs]
+            return torch.nn.utils.rnn.pad_sequence(tensors, batch_first=True, padding_value=padding_value)
+
+        # Chunks that were not padded to the same length are padded here, and masked out through `p_mask`
+        has_attention_mask = all(output.get("attention_mask", None) is not None for output in model_outputs)
+        starts, ends, scores, is_valid, min_null_score = select_starts_ends_batched(
+            pad("start", 0.0),
+            pad("end", 0.0),
+            pad("p_mask", 1),
+            attention_mask=pad("attention_mask", 0) if has_attention_mask else None,
+            top_k=top_k,
+            handle_impossible_answer=handle_impossible_answer,
+            max_answer_len=max_answer_len,
+        )
+        spans = []
+        for chunk_starts, chunk_ends, chunk_scores, chunk_is_valid in zip(
+            starts.tolist(), ends.tolist(), scores.tolist(), is_valid.tolist()
+        ):
+            spans.append(
+                tuple(
+                    [value for value, valid in zip(values, chunk_is_valid) if valid]
+                    for values in (chunk_starts, chunk_ends, chunk_scores)
+                )
+            )
+        return spans, min_null_score
+
     def get_answer(self, answers: list[dict], target: str) -> Optional[dict]:
         for answer in answers:
             if answer["answer"].lower() == target.lower():
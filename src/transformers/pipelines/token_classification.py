@@ -134,6 +134,8 @@ class TokenClassificationPipeline(ChunkPipeline):
     [huggingface.co/models](https://huggingface.co/models?filter=token-classification).
     """
 
+    _supports_padding_free = True
+
     default_input_names = "sequences"
 
     def __init__(self, args_parser=TokenClassificationArgumentHandler(), *args, **kwargs):
@@ -388,24 +390,37 @@ class TokenClassificationPipeline(ChunkPipeline):
                 input_ids = input_ids.numpy()
                 offset_mapping = offset_mapping.numpy() if offset_mapping is not None else None
 
-            pre_entities = self.gather_pre_entities(
-                sentence,
-                input_ids,
-                scores,
-                offset_mapping,
-                special_tokens_mask,
-                aggregation_strategy,
-                word_ids=word_ids,
-                word_to_chars_map=word_to_chars_map,
-            )
-            grouped_entities = self.aggregate(pre_entities, aggregation_strategy)
-            # Filter anything that is in self.ignore_labels
-            entities = [
-                entity
-                for entity in grouped_entities
-                if entity.get("entity", None) not in ignore_labels
-                and entity.get("entity_group", None) not in ignore_labels
-            ]
+            if offset_mapping is not None:
+                entities = self.aggregate_from_offsets(
+                    sentence,
+                    input_ids,
+                    scores,
+                    offset_mapping,
+                    special_tokens_mask,
+                    aggregation_strategy,
+                    ignore_labels,
+                    word_ids=word_ids,
+                    word_to_chars_map=word_to_chars_map,
+                )
+            else:
+                pre_entities = self.gather_pre_entities(
+                    sentence,
+                    input_ids,
+                    scores,
+                    offset_mapping,
+                    special_tokens_mask,
+                    aggregation_strategy,
+                    word_ids=word_ids,
+                    word_to_chars_map=word_to_chars_map,
+                )
+                grouped_entities = self.aggregate(pre_entities, aggregation_strategy)
+                # Filter anything that is in self.ignore_labels
+                entities = [
+                    entity
+                    for entity in grouped_entities
+                    if entity.get("entity", None) not in ignore_labels
+                    and entity.get("entity_group", None) not in ignore_labels
+                ]
             all_entities.extend(entities)
         num_chunks = len(all_outputs)
         if num_chunks > 1:
@@ -505,6 +520,135 @@ class TokenClassificationPipeline(ChunkPipeline):
             pre_entities.append(pre_entity)
         return pre_entities
 
+    def aggregate_from_offsets(
+        self,
+        sentence: str,
+        input_ids: np.ndarray,
+        scores: np.ndarray,
+        offset_mapping: Union[np.ndarray, list[tuple[int, int]]],
+        special_tokens_mask: np.ndarray,
+        aggregation_strategy: AggregationStrategy,
+        ignore_labels: list[str],
+        word_ids: Optional[list[Optional[int]]] = None,
+        word_to_chars_map: Optional[list[tuple[int, int]]] = None,
+    ) -> list[dict]:
+        """
+        Vectorized equivalent of `gather_pre_entities`, `aggregate` and the `ignore_labels` filtering, used when the
+        token offsets are available. Labels, word boundaries and entity groups are computed on arrays for the whole
+        sequence, and dicts (and decoded words) are only built for the entities that are returned.
+        """
+        token_indices = np.flatnonzero(np.asarray(special_tokens_mask) == 0)
+        if len(token_indices) == 0:
+            return []
+        input_ids = np.asarray(input_ids)[token_indices]
+        scores = scores[token_indices]
+        offsets = np.asarray(offset_mapping, dtype=np.int64)[token_indices]
+        starts, ends = offsets[:, 0], offsets[:, 1]
+        # If the input is pre-tokenized, we need to rescale the offsets to the absolute sentence.
+        if word_ids is not None and word_to_chars_map is not None:
+            shifts = np.array([0 if word is None else word_to_chars_map[word][0] for word in word_ids])[token_indices]
+            starts, ends = starts + shifts, ends + shifts
+
+        tokens = self.tokenizer.convert_ids_to_tokens(input_ids.tolist())
+        is_unk = input_ids == self.tokenizer.unk_token_id
+        for idx in np.flatnonzero(is_unk):
+            tokens[idx] = sentence[starts[idx] : ends[idx]]
+
+        if aggregation_strategy in {AggregationStrategy.NONE, AggregationStrategy.SIMPLE}:
+            label_ids = scores.argmax(axis=-1)
+            entity_scores = scores[np.arange(len(scores)), label_ids]
+            words = tokens
+            word_starts, word_ends = starts, ends
+        else:
+            if getattr(self.tokenizer, "_tokenizer", None) and getattr(
+                self.tokenizer._tokenizer.model, "continuing_subword_prefix", None
+            ):
+                # This is a BPE, word aware tokenizer: a token is a subword when it differs from its span in the text
+                is_subword = np.array([len(token) for token in tokens]) != ends - starts
+            else:
+                # Same fallback heuristic as `gather_pre_entities`: a subword is not preceded by a space
+                warnings.warn("Tokenizer does not support real words, using fallback heuristic", UserWarning)
+                is_space = np.append(np.frombuffer(sentence.encode("utf-32-le"), dtype=np.uint32) == ord(" "), False)
+                is_subword = (starts > 0) & ~is_space[starts - 1] & ~is_space[starts]
+            is_subword &= ~is_unk
+            is_subword[0] = False
+
+            # Each word is the range of tokens `word_first_tokens[i]:word_last_tokens[i] + 1`
+            word_first_tokens = np.flatnonzero(~is_subword)
+            word_last_tokens = np.append(word_first_tokens[1:], len(tokens)) - 1
+            if aggregation_strategy == AggregationStrategy.FIRST:
+                word_scores = scores[word_first_tokens]
+            elif aggregation_strategy == AggregationStrategy.MAX:
+                token_max = scores.max(axis=-1)
+                word_index = np.cumsum(~is_subword) - 1
+                is_word_max = token_max == np.maximum.reduceat(token_max, word_first_tokens)[word_index]
+                candidates = np.flatnonzero(is_word_max)
+                _, first_candidates = np.unique(word_index[candidates], return_index=True)
+                word_scores = scores[candidates[first_candidates]]
+            elif aggregation_strategy == AggregationStrategy.AVERAGE:
+                is_valid = ~np.isnan(scores)
+                word_scores = np.add.reduceat(np.where(is_valid, scores, 0), word_first_tokens, axis=0)
+                word_scores = (word_scores / np.add.reduceat(is_valid, word_first_tokens, axis=0)).astype(scores.dtype)
+            else:
+                raise ValueError("Invalid aggregation_strategy")
+            label_ids = word_scores.argmax(axis=-1)
+            entity_scores = word_scores[np.arange(len(word_scores)), label_ids]
+            words = None
+            word_starts, word_ends = starts[word_first_tokens], ends[word_last_tokens]
+
+        id2label = self.model.config.id2label
+        if aggregation_strategy == AggregationStrategy.NONE:
+            return [
+                {
+                    "entity": id2label[label_id],
+                    "score": entity_scores[idx],
+                    "index": int(token_indices[idx]),
+                    "word": tokens[idx],
+                    "start": int(starts[idx]),
+                    "end": int(ends[idx]),
+                }
+                for idx, label_id in enumerate(label_ids.tolist())
+                if id2label[label_id] not in ignore_labels
+            ]
+
+        # Same grouping as `group_entities`: a new group starts on a tag change or on a "B-" label
+        num_labels = scores.shape[-1]
+        label_tags = [self.get_tag(id2label[label_id]) for label_id in range(num_labels)]
+        tag_ids = {tag: tag_id for tag_id, tag in enumerate(dict.fromkeys(tag for _, tag in label_tags))}
+        label_tag_ids = np.array([tag_ids[tag] for _, tag in label_tags])
+        label_is_b = np.array([bi == "B" for bi, _ in label_tags])
+        unit_tag_ids = label_tag_ids[label_ids]
+        is_group_start = np.ones(len(label_ids), dtype=bool)
+        is_group_start[1:] = (unit_tag_ids[1:] != unit_tag_ids[:-1]) | label_is_b[label_ids[1:]]
+        group_starts = np.flatnonzero(is_group_start)
+        group_ends = np.append(group_starts[1:], len(label_ids))
+        is_valid = ~np.isnan(entity_scores)
+        group_scores = np.add.reduceat(np.where(is_valid, entity_scores, 0), group_starts)
+        group_scores = (group_scores / np.add.reduceat(is_valid, group_starts)).astype(entity_scores.dtype)
+
+        entity_groups = []
+        for group_idx, (start, end) in enumerate(zip(group_starts.tolist(), group_ends.tolist())):
+            entity_group = id2label[int(label_ids[start])].split("-", 1)[-1]
+            if entity_group in ignore_labels:
+                continue
+            if words is None:
+                group_words = [
+                    self.tokenizer.convert_tokens_to_string(tokens[word_first_tokens[i] : word_last_tokens[i] + 1])
+                    for i in range(start, end)
+                ]
+            else:
+                group_words = words[start:end]
+            entity_groups.append(
+                {
+                    "entity_group": entity_group,
+                    "score": group_scores[group_idx],
+                    "word": self.tokenizer.convert_tokens_to_string(group_words),
+                    "start": int(word_starts[start]),
+                    "end": int(word_ends[end - 1]),
+                }
+            )
+        return entity_groups
+
     def aggregate(self, pre_entities: list[dict], aggregation_strategy: AggregationStrategy) -> list[dict]:
         if aggregation_strategy in {AggregationStrategy.NONE, AggregationStrategy.SIMPLE}:
             entities = []
@@ -3,6 +3,7 @@ from typing import Union
 
 import numpy as np
 
+from ..data.data_collator import pad_without_fast_tokenizer_warning
 from ..tokenization_utils import TruncationStrategy
 from ..utils import add_end_docstrings, logging
 from .base import ArgumentHandler, ChunkPipeline, build_pipeline_init_args
@@ -84,6 +85,9 @@ class ZeroShotClassificationPipeline(ChunkPipeline):
 
     def __init__(self, args_parser=ZeroShotClassificationArgumentHandler(), *args, **kwargs):
         self._args_parser = args_parser
+        # hypothesis -> token ids, reused across calls with `batch_candidate_labels=True`
+        self._hypothesis_ids_cache = {}
+        self._supports_pair_from_ids = None
         super().__init__(*args, **kwargs)
         if self.entailment_id == -1:
             logger.warning(
@@ -140,6 +144,54 @@ class ZeroShotClassificationPipeline(ChunkPipeline):
 
         return inputs
 
+    def _parse_and_tokenize_from_ids(self, sequence, hypotheses):
+        """
+        Tokenizes the (`sequence`, hypothesis) pairs of all the candidate labels into a single padded batch. The
+        sequence is only tokenized once, and the hypotheses are cached across calls, so that only the special tokens
+        and the truncation of the sequence are applied per pair.
+        """
+        if self.tokenizer.pad_token is None:
+            # Tokenize the same way as `_parse_and_tokenize`, which sets the padding token
+            return self._parse_and_tokenize([[sequence, hypothesis] for hypothesis in hypotheses])
+        if self._supports_pair_from_ids is None:
+            # Not every tokenizer builds the special tokens of a pair from token ids the same way it does from text
+            reference = self.tokenizer([sequence], [hypotheses[0]], truncation=TruncationStrategy.ONLY_FIRST)
+            encoding = self._encode_pair_from_ids(sequence, hypotheses[:1])[0]
+            self._supports_pair_from_ids = all(
+                encoding.get(key) == value[0] for key, value in reference.items() if key in encoding
+            )
+            if not self._supports_pair_from_ids:
+                logger.warning(
+                    f"{self.tokenizer.__class__.__name__} can't build a sequence pair from token ids, "
+                    "`batch_candidate_labels` will tokenize every pair instead of reusing the tokenized sequence."
+                )
+        if not self._supports_pair_from_ids:
+            return self._parse_and_tokenize([[sequence, hypothesis] for hypothesis in hypotheses])
+        encodings = self._encode_pair_from_ids(sequence, hypotheses)
+        return pad_without_fast_tokenizer_warning(
+            self.tokenizer, encodings, padding=True, return_tensors=self.framework
+        )
+
+    def _encode_pair_from_ids(self, sequence, hypotheses):
+        # the sequence is only truncated once paired with a hypothesis
+        sequence_ids = self.tokenizer.encode(sequence, add_special_tokens=False, verbose=False)
+        if len(self._hypothesis_ids_cache) > 10_000:
+            # label sets are usually small and fixed, don't grow forever when they are not
+            self._hypothesis_ids_cache.clear()
+        for hypothesis in hypotheses:
+            if hypothesis not in self._hypothesis_ids_cache:
+                self._hypothesis_ids_cache[hypothesis] = self.tokenizer.encode(hypothesis, add_special_tokens=False)
+        return [
+            # the attention mask is added when padding the batch
+            self.tokenizer.prepare_for_model(
+                sequence_ids,
+                self._hypothesis_ids_cache[hypothesis],
+                truncation=TruncationStrategy.ONLY_FIRST,
+                return_attention_mask=False,
+            )
+            for hypothesis in hypotheses
+        ]
+
     def _sanitize_parameters(self, **kwargs):
         if kwargs.get("multi_class", None) is not None:
             kwargs["multi_label"] = kwargs["multi_class"]
@@ -152,6 +204,8 @@ class ZeroShotClassificationPipeline(ChunkPipeline):
             preprocess_params["candidate_labels"] = self._args_parser._parse_labels(kwargs["candidate_labels"])
         if "hypothesis_template" in kwargs:
             preprocess_params["hypothesis_template"] = kwargs["hypothesis_template"]
+        if "batch_candidate_labels" in kwargs:
+            preprocess_params["batch_candidate_labels"] = kwargs["batch_candidate_labels"]
 
         postprocess_params = {}
         if "multi_label" in kwargs:
@@ -186,6 +240,11 @@ class ZeroShotClassificationPipeline(ChunkPipeline):
                 the sum of the label likelihoods for each sequence is 1. If `True`, the labels are considered
                 independent and probabilities are normalized for each candidate by doing a softmax of the entailment
                 score vs. the contradiction score.
+            batch_candidate_labels (`bool`, *optional*, defaults to `False`):
+                Whether or not to score all the candidate labels of a sequence in a single forward pass. The sequence
+                is tokenized once and the tokenized hypotheses are cached across calls, which pays off with many
+                candidate labels, or when the same labels are used over and over. The batch of a sequence is made of
+                all its candidate labels, so `batch_size` and `max_batch_tokens` are ignored.
 
         Return:
             A `dict` or a list of `dict`: Each result comes as a dictionary with the following keys:
@@ -201,11 +260,33 @@ class ZeroShotClassificationPipeline(ChunkPipeline):
         else:
             raise ValueError(f"Unable to understand extra arguments {args}")
 
+        batch_candidate_labels = kwargs.get(
+            "batch_candidate_labels", self._preprocess_params.get("batch_candidate_labels", False)
+        )
+        if batch_candidate_labels and (
+            kwargs.get("batch_size", self._batch_size) not in (None, 1)
+            or kwargs.get("max_batch_tokens", self._max_batch_tokens) is not None
+        ):
+            logger.warning(
+                "With `batch_candidate_labels=True`, every sequence is a batch of its candidate labels, "
+                "ignoring `batch_size` and `max_batch_tokens`."
+            )
+            kwargs["batch_size"] = 1
+            kwargs["max_batch_tokens"] = None
+
         return super().__call__(sequences, **kwargs)
 
-    def preprocess(self, inputs, candidate_labels=None, hypothesis_template="This example is {}."):
+    def preprocess(
+        self, inputs, candidate_labels=None, hypothesis_template="This example is {}.", batch_candidate_labels=False
+    ):
         sequence_pairs, sequences = self._args_parser(inputs, candidate_labels, hypothesis_template)
 
+        if batch_candidate_labels:
+            hypotheses = [hypothesis for _, hypothesis in sequence_pairs]
+            model_input = self._parse_and_tokenize_from_ids(sequences[0], hypotheses)
+            yield {"candidate_label": list(candidate_labels), "sequence": sequences[0], "is_last": True, **model_input}
+            return
+
         for i, (candidate_label, sequence_pair) in enumerate(zip(candidate_labels, sequence_pairs)):
             model_input = self._parse_and_tokenize([sequence_pair])
 
@@ -235,7 +316,11 @@ class ZeroShotClassificationPipeline(ChunkPipeline):
         return model_outputs
 
     def postprocess(self, model_outputs, multi_label=False):
-        candidate_labels = [outputs["candidate_label"] for outputs in model_outputs]
+        candidate_labels = []
+        for outputs in model_outputs:
+            # a list when all the candidate labels went through the model as a single batch
+            candidate_label = outputs["candidate_label"]
+            candidate_labels.extend(candidate_label if isinstance(candidate_label, list) else [candidate_label])
         sequences = [outputs["sequence"] for outputs in model_outputs]
         if self.framework == "pt":
             logits = np.concatenate([output["logits"].float().numpy() for output in model_outputs])
@@ -87,6 +87,7 @@ from .trainer_callback import (
     TrainerState,
 )
 from .trainer_pt_utils import (
+    AsyncCheckpointWriter,
     DistributedTensorGatherer,
     EvalLoopContainer,
     IterableDatasetShard,
@@ -94,6 +95,8 @@ from .trainer_pt_utils import (
     LayerWiseDummyOptimizer,
     LengthGroupedSampler,
     SequentialDistributedSampler,
+    StreamingMetric,
+    TokenBudgetBatchSampler,
     distributed_broadcast_scalars,
     distributed_concat,
     find_batch_size,
@@ -101,8 +104,10 @@ from .trainer_pt_utils import (
     get_module_class_from_name,
     get_parameter_names,
     nested_concat,
+    nested_cpu_clone,
     nested_detach,
     nested_numpify,
+    nested_truncate,
     nested_xla_mesh_reduce,
     reissue_pt_warnings,
     remove_dummy_checkpoint,
@@ -372,6 +377,10 @@ class Trainer:
             `True`, your compute_metrics function must take a boolean `compute_result` argument. This will be triggered
             after the last eval batch to signal that the function needs to calculate and return the global summary
             statistics rather than accumulating the batch-level statistics
+
+            It can also be a [`~trainer_pt_utils.StreamingMetric`], which is updated with every evaluation batch on the
+            device of the model and reduced across processes at the end of evaluation, so the predictions are never
+            accumulated.
         callbacks (List of [`TrainerCallback`], *optional*):
             A list of callbacks to customize the training loop. Will add those to the list of default callbacks
             detailed in [here](callback).
@@ -436,7 +445,11 @@ class Trainer:
             output_dir = "tmp_trainer"
             logger.info(f"No `TrainingArguments` passed, using `output_dir={output_dir}`.")
             args = TrainingArguments(output_dir=output_dir)
-        if args.batch_eval_metrics and compute_metrics is not None:
+        if (
+            args.batch_eval_metrics
+            and compute_metrics is not None
+            and not isinstance(compute_metrics, StreamingMetric)
+        ):
             if "compute_result" not in inspect.signature(compute_metrics).parameters.keys():
                 raise ValueError(
                     "When using `batch_eval_metrics`, your `compute_metrics` function must take a `compute_result`"
@@ -687,6 +700,9 @@ class Trainer:
         # Will be set to True by `self._setup_loggers()` on first call to `self.log()`.
         self._loggers_initialized = False
 
+        # Writes the checkpoints in the background when `args.save_async` is set, created on the first save
+        self._checkpoint_writer = None
+
         # Create distant repo and output directory if needed
         self.hub_model_id = None
         if self.args.push_to_hub:
@@ -712,6 +728,14 @@ class Trainer:
             and args.group_by_length
         ):
             raise ValueError("the `--group_by_length` option is only available for `Dataset`, not `IterableDataset")
+        if (
+            train_dataset is not None
+            and isinstance(train_dataset, torch.utils.data.IterableDataset)
+            and args.max_tokens_per_batch is not None
+        ):
+            raise ValueError(
+                "the `--max_tokens_per_batch` option is only available for `Dataset`, not `IterableDataset`"
+            )
 
         self._signature_columns = None
 
@@ -969,7 +993,7 @@ class Trainer:
             return None
 
         # Build the sampler.
-        if self.args.group_by_length:
+        if self.args.group_by_length or self.args.max_tokens_per_batch is not None:
             if is_datasets_available() and isinstance(train_dataset, datasets.Dataset):
                 lengths = (
                     train_dataset[self.args.length_column_name]
@@ -981,6 +1005,16 @@ class Trainer:
             model_input_name = (
                 self.processing_class.model_input_names[0] if self.processing_class is not None else None
             )
+            if self.args.max_tokens_per_batch is not None:
+                # Every process gets one of the batches at each step, so they are identical on all processes
+                return TokenBudgetBatchSampler(
+                    self.args.max_tokens_per_batch,
+                    dataset=train_dataset,
+                    lengths=lengths,
+                    model_input_name=model_input_name,
+                    num_replicas=self.args.world_size,
+                    seed=self.args.data_seed if self.args.data_seed is not None else self.args.seed,
+                )
             return LengthGroupedSampler(
                 self.args.train_batch_size * self.args.gradient_accumulation_steps,
                 dataset=train_dataset,
@@ -1017,9 +1051,15 @@ class Trainer:
         }
 
         if not isinstance(dataset, torch.utils.data.IterableDataset):
-            if sampler_fn is not None:
-                dataloader_params["sampler"] = sampler_fn(dataset)
-            dataloader_params["drop_last"] = self.args.dataloader_drop_last
+            sampler = sampler_fn(dataset) if sampler_fn is not None else None
+            if isinstance(sampler, TokenBudgetBatchSampler):
+                # The sampler yields whole batches, of a varying number of samples
+                dataloader_params["batch_sampler"] = sampler
+                del dataloader_params["batch_size"]
+            else:
+                if sampler is not None:
+                    dataloader_params["sampler"] = sampler
+                dataloader_params["drop_last"] = self.args.dataloader_drop_last
             dataloader_params["prefetch_factor"] = self.args.dataloader_prefetch_factor
             if is_training:
                 dataloader_params["worker_init_fn"] = partial(
@@ -2272,6 +2312,13 @@ class Trainer:
             len_dataloader,
             max_steps,
         ) = self.set_initial_training_values(args, train_dataloader, total_train_batch_size)
+        if args.max_tokens_per_batch is not None and epoch_based and len_dataloader is not None:
+            logger.warning(
+                "With `max_tokens_per_batch`, the number of batches varies from epoch to epoch, but the number of "
+                f"training steps ({max_steps}) and the learning rate schedule are computed from the {len_dataloader} "
+                "batches of the first epoch: the last epoch may stop early, or end before the schedule. Set "
+                "`max_steps` to choose the number of training steps."
+            )
 
         num_train_tokens = None
         if self.args.include_tokens_per_second:
@@ -2463,6 +2510,11 @@ class Trainer:
             epoch_dataloader = train_dataloader
             if hasattr(epoch_dataloader, "set_epoch"):
                 epoch_dataloader.set_epoch(epoch)
+            # In distributed training, a custom batch sampler is wrapped in a `BatchSamplerShard` which does not
+            # forward the epoch, but every process needs the same batches to take its share of them
+            sharded_batch_sampler = getattr(getattr(epoch_dataloader, "batch_sampler", None), "batch_sampler", None)
+            if hasattr(sharded_batch_sampler, "set_epoch"):
+                sharded_batch_sampler.set_epoch(epoch)
 
             # Reset the past mems state at the beginning of each epoch if necessary.
             if args.past_index >= 0:
@@ -2481,7 +2533,9 @@ class Trainer:
             rng_to_sync = False
             steps_skipped = 0
             if steps_trained_in_current_epoch > 0:
-                epoch_dataloader = skip_first_batches(epoch_dataloader, steps_trained_in_current_epoch)
+                # A stateful dataloader resumes where it stopped, the others have to go over the trained batches
+                if not self._load_dataloader_state(epoch_dataloader, resume_from_checkpoint):
+                    epoch_dataloader = skip_first_batches(epoch_dataloader, steps_trained_in_current_epoch)
                 steps_skipped = steps_trained_in_current_epoch
                 steps_trained_in_current_epoch = 0
                 rng_to_sync = True
@@ -2675,6 +2729,7 @@ class Trainer:
             delattr(self, "_past")
 
         logger.info("\n\nTraining completed. Do not forget to share your model on huggingface.co/models =)\n\n")
+        self._finish_pending_checkpoints()
         if args.load_best_model_at_end and self.state.best_model_checkpoint is not None:
             # Wait for everyone to get here so we are sure the model has been saved by process 0.
             if is_torch_xla_available():
@@ -3197,20 +3252,32 @@ class Trainer:
 
         run_dir = self._get_output_dir(trial=trial)
         output_dir = os.path.join(run_dir, checkpoint_folder)
-        self.save_model(output_dir, _internal_call=True)
+        if self.args.save_async:
+            # Everything is written to a temporary folder, renamed to `output_dir` by the background writer once done
+            snapshot = self._snapshot_checkpoint()
+            tmp_output_dir = os.path.join(run_dir, f"tmp-{checkpoint_folder}")
+        else:
+            self.save_model(output_dir, _internal_call=True)
 
         if self.args.save_strategy in [SaveStrategy.STEPS, SaveStrategy.EPOCH] and self.state.best_global_step:
             best_checkpoint_folder = f"{PREFIX_CHECKPOINT_DIR}-{self.state.best_global_step}"
             best_checkpoint_dir = os.path.join(run_dir, best_checkpoint_folder)
 
-            if os.path.exists(best_checkpoint_dir):
+            if os.path.exists(best_checkpoint_dir) or best_checkpoint_dir == output_dir:
                 self.state.best_model_checkpoint = best_checkpoint_dir
 
-        if not self.args.save_only_model:
+        if self.args.save_async:
+            if not self.args.save_only_model:
+                self._save_dataloader_state(tmp_output_dir)
+                self._save_rng_state(tmp_output_dir)
+                # The checkpoint is finalized once every process has saved its own states
+                self.accelerator.wait_for_everyone()
+        elif not self.args.save_only_model:
             # Save optimizer and scheduler
             self._save_optimizer_and_scheduler(output_dir)
             self._save_scaler(output_dir)
-            # Save RNG state
+            # Save dataloader and RNG state
+            self._save_dataloader_state(output_dir)
             self._save_rng_state(output_dir)
 
         # Save the Trainer state
@@ -3225,7 +3292,23 @@ class Trainer:
                     self.state.stateful_callbacks[cb_name].append(cb_state)
                 else:
                     self.state.stateful_callbacks[cb_name] = cb_state
-            self.state.save_to_json(os.path.join(output_dir, TRAINER_STATE_NAME))
+            if self.args.save_async:
+                snapshot["trainer_state"] = copy.deepcopy(self.state)
+            else:
+                self.state.save_to_json(os.path.join(output_dir, TRAINER_STATE_NAME))
+
+        if self.args.save_async:
+            if self.args.should_save:
+                if self._checkpoint_writer is None:
+                    self._checkpoint_writer = AsyncCheckpointWriter(max_pending=self.args.save_async_max_pending)
+                self._checkpoint_writer.submit(self._write_checkpoint, snapshot, tmp_output_dir, output_dir, run_dir)
+            elif not self.args.save_only_model and self.args.local_process_index == 0:
+                self._finalize_local_checkpoint(tmp_output_dir, output_dir)
+            if self.args.push_to_hub:
+                # The checkpoint has to be complete to be pushed
+                self._finish_pending_checkpoints()
+                self._push_from_checkpoint(output_dir)
+            return
 
         if self.args.push_to_hub:
             self._push_from_checkpoint(output_dir)
@@ -3235,6 +3318,109 @@ class Trainer:
             # we use mtime as default, filesystems without mtime support will be detected in `_sorted_checkpoints`
             self._rotate_checkpoints(use_mtime=True, output_dir=run_dir)
 
+    def _snapshot_checkpoint(self) -> dict[str, Any]:
+        """
+        Copies to the CPU the states saved in a checkpoint by the main process, for `args.save_async`. The RNG states
+        are saved right away by every process.
+        """
+        snapshot = {}
+        if not self.args.should_save:
+            return snapshot
+        snapshot["model"] = nested_cpu_clone(self.model.state_dict())
+        if not self.args.save_only_model:
+            snapshot["optimizer"] = nested_cpu_clone(self.optimizer.state_dict())
+            snapshot["scheduler"] = nested_cpu_clone(self.lr_scheduler.state_dict())
+            scaler = getattr(self.accelerator, "scaler", None)
+            if scaler is not None:
+                snapshot["scaler"] = nested_cpu_clone(scaler.state_dict())
+        return snapshot
+
+    def _write_checkpoint(self, snapshot: dict[str, Any], tmp_output_dir: str, output_dir: str, run_dir: str):
+        """
+        Writes a checkpoint from a snapshot taken by `_snapshot_checkpoint`, in the background thread of
+        `args.save_async`. The checkpoint is moved to `output_dir` once complete, then older checkpoints are rotated.
+        """
+        self._save(tmp_output_dir, state_dict=snapshot["model"])
+        if "optimizer" in snapshot:
+            torch.save(snapshot["optimizer"], os.path.join(tmp_output_dir, OPTIMIZER_NAME))
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            if "scheduler" in snapshot:
+                torch.save(snapshot["scheduler"], os.path.join(tmp_output_dir, SCHEDULER_NAME))
+            if "scaler" in snapshot:
+                torch.save(snapshot["scaler"], os.path.join(tmp_output_dir, SCALER_NAME))
+        reissue_pt_warnings(caught_warnings)
+        if "trainer_state" in snapshot:
+            snapshot["trainer_state"].save_to_json(os.path.join(tmp_output_dir, TRAINER_STATE_NAME))
+
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(tmp_output_dir, output_dir)
+        # we use mtime as default, filesystems without mtime support will be detected in `_sorted_checkpoints`
+        self._rotate_checkpoints(use_mtime=True, output_dir=run_dir)
+
+    def _finalize_local_checkpoint(self, tmp_output_dir: str, output_dir: str):
+        """
+        Moves the states saved with `args.save_async` by the processes of a node that doesn't share the filesystem of
+        the main process to `output_dir`, as they are saved without `args.save_async`, since no writer renames the
+        temporary folder there.
+        """
+        # On a shared filesystem, the folder either holds the RNG state of the main process or was already renamed by
+        # its writer, so the file has to be checked before the folder
+        if os.path.isfile(os.path.join(tmp_output_dir, "rng_state_0.pth")) or not os.path.isdir(tmp_output_dir):
+            return
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(tmp_output_dir, output_dir)
+
+    def _finish_pending_checkpoints(self):
+        """Waits for the checkpoints written in the background with `args.save_async`."""
+        if self._checkpoint_writer is not None:
+            self._checkpoint_writer.wait()
+
+    def _get_dataloader_state_file(self, checkpoint):
+        if self.args.world_size <= 1:
+            return os.path.join(checkpoint, "dataloader_state.pth")
+        return os.path.join(checkpoint, f"dataloader_state_{self.args.process_index}.pth")
+
+    def _save_dataloader_state(self, output_dir):
+        """
+        Saves the position of the training dataloader in the current epoch, when it is stateful (see
+        `accelerator_config.use_stateful_dataloader`), so that resuming from `output_dir` doesn't replay the epoch.
+        """
+        dataloader = self.callback_handler.train_dataloader
+        if not self.args.accelerator_config.use_stateful_dataloader or not hasattr(dataloader, "state_dict"):
+            return
+
+        # Like the RNG states, every process saves the state of its own dataloader
+        os.makedirs(output_dir, exist_ok=True)
+        dataloader_state_file = self._get_dataloader_state_file(output_dir)
+        torch.save(dataloader.state_dict(), f"{dataloader_state_file}.tmp")
+        os.replace(f"{dataloader_state_file}.tmp", dataloader_state_file)
+
+    def _load_dataloader_state(self, dataloader, checkpoint) -> bool:
+        """
+        Restores the position of `dataloader` saved in `checkpoint` by `_save_dataloader_state`. Returns whether it
+        was restored, otherwise the batches already trained on have to be skipped.
+        """
+        if (
+            checkpoint is None
+            or not self.args.accelerator_config.use_stateful_dataloader
+            or not hasattr(dataloader, "load_state_dict")
+        ):
+            return False
+
+        dataloader_state_file = self._get_dataloader_state_file(checkpoint)
+        if not os.path.isfile(dataloader_state_file):
+            logger.info(
+                f"Didn't find a dataloader state in {checkpoint}, the batches already trained on in the current epoch "
+                "will be skipped by iterating over them."
+            )
+            return False
+
+        with safe_globals():
+            dataloader.load_state_dict(torch.load(dataloader_state_file))
+        return True
+
     def _save_rng_state(self, output_dir):
         # Save RNG state in non-distributed training
         rng_states = {
@@ -4377,6 +4563,14 @@ class Trainer:
         metrics = None
         eval_set_kwargs = {}
 
+        # Streaming metrics are updated on device, the predictions and labels are then only kept for `predict`
+        streaming_metric = self.compute_metrics if isinstance(self.compute_metrics, StreamingMetric) else None
+        if streaming_metric is not None:
+            streaming_metric.reset()
+            streaming_metric.to(args.device)
+            if not streaming_metric.requires_logits and description != "Prediction":
+                prediction_loss_only = True
+
         # Will be useful when we have an iterable dataset so don't know its length.
         observed_num_examples = 0
 
@@ -4400,6 +4594,13 @@ class Trainer:
             if is_torch_xla_available():
                 xm.mark_step()
 
+            if streaming_metric is not None:
+                self._update_streaming_metric(
+                    streaming_metric, losses, logits, labels, observed_batch_size or batch_size
+                )
+                if description != "Prediction":
+                    logits, labels = None, None
+
             # Update containers
             if losses is not None:
                 losses = self.gather_function(losses.repeat(batch_size))
@@ -4427,7 +4628,12 @@ class Trainer:
             self.control = self.callback_handler.on_prediction_step(args, self.state, self.control)
 
             if self.args.batch_eval_metrics:
-                if self.compute_metrics is not None and logits is not None and labels is not None:
+                if (
+                    streaming_metric is None
+                    and self.compute_metrics is not None
+                    and logits is not None
+                    and labels is not None
+                ):
                     is_last_step = self.accelerator.gradient_state.end_of_dataloader
                     batch_kwargs = {}
                     batch_kwargs["losses"] = losses if "loss" in args.include_for_metrics else None
@@ -4478,7 +4684,10 @@ class Trainer:
             num_samples = observed_num_examples
 
         # Metrics!
-        if (
+        if streaming_metric is not None:
+            streaming_metric.sync(self.accelerator.gather)
+            metrics = streaming_metric.compute()
+        elif (
             self.compute_metrics is not None
             and all_preds is not None
             and all_labels is not None
@@ -4511,6 +4720,25 @@ class Trainer:
 
         return EvalLoopOutput(predictions=all_preds, label_ids=all_labels, metrics=metrics, num_samples=num_samples)
 
+    def _update_streaming_metric(self, metric: StreamingMetric, losses, logits, labels, batch_size: int):
+        """
+        Updates `metric` with the outputs of an evaluation step on the current process, leaving out the samples that
+        the last batch repeats to have the same number of samples on all processes (like `gather_for_metrics` does).
+        """
+        gradient_state = self.accelerator.gradient_state
+        if gradient_state.end_of_dataloader and gradient_state.remainder > 0:
+            # Once gathered, the samples of process `i` come after those of processes `0` to `i - 1`
+            num_samples = gradient_state.remainder - self.accelerator.process_index * batch_size
+            num_samples = min(max(num_samples, 0), batch_size)
+            if num_samples < batch_size:
+                logits = nested_truncate(logits, num_samples) if logits is not None else None
+                labels = nested_truncate(labels, num_samples) if labels is not None else None
+        else:
+            num_samples = batch_size
+        if self.preprocess_logits_for_metrics is not None and logits is not None:
+            logits = self.preprocess_logits_for_metrics(logits, labels)
+        metric.update(logits, labels, losses=losses.repeat(num_samples) if losses is not None else None)
+
     def _nested_gather(self, tensors, name=None):
         """
         Gather value of `tensors` (tensor or list/tuple of nested tensors) and convert them to numpy before
@@ -5185,6 +5413,13 @@ class Trainer:
                     "`non_blocking` is enabled but `dataloader_pin_memory` is not. For the best performance, it's recommended to enable both."
                 )
             dataloader_config.non_blocking = non_blocking
+        use_stateful_dataloader = accelerator_config.pop("use_stateful_dataloader")
+        if use_stateful_dataloader:
+            if not is_accelerate_available("0.34.0"):
+                raise ImportError(
+                    "`use_stateful_dataloader` is only supported in accelerate v0.34.0 and above. Please upgrade accelerate to use this feature."
+                )
+            dataloader_config.use_stateful_dataloader = use_stateful_dataloader
         # this would have been updated above, no need for it anymore
         accelerator_config.pop("gradient_accumulation_kwargs")
 
@@ -5251,6 +5486,19 @@ class Trainer:
             raise ValueError(
                 "`auto_find_batch_size` isn't supported yet with DeepSpeed Zero-3. Please consider using Zero-2, Zero-1, or FSDP"
             )
+
+        # `save_async` relies on full state dicts that can be copied to the CPU by every process on its own
+        if self.args.save_async and (
+            self.is_deepspeed_enabled
+            or self.is_fsdp_enabled
+            or self.is_tp_enabled
+            or is_torch_xla_available()
+            or is_sagemaker_mp_enabled()
+        ):
+            raise ValueError(
+                "`save_async` isn't supported with DeepSpeed, FSDP, tensor parallelism, TPUs or SageMaker model"
+                " parallelism."
+            )
         if (
             self.args.save_only_model
             and self.is_fsdp_enabled
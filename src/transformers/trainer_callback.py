@@ -18,6 +18,9 @@ Callbacks to use with the Trainer class and customize the training loop.
 import dataclasses
 import json
 import math
+import os
+import time
+from collections import deque
 from dataclasses import dataclass
 from typing import Optional, Union
 
@@ -26,7 +29,11 @@ from tqdm.auto import tqdm
 
 from .trainer_utils import HPSearchBackend, IntervalStrategy, SaveStrategy, has_length
 from .training_args import TrainingArguments
-from .utils import logging
+from .utils import is_psutil_available, is_torch_available, logging
+
+
+if is_torch_available():
+    import torch
 
 
 logger = logging.get_logger(__name__)
@@ -347,6 +354,10 @@ class TrainerCallback:
                 print(logs)
     ```"""
 
+    # Whether the callback is run before the ones added without this flag, e.g. because it adds values to the logs
+    # that the reporting callbacks should include
+    _run_before_reporting = False
+
     def on_init_end(self, args: TrainingArguments, state: TrainerState, control: TrainerControl, **kwargs):
         """
         Event called at the end of the initialization of the [`Trainer`].
@@ -471,7 +482,15 @@ class CallbackHandler(TrainerCallback):
                 + "list of callbacks is\n:"
                 + self.callback_list
             )
-        self.callbacks.append(cb)
+        if getattr(cb, "_run_before_reporting", False):
+            # After the other callbacks with this flag, so that they still run in the order they were added
+            index = next(
+                (i for i, c in enumerate(self.callbacks) if not getattr(c, "_run_before_reporting", False)),
+                len(self.callbacks),
+            )
+            self.callbacks.insert(index, cb)
+        else:
+            self.callbacks.append(cb)
 
     def pop_callback(self, callback):
         if isinstance(callback, type):
@@ -783,3 +802,223 @@ class EarlyStoppingCallback(TrainerCallback, ExportableState):
                 "early_stopping_patience_counter": self.early_stopping_patience_counter,
             },
         }
+
+
+class StepProfilerCallback(TrainerCallback):
+    """
+    A [`TrainerCallback`] that measures where the time of the training steps goes, to find out whether the input
+    pipeline or the model is the bottleneck.
+
+    Every optimizer step is split in the time spent waiting for the dataloader, in the forward passes of the model, in
+    the rest of the gradient computation (backward passes, loss, gradient clipping), in the optimizer step (with the
+    scheduler step and the reset of the gradients) and in the logging, evaluation and checkpointing that follow it.
+    The means over the last `window_size` steps are added to the training logs (`dataloader_time`, `forward_time`,
+    `backward_time`, `optimizer_time`, `log_eval_save_time` and `step_time`, in seconds, with `step_time_max`), along
+    with `tokens_per_second`, the model FLOPs utilization `mfu` (estimated with
+    [`~PreTrainedModel.floating_point_ops`], when `peak_flops` is set) and the high-water marks of the device and host
+    memory since the previous logs (`device_memory_peak_mb` and `host_memory_peak_mb`, the latter requiring psutil).
+
+    With `slow_step_factor`, the steps taking more than `slow_step_factor` times the median of the window trigger a
+    `torch.profiler` trace of the `profile_steps` following steps, saved in `profiler_output_dir`.
+
+    Args:
+        window_size (`int`, *optional*, defaults to 100):
+            The number of steps the statistics are computed on.
+        synchronize (`bool`, *optional*, defaults to `True`):
+            Whether or not to wait for the device between the phases of a step, so that their time is the one spent by
+            the device and not only to queue its operations. This prevents the host from running ahead of the device.
+        peak_flops (`float`, *optional*):
+            The peak number of floating point operations per second of one device, for the model FLOPs utilization.
+        slow_step_factor (`float`, *optional*):
+            How slow a step has to be, relative to the median of the window, to trigger a profiler trace.
+        profile_steps (`int`, *optional*, defaults to 3):
+            The number of steps traced after a slow step.
+        max_profiles (`int`, *optional*, defaults to 1):
+            The maximum number of traces saved during a training.
+        profiler_output_dir (`str`, *optional*):
+            Where the traces are saved. Defaults to a `profiler` folder in the `output_dir` of the training arguments.
+    """
+
+    # It adds its statistics to the training logs, so it has to see them before the callbacks reporting them
+    _run_before_reporting = True
+    _phases = ["dataloader_time", "forward_time", "backward_time", "optimizer_time", "log_eval_save_time"]
+
+    def __init__(
+        self,
+        window_size: int = 100,
+        synchronize: bool = True,
+        peak_flops: Optional[float] = None,
+        slow_step_factor: Optional[float] = None,
+        profile_steps: int = 3,
+        max_profiles: int = 1,
+        profiler_output_dir: Optional[str] = None,
+    ):
+        self.window_size = window_size
+        self.synchronize = synchronize
+        self.peak_flops = peak_flops
+        self.slow_step_factor = slow_step_factor
+        self.profile_steps = profile_steps
+        self.max_profiles = max_profiles
+        self.profiler_output_dir = profiler_output_dir
+
+    def _now(self):
+        if self.synchronize and self._device_module is not None and hasattr(self._device_module, "synchronize"):
+            self._device_module.synchronize()
+        return time.perf_counter()
+
+    def _forward_pre_hook(self, module, args, kwargs):
+        if not self._in_step:
+            return
+        self._forward_start = self._now()
+        inputs = kwargs.get("input_ids", kwargs.get("inputs_embeds"))
+        if inputs is None and len(args) > 0:
+            inputs = args[0]
+        if isinstance(inputs, torch.Tensor):
+            # Embeddings have a hidden dimension
+            self._current["num_tokens"] += inputs.shape[:-1].numel() if inputs.is_floating_point() else inputs.numel()
+        if hasattr(module, "floating_point_ops"):
+            self._current["flops"] += module.floating_point_ops(kwargs)
+
+    def _forward_hook(self, module, args, kwargs, output):
+        if self._in_step and self._forward_start is not None:
+            self._current["forward_time"] += self._now() - self._forward_start
+            self._forward_start = None
+
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        self._device_module = getattr(torch, args.device.type, None)
+        self._steps = deque(maxlen=self.window_size)
+        self._hooks = []
+        if model is not None:
+            self._hooks.append(model.register_forward_pre_hook(self._forward_pre_hook, with_kwargs=True))
+            self._hooks.append(model.register_forward_hook(self._forward_hook, with_kwargs=True))
+        self._process = None
+        if is_psutil_available():
+            import psutil
+
+            self._process = psutil.Process()
+        self._host_memory_peak = 0
+        self._reset_device_memory_peak()
+        self._in_step = False
+        self._forward_start = None
+        self._last_event = self._now()
+        self._step_end = None
+        self._num_tokens_seen = state.num_input_tokens_seen
+        self._profiler = None
+        self._profiler_stop_step = None
+        self._num_profiles = 0
+
+    def _reset_device_memory_peak(self):
+        if hasattr(self._device_module, "reset_peak_memory_stats") and self._device_module.is_available():
+            self._device_module.reset_peak_memory_stats()
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self._last_event = self._now()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self._step_begin = self._now()
+        log_eval_save_time = self._last_event - self._step_end if self._step_end is not None else 0.0
+        self._current = {
+            "dataloader_time": self._step_begin - self._last_event,
+            "forward_time": 0.0,
+            "log_eval_save_time": log_eval_save_time,
+            "num_tokens": 0,
+            "flops": 0.0,
+        }
+        self._in_step = True
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        self._in_step = False
+        self._optimizer_start = self._now()
+        self._current["backward_time"] = self._optimizer_start - self._step_begin - self._current["forward_time"]
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self._step_end = self._last_event = self._now()
+        step = self._current
+        step["optimizer_time"] = self._step_end - self._optimizer_start
+        step["step_time"] = sum(step[phase] for phase in self._phases)
+        if args.include_num_input_tokens_seen:
+            # Exact count over all processes
+            step["num_tokens"] = (state.num_input_tokens_seen - self._num_tokens_seen) / args.world_size
+            self._num_tokens_seen = state.num_input_tokens_seen
+        if self._process is not None:
+            self._host_memory_peak = max(self._host_memory_peak, self._process.memory_info().rss)
+
+        self._maybe_profile(args, state, step["step_time"])
+        self._steps.append(step)
+
+    def _update_last_event(self):
+        # Logging, evaluation and checkpointing happen between the end of a step and the next data fetch
+        if getattr(self, "_step_end", None) is not None:
+            self._last_event = self._now()
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        self._update_last_event()
+
+    def on_save(self, args, state, control, **kwargs):
+        self._update_last_event()
+
+    def _maybe_profile(self, args, state, step_time):
+        if self._profiler is not None and state.global_step >= self._profiler_stop_step:
+            self._profiler.stop()
+            output_dir = self.profiler_output_dir or os.path.join(args.output_dir, "profiler")
+            os.makedirs(output_dir, exist_ok=True)
+            trace_name = f"trace_step_{self._profiler_stop_step - self.profile_steps + 1}-{self._profiler_stop_step}"
+            if args.world_size > 1:
+                trace_name += f"_rank{args.process_index}"
+            self._profiler.export_chrome_trace(os.path.join(output_dir, f"{trace_name}.json"))
+            self._profiler = None
+        elif (
+            self._profiler is None
+            and self.slow_step_factor is not None
+            and self._num_profiles < self.max_profiles
+            and len(self._steps) >= min(10, self.window_size)
+            and step_time > self.slow_step_factor * np.median([step["step_time"] for step in self._steps])
+        ):
+            logger.info(
+                f"Step {state.global_step} took {step_time:.3f}s, profiling the next {self.profile_steps} steps."
+            )
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._profiler = torch.profiler.profile(activities=activities, record_shapes=True)
+            self._profiler.start()
+            self._profiler_stop_step = state.global_step + self.profile_steps
+            self._num_profiles += 1
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        self._update_last_event()
+        # Only the training logs get the statistics
+        if logs is None or "loss" not in logs or not getattr(self, "_steps", None):
+            return
+
+        steps = list(self._steps)
+        total_time = sum(step["step_time"] for step in steps)
+        stats = {phase: round(sum(step[phase] for step in steps) / len(steps), 4) for phase in self._phases}
+        stats["step_time"] = round(total_time / len(steps), 4)
+        stats["step_time_max"] = round(max(step["step_time"] for step in steps), 4)
+        if total_time > 0:
+            stats["tokens_per_second"] = round(
+                sum(step["num_tokens"] for step in steps) * args.world_size / total_time, 3
+            )
+            flops = sum(step["flops"] for step in steps)
+            if self.peak_flops is not None and flops > 0:
+                stats["mfu"] = round(flops / total_time / self.peak_flops, 4)
+        if hasattr(self._device_module, "max_memory_allocated") and self._device_module.is_available():
+            stats["device_memory_peak_mb"] = round(self._device_module.max_memory_allocated() / 2**20, 1)
+            self._reset_device_memory_peak()
+        if self._process is not None:
+            stats["host_memory_peak_mb"] = round(self._host_memory_peak / 2**20, 1)
+            self._host_memory_peak = 0
+
+        logs.update(stats)
+        # The logs were already added to the history by the `Trainer`
+        if len(state.log_history) > 0 and state.log_history[-1].get("step") == state.global_step:
+            state.log_history[-1].update(stats)
+
+    def on_train_end(self, args, state, control, **kwargs):
+        for hook in getattr(self, "_hooks", []):
+            hook.remove()
+        self._hooks = []
+        if getattr(self, "_profiler", None) is not None:
+            self._profiler.stop()
+            self._profiler = None
@@ -24,12 +24,14 @@ import os
 import re
 import sys
 import warnings
-from collections.abc import Iterator, Mapping
+from collections import deque
+from collections.abc import Iterable, Iterator, Mapping, Sized
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from dataclasses import dataclass, field
 from itertools import chain
 from logging import StreamHandler
-from typing import Any, Optional, Union
+from typing import Any, Callable, Optional, Union
 
 import numpy as np
 import torch
@@ -39,7 +41,8 @@ from torch.utils.data import Dataset, IterableDataset, RandomSampler, Sampler
 from torch.utils.data.distributed import DistributedSampler
 
 from .integrations.deepspeed import is_deepspeed_zero3_enabled
-from .tokenization_utils_base import BatchEncoding
+from .tokenization_utils_base import BatchEncoding, PreTrainedTokenizerBase
+from .trainer_utils import EvalPrediction
 from .utils import (
     is_sagemaker_mp_enabled,
     is_torch_available,
@@ -116,6 +119,29 @@ def numpy_pad_and_concatenate(array1, array2, padding_index=-100):
     return result
 
 
+def pad_and_concatenate_all(tensors, padding_index=-100):
+    """
+    Concatenates a list of tensors or arrays on first axis, applying padding on the second if necessary. Unlike
+    chaining [`torch_pad_and_concatenate`] or [`numpy_pad_and_concatenate`], the result is allocated once.
+    """
+    tensors = [atleast_1d(t) for t in tensors]
+    first = tensors[0]
+    is_torch = isinstance(first, torch.Tensor)
+    if len(first.shape) == 1 or all(t.shape[1] == first.shape[1] for t in tensors):
+        return torch.cat(tensors, dim=0) if is_torch else np.concatenate(tensors, axis=0)
+
+    new_shape = (sum(t.shape[0] for t in tensors), max(t.shape[1] for t in tensors)) + first.shape[2:]
+    if is_torch:
+        result = first.new_full(new_shape, padding_index)
+    else:
+        result = np.full_like(first, padding_index, shape=new_shape)
+    offset = 0
+    for t in tensors:
+        result[offset : offset + t.shape[0], : t.shape[1]] = t
+        offset += t.shape[0]
+    return result
+
+
 def nested_concat(tensors, new_tensors, padding_index=-100):
     """
     Concat the `new_tensors` to `tensors` on the first dim and pad them on the second if needed. Works for tensors or
@@ -139,6 +165,38 @@ def nested_concat(tensors, new_tensors, padding_index=-100):
         raise TypeError(f"Unsupported type for concatenation: got {type(tensors)}")
 
 
+def nested_concat_all(tensors_list, padding_index=-100):
+    """
+    Concat all the (nested list/tuple/dict of) tensors of `tensors_list` on the first dim and pad them on the second if
+    needed, like successive calls to [`nested_concat`] but with a single allocation per tensor, so that the cost is
+    linear in the total size. A list with a single element is returned as is.
+    """
+    first = tensors_list[0]
+    if len(tensors_list) == 1:
+        return first
+    for tensors in tensors_list[1:]:
+        if not (isinstance(first, torch.Tensor) and isinstance(tensors, torch.Tensor)):
+            assert type(first) is type(tensors), (
+                f"Expected all tensors to have the same type but found {type(first)} and {type(tensors)}."
+            )
+    if isinstance(first, (list, tuple)):
+        return type(first)(
+            nested_concat_all([tensors[i] for tensors in tensors_list], padding_index=padding_index)
+            for i in range(len(first))
+        )
+    elif isinstance(first, (torch.Tensor, np.ndarray)):
+        return pad_and_concatenate_all(tensors_list, padding_index=padding_index)
+    elif isinstance(first, Mapping):
+        return type(first)(
+            {
+                k: nested_concat_all([tensors[k] for tensors in tensors_list], padding_index=padding_index)
+                for k in first
+            }
+        )
+    else:
+        raise TypeError(f"Unsupported type for concatenation: got {type(first)}")
+
+
 def find_batch_size(tensors):
     """
     Find the first dimension of a tensor in a nested list/tuple/dict of tensors.
@@ -184,6 +242,31 @@ def nested_detach(tensors):
     return tensors.detach() if isinstance(tensors, torch.Tensor) else tensors
 
 
+def nested_cpu_clone(tensors, memo=None):
+    """
+    Copy `tensors` (even if it's a nested list/tuple/dict of tensors) to new CPU tensors, keeping the tensors that are
+    views of the same memory (like tied weights) shared. Other objects are deep-copied.
+    """
+    memo = {} if memo is None else memo
+    if isinstance(tensors, (list, tuple)):
+        return type(tensors)(nested_cpu_clone(t, memo) for t in tensors)
+    elif isinstance(tensors, Mapping):
+        return type(tensors)({k: nested_cpu_clone(t, memo) for k, t in tensors.items()})
+    elif not isinstance(tensors, torch.Tensor):
+        return copy.deepcopy(tensors)
+    key = (
+        tensors.device,
+        tensors.untyped_storage().data_ptr(),
+        tensors.storage_offset(),
+        tuple(tensors.shape),
+        tensors.stride(),
+        tensors.dtype,
+    )
+    if key not in memo:
+        memo[key] = tensors.detach().to("cpu", copy=True)
+    return memo[key]
+
+
 def nested_xla_mesh_reduce(tensors, name):
     if is_torch_xla_available():
         import torch_xla.core.xla_model as xm
@@ -290,15 +373,190 @@ class DistributedSamplerWithLoop(DistributedSampler):
         return iter(indices)
 
 
+class StreamingMetric:
+    """
+    Base class for metrics computed incrementally during evaluation. When a `StreamingMetric` is passed as
+    `compute_metrics` to [`Trainer`], the predictions and labels of every evaluation batch are given to
+    [`~StreamingMetric.update`] on the device they were computed on, instead of being gathered and accumulated on the
+    host, so the memory used by evaluation does not grow with the size of the evaluation dataset.
+
+    Subclasses register their sufficient statistics as tensors with [`~StreamingMetric.add_state`], update them in
+    `update` and turn them into metric values in `compute`. The states are reduced across processes once, at the end
+    of evaluation. Metrics that only need the evaluation losses can set `requires_logits = False`, the model outputs
+    are then never collected.
+
+    A `StreamingMetric` can also be called on a full [`EvalPrediction`], like any other `compute_metrics` function.
+    """
+
+    requires_logits = True
+
+    def __init__(self):
+        self._defaults = {}
+        self._reductions = {}
+
+    def add_state(self, name: str, default: torch.Tensor, reduction: str = "sum"):
+        """
+        Registers a state of the metric, accessible as the attribute `name`.
+
+        Args:
+            name (`str`):
+                The name of the state.
+            default (`torch.Tensor`):
+                The value of the state when the metric is reset.
+            reduction (`str`, *optional*, defaults to `"sum"`):
+                How the values of the state on the different processes are combined, one of `"sum"`, `"max"` or
+                `"min"`.
+        """
+        if reduction not in ("sum", "max", "min"):
+            raise ValueError(f"`reduction` must be one of 'sum', 'max' or 'min', got {reduction}.")
+        self._defaults[name] = torch.as_tensor(default)
+        self._reductions[name] = reduction
+        setattr(self, name, self._defaults[name].clone())
+
+    def reset(self):
+        """Resets all the states to their default value."""
+        for name, default in self._defaults.items():
+            setattr(self, name, default.clone())
+
+    def to(self, device: Union[str, torch.device]) -> "StreamingMetric":
+        """Moves all the states to `device`."""
+        for name in self._defaults:
+            setattr(self, name, getattr(self, name).to(device))
+        return self
+
+    def sync(self, gather_function: Callable[[torch.Tensor], torch.Tensor]):
+        """
+        Reduces the states across processes. `gather_function` must concatenate the tensors of all processes along
+        the first dimension, like `Accelerator.gather`.
+        """
+        for name, reduction in self._reductions.items():
+            gathered = gather_function(getattr(self, name)[None])
+            if reduction == "sum":
+                setattr(self, name, gathered.sum(dim=0))
+            else:
+                setattr(self, name, gathered.amax(dim=0) if reduction == "max" else gathered.amin(dim=0))
+
+    def update(
+        self,
+        predictions: Optional[torch.Tensor],
+        labels: Optional[torch.Tensor],
+        losses: Optional[torch.Tensor] = None,
+    ):
+        """
+        Updates the states with the predictions, labels and per-sample losses of a batch. `predictions` and `labels`
+        are `None` if `requires_logits` is `False`, or if the dataset has no labels.
+        """
+        raise NotImplementedError
+
+    def compute(self) -> dict[str, float]:
+        """Returns the metric values computed from the states."""
+        raise NotImplementedError
+
+    def __call__(self, eval_pred: EvalPrediction) -> dict[str, float]:
+        self.reset()
+        predictions, labels = eval_pred.predictions, eval_pred.label_ids
+        losses = eval_pred.losses
+        self.update(
+            torch.as_tensor(predictions) if self.requires_logits and predictions is not None else None,
+            torch.as_tensor(labels) if self.requires_logits and labels is not None else None,
+            losses=torch.as_tensor(losses) if losses is not None else None,
+        )
+        return self.compute()
+
+
+class StreamingAccuracy(StreamingMetric):
+    """
+    Streaming accuracy of the predicted classes or tokens. The logits are reduced to the predicted ids with an argmax
+    on the device of the model, predictions that are already ids (e.g. from `preprocess_logits_for_metrics`) are used
+    as is.
+
+    Args:
+        ignore_index (`int`, *optional*, defaults to -100):
+            The label value of the positions that do not count.
+        shift_labels (`bool`, *optional*, defaults to `False`):
+            Whether the prediction at position `i` is compared with the label at position `i + 1`, as for causal
+            language models.
+    """
+
+    def __init__(self, ignore_index: int = -100, shift_labels: bool = False):
+        super().__init__()
+        self.ignore_index = ignore_index
+        self.shift_labels = shift_labels
+        self.add_state("correct", torch.tensor(0))
+        self.add_state("total", torch.tensor(0))
+
+    def update(self, predictions, labels, losses=None):
+        if predictions is None or labels is None:
+            return
+        if predictions.ndim > labels.ndim:
+            predictions = predictions.argmax(dim=-1)
+        if self.shift_labels:
+            predictions, labels = predictions[..., :-1], labels[..., 1:]
+        mask = labels != self.ignore_index
+        self.correct += ((predictions == labels) & mask).sum()
+        self.total += mask.sum()
+
+    def compute(self):
+        return {"accuracy": (self.correct / self.total.clamp(min=1)).item()}
+
+
+class StreamingPerplexity(StreamingMetric):
+    """
+    Streaming perplexity of a language model. By default, it is computed from the logits and the labels on the device
+    of the model, token by token. With `from_loss=True`, it is computed from the evaluation losses only, weighted by
+    the number of samples of every batch, and the logits are never collected.
+
+    Args:
+        ignore_index (`int`, *optional*, defaults to -100):
+            The label value of the positions that do not count.
+        shift_labels (`bool`, *optional*, defaults to `True`):
+            Whether the logits at position `i` predict the label at position `i + 1`, as for causal language models.
+        from_loss (`bool`, *optional*, defaults to `False`):
+            Whether to compute the perplexity from the evaluation losses rather than from the logits.
+    """
+
+    def __init__(self, ignore_index: int = -100, shift_labels: bool = True, from_loss: bool = False):
+        super().__init__()
+        self.ignore_index = ignore_index
+        self.shift_labels = shift_labels
+        self.requires_logits = not from_loss
+        self.add_state("loss_sum", torch.tensor(0.0, dtype=torch.float64))
+        self.add_state("count", torch.tensor(0))
+
+    def update(self, predictions, labels, losses=None):
+        if not self.requires_logits:
+            if losses is not None:
+                self.loss_sum += losses.double().sum()
+                self.count += losses.numel()
+            return
+        if predictions is None or labels is None:
+            return
+        if self.shift_labels:
+            predictions, labels = predictions[..., :-1, :], labels[..., 1:]
+        losses = torch.nn.functional.cross_entropy(
+            predictions.flatten(0, -2).float(),
+            labels.flatten().long(),
+            ignore_index=self.ignore_index,
+            reduction="sum",
+        )
+        self.loss_sum += losses.double()
+        self.count += (labels != self.ignore_index).sum()
+
+    def compute(self):
+        loss = (self.loss_sum / self.count.clamp(min=1)).item()
+        return {"perplexity": math.exp(loss)}
+
+
 class EvalLoopContainer:
     """
     Container to store intermediate results of evaluation loop.
 
     Args:
         do_nested_concat (`bool`, *optional*, defaults to `True`):
-            If set to `True`, each iteration will recursively concatenate a new object containing tensors to
-            the existing stored tensors, provided that the structure of the existing object and the new one
-            are identical. If set to `False`, all newly added tensors will be stored in a list.
+            If set to `True`, the objects containing tensors will be recursively concatenated, provided that their
+            structures are identical. The concatenation is deferred to [`~EvalLoopContainer.to_cpu_and_numpy`] and
+            [`~EvalLoopContainer.get_arrays`], and done in one go, so that the cost of accumulating the results of many
+            iterations stays linear. If set to `False`, all newly added tensors will be stored in a list.
         padding_index (`int`, *optional*, defaults to -100):
             Value used to pad tensors of different shapes when `do_nested_concat=True`.
     """
@@ -306,17 +564,15 @@ class EvalLoopContainer:
     def __init__(self, do_nested_concat: bool = True, padding_index: int = -100):
         self.do_nested_concat = do_nested_concat
         self.padding_index = padding_index
+        # Lists of the objects added since the last move to CPU, and of the numpified chunks
         self.tensors = None
         self.arrays = None
 
     def add(self, tensors) -> None:
         """Add tensors to the stored objects. If `do_nested_concat=True`, the tensors will be concatenated recursively."""
         if self.tensors is None:
-            self.tensors = tensors if self.do_nested_concat else [tensors]
-        elif self.do_nested_concat:
-            self.tensors = nested_concat(self.tensors, tensors, padding_index=self.padding_index)
-        else:
-            self.tensors.append(tensors)
+            self.tensors = []
+        self.tensors.append(tensors)
 
     def to_cpu_and_numpy(self) -> None:
         """Move tensors in stored objects to CPU and convert them to numpy arrays."""
@@ -325,11 +581,13 @@ class EvalLoopContainer:
         if self.tensors is None:
             return
 
-        new_arrays = nested_numpify(self.tensors)
+        if self.do_nested_concat:
+            # A single transfer of the concatenated tensors rather than one per iteration
+            new_arrays = [nested_numpify(nested_concat_all(self.tensors, padding_index=self.padding_index))]
+        else:
+            new_arrays = nested_numpify(self.tensors)
         if self.arrays is None:
             self.arrays = new_arrays
-        elif self.do_nested_concat:
-            self.arrays = nested_concat(self.arrays, new_arrays, padding_index=self.padding_index)
         else:
             self.arrays.extend(new_arrays)
 
@@ -339,7 +597,11 @@ class EvalLoopContainer:
     def get_arrays(self):
         """Returns the numpified and moved to CPU stored objects."""
         self.to_cpu_and_numpy()
-        return self.arrays
+        if self.arrays is None or not self.do_nested_concat:
+            return self.arrays
+        if len(self.arrays) > 1:
+            self.arrays = [nested_concat_all(self.arrays, padding_index=self.padding_index)]
+        return self.arrays[0]
 
 
 class SequentialDistributedSampler(Sampler):
@@ -407,10 +669,26 @@ def get_tpu_sampler(dataset: torch.utils.data.Dataset, batch_size: int):
 def nested_new_like(arrays, num_samples, padding_index=-100):
     """Create the same nested structure as `arrays` with a first dimension always at `num_samples`."""
     if isinstance(arrays, (list, tuple)):
-        return type(arrays)(nested_new_like(x, num_samples) for x in arrays)
+        return type(arrays)(nested_new_like(x, num_samples, padding_index=padding_index) for x in arrays)
     return np.full_like(arrays, padding_index, shape=(num_samples, *arrays.shape[1:]))
 
 
+def nested_seq_length(arrays):
+    "Return the size of the second dimension of `arrays` (even if it's a nested list/tuple of arrays), or `None`."
+    if isinstance(arrays, (list, tuple)):
+        return type(arrays)(nested_seq_length(x) for x in arrays)
+    return arrays.shape[1] if len(arrays.shape) > 1 else None
+
+
+def nested_truncate_seq_length(arrays, seq_lengths):
+    "Truncate the second dimension of `arrays` (even if it's a nested list/tuple of arrays) at `seq_lengths`."
+    if isinstance(arrays, (list, tuple)):
+        return type(arrays)(nested_truncate_seq_length(x, y) for x, y in zip(arrays, seq_lengths))
+    if seq_lengths is None or arrays.shape[1] == seq_lengths:
+        return arrays
+    return np.ascontiguousarray(arrays[:, :seq_lengths])
+
+
 def expand_like(arrays, new_seq_length, padding_index=-100):
     """Expand the `arrays` so that the second dimension grows to `new_seq_length`. Uses `padding_index` for padding."""
     result = np.full_like(arrays, padding_index, shape=(arrays.shape[0], new_seq_length) + arrays.shape[2:])
@@ -485,6 +763,7 @@ class DistributedTensorGatherer:
         self.total_samples = int(np.ceil(num_samples / total_size)) * total_size
         self.process_length = self.total_samples // world_size
         self._storage = None
+        self._seq_lengths = None
         self._offsets = None
         self.padding_index = padding_index
 
@@ -497,32 +776,38 @@ class DistributedTensorGatherer:
             return
         if self._storage is None:
             self._storage = nested_new_like(arrays, self.total_samples, padding_index=self.padding_index)
+            self._seq_lengths = nested_seq_length(arrays)
             self._offsets = list(range(0, self.total_samples, self.process_length))
 
-        slice_len, self._storage = self._nested_set_tensors(self._storage, arrays)
+        slice_len, self._storage, self._seq_lengths = self._nested_set_tensors(
+            self._storage, self._seq_lengths, arrays
+        )
         for i in range(self.world_size):
             self._offsets[i] += slice_len
 
-    def _nested_set_tensors(self, storage, arrays):
+    def _nested_set_tensors(self, storage, seq_length, arrays):
         if isinstance(arrays, (list, tuple)):
-            result = [self._nested_set_tensors(x, y) for x, y in zip(storage, arrays)]
-            return result[0][0], type(arrays)(r[1] for r in result)
+            result = [self._nested_set_tensors(x, y, z) for x, y, z in zip(storage, seq_length, arrays)]
+            return result[0][0], type(arrays)(r[1] for r in result), type(arrays)(r[2] for r in result)
         assert arrays.shape[0] % self.world_size == 0, (
             f"Arrays passed should all have a first dimension multiple of {self.world_size}, found {arrays.shape[0]}."
         )
 
         slice_len = arrays.shape[0] // self.world_size
+        if len(arrays.shape) > 1 and len(storage.shape) > 1:
+            # Expand the array on the fly if needed, at least doubling its capacity so that the total cost of the
+            # expansions stays linear. The extra padding is removed in `finalize`.
+            if storage.shape[1] < arrays.shape[1]:
+                storage = expand_like(storage, max(arrays.shape[1], 2 * storage.shape[1]), self.padding_index)
+            seq_length = max(seq_length, arrays.shape[1])
         for i in range(self.world_size):
             if len(arrays.shape) == 1:
                 storage[self._offsets[i] : self._offsets[i] + slice_len] = arrays[i * slice_len : (i + 1) * slice_len]
             else:
-                # Expand the array on the fly if needed.
-                if len(storage.shape) > 1 and storage.shape[1] < arrays.shape[1]:
-                    storage = expand_like(storage, arrays.shape[1], padding_index=self.padding_index)
                 storage[self._offsets[i] : self._offsets[i] + slice_len, : arrays.shape[1]] = arrays[
                     i * slice_len : (i + 1) * slice_len
                 ]
-        return slice_len, storage
+        return slice_len, storage, seq_length
 
     def finalize(self):
         """
@@ -533,7 +818,7 @@ class DistributedTensorGatherer:
             return
         if self._offsets[0] != self.process_length:
             logger.warning("Not all data has been set. Are you sure you passed all values?")
-        return nested_truncate(self._storage, self.num_samples)
+        return nested_truncate_seq_length(nested_truncate(self._storage, self.num_samples), self._seq_lengths)
 
 
 @dataclass
@@ -748,6 +1033,123 @@ class DistributedLengthGroupedSampler(DistributedSampler):
         return iter(indices)
 
 
+def get_token_budget_batches(lengths, max_tokens, window_size=1000, num_replicas=1, generator=None):
+    """
+    Return a list of batches of indices, each holding at most `max_tokens` tokens in total (a longer element gets a
+    batch of its own). To do this, the indices are:
+
+    - randomly permuted
+    - grouped in windows of `window_size` elements
+    - packed in each window with first-fit decreasing: from the longest to the shortest, every element goes into the
+      first batch with enough room left, or starts a new batch
+
+    The batches of each window are shuffled, and the batches with the most elements are split in two until the number
+    of batches is a round multiple of `num_replicas`, so that every process gets the same number of batches without
+    repeating or dropping elements.
+    """
+    lengths = np.asarray(lengths)
+    # We need to use torch for the random part as a distributed sampler will set the random seed for torch.
+    indices = torch.randperm(len(lengths), generator=generator).numpy()
+    batches = []
+    for start in range(0, len(indices), window_size):
+        window = indices[start : start + window_size]
+        window = window[np.argsort(-lengths[window], kind="stable")]
+        window_batches = []
+        # Room left in each batch, there can't be more batches than elements
+        room = np.empty(len(window), dtype=np.int64)
+        for index in window:
+            length = lengths[index]
+            batch_idx = int(np.argmax(room[: len(window_batches)] >= length)) if window_batches else 0
+            if window_batches and room[batch_idx] >= length:
+                window_batches[batch_idx].append(int(index))
+                room[batch_idx] -= length
+            else:
+                room[len(window_batches)] = max_tokens - length
+                window_batches.append([int(index)])
+        order = torch.randperm(len(window_batches), generator=generator).tolist()
+        batches.extend(window_batches[i] for i in order)
+
+    while len(batches) % num_replicas != 0:
+        batch_idx = max(range(len(batches)), key=lambda i: len(batches[i]))
+        batch = batches[batch_idx]
+        if len(batch) < 2:
+            break
+        batches[batch_idx : batch_idx + 1] = [batch[: len(batch) // 2], batch[len(batch) // 2 :]]
+    return batches
+
+
+class TokenBudgetBatchSampler(Sampler):
+    r"""
+    Batch sampler that packs the elements of the dataset into batches of a varying number of elements, but of roughly
+    `max_tokens` tokens each, while keeping a bit of randomness. Meant to be used with padding-free collators like
+    [`DataCollatorWithFlattening`], so that every step processes about the same number of tokens.
+
+    The batches only depend on `seed` and the epoch set with `set_epoch` (which is otherwise incremented at every
+    iteration), so that they are the same on every process.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        dataset: Optional[Dataset] = None,
+        lengths: Optional[list[int]] = None,
+        model_input_name: Optional[str] = None,
+        window_size: int = 1000,
+        num_replicas: int = 1,
+        seed: int = 0,
+    ):
+        if dataset is None and lengths is None:
+            raise ValueError("One of dataset and lengths must be provided.")
+        if max_tokens <= 0:
+            raise ValueError(f"`max_tokens` must be a positive integer, got {max_tokens}.")
+
+        if lengths is None:
+            model_input_name = model_input_name if model_input_name is not None else "input_ids"
+            if (
+                not (isinstance(dataset[0], dict) or isinstance(dataset[0], BatchEncoding))
+                or model_input_name not in dataset[0]
+            ):
+                raise ValueError(
+                    "Can only automatically infer lengths for datasets whose items are dictionaries with an "
+                    f"'{model_input_name}' key."
+                )
+            lengths = [len(feature[model_input_name]) for feature in dataset]
+        elif isinstance(lengths, torch.Tensor):
+            lengths = lengths.tolist()
+
+        self.lengths = lengths
+        self.max_tokens = max_tokens
+        self.window_size = window_size
+        self.num_replicas = num_replicas
+        self.seed = seed
+        self.epoch = 0
+        self._batches = None
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _get_batches(self) -> list[list[int]]:
+        # The packing of an epoch is computed once, for both `__len__` and `__iter__`
+        if self._batches is None or self._batches[0] != self.epoch:
+            # Deterministically shuffle based on epoch and seed
+            g = torch.Generator()
+            g.manual_seed(self.seed + self.epoch)
+            batches = get_token_budget_batches(
+                self.lengths, self.max_tokens, self.window_size, num_replicas=self.num_replicas, generator=g
+            )
+            self._batches = (self.epoch, batches)
+        return self._batches[1]
+
+    def __len__(self):
+        return len(self._get_batches())
+
+    def __iter__(self) -> Iterator[list[int]]:
+        batches = self._get_batches()
+        # The next iteration uses the next epoch, unless `set_epoch` is called in between
+        self.epoch += 1
+        return iter(batches)
+
+
 class ShardSampler(Sampler):
     """
     Sampler that shards batches between several processes. Dispatches indices batch by batch: on 2 processes with batch
@@ -900,6 +1302,117 @@ class IterableDatasetShard(IterableDataset):
             return math.ceil(len(self.dataset) / (self.batch_size * self.num_processes)) * self.batch_size
 
 
+class PackedTextDataset(IterableDataset):
+    """
+    Tokenizes raw text on the fly and packs it in sequences of `max_length` tokens, for causal language modeling
+    without tokenizing the dataset beforehand.
+
+    The texts are tokenized `tokenization_batch_size` at a time with the batch API of the tokenizer (which uses several
+    threads with a fast tokenizer), the tokens of consecutive texts are concatenated, separated by
+    `separator_token_id`, and split in blocks of `max_length`. The tokens left over at the end of the iteration are
+    dropped. Each sample is a dict with the `input_ids` and `labels` of a block.
+
+    With `dataloader_num_workers > 0`, the batches of texts are split between the dataloader workers, which tokenize
+    and collate them in parallel. The collated batches are created in shared memory by PyTorch, so that the main
+    process maps them without copying nor pickling their content.
+
+    <Tip>
+
+        As this dataset has no length, `max_steps` has to be set in the [`TrainingArguments`].
+
+    </Tip>
+
+    Args:
+        texts (`Iterable`):
+            The raw texts: an iterable of strings or of dicts with a `text_column` key, like a list, a
+            [`datasets.Dataset`] or a [`datasets.IterableDataset`]. Indexable ones are sliced directly by each worker,
+            and iterable datasets are expected to split their texts between the workers themselves, like
+            [`datasets.IterableDataset`] does with its shards.
+        tokenizer ([`PreTrainedTokenizerBase`]):
+            The tokenizer, preferably a fast one.
+        max_length (`int`, *optional*, defaults to 1024):
+            The length of the packed sequences.
+        text_column (`str`, *optional*, defaults to `"text"`):
+            The key of the text when `texts` yields dicts.
+        tokenization_batch_size (`int`, *optional*, defaults to 1000):
+            The number of texts tokenized at once.
+        separator_token_id (`int`, *optional*):
+            The token added after each text. Defaults to the end of sequence token of the tokenizer, if it has one.
+    """
+
+    def __init__(
+        self,
+        texts: Iterable,
+        tokenizer: PreTrainedTokenizerBase,
+        max_length: int = 1024,
+        text_column: str = "text",
+        tokenization_batch_size: int = 1000,
+        separator_token_id: Optional[int] = None,
+    ):
+        if not tokenizer.is_fast:
+            logger.warning(
+                "`PackedTextDataset` works best with a fast tokenizer, which tokenizes batches of texts in parallel."
+            )
+        self.texts = texts
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.text_column = text_column
+        self.tokenization_batch_size = tokenization_batch_size
+        self.separator_token_id = separator_token_id if separator_token_id is not None else tokenizer.eos_token_id
+
+    def set_epoch(self, epoch):
+        if hasattr(self.texts, "set_epoch"):
+            self.texts.set_epoch(epoch)
+
+    def _get_texts(self, batch):
+        # Slicing a `datasets.Dataset` returns a dict of columns
+        if isinstance(batch, Mapping):
+            return batch[self.text_column]
+        return [text[self.text_column] if isinstance(text, Mapping) else text for text in batch]
+
+    def _iter_text_batches(self):
+        worker_info = torch.utils.data.get_worker_info()
+        num_workers, worker_id = (worker_info.num_workers, worker_info.id) if worker_info is not None else (1, 0)
+        batch_size = self.tokenization_batch_size
+
+        if isinstance(self.texts, Sized) and hasattr(self.texts, "__getitem__"):
+            # Each worker only reads its own batches
+            for start in range(worker_id * batch_size, len(self.texts), num_workers * batch_size):
+                yield self._get_texts(self.texts[start : start + batch_size])
+            return
+
+        # Iterable datasets (e.g. `datasets.IterableDataset`) only yield the texts of the current worker already.
+        # Otherwise every worker goes over the texts, but only tokenizes its own batches.
+        if isinstance(self.texts, IterableDataset):
+            num_workers, worker_id = 1, 0
+        batch = []
+        batch_index = 0
+        for text in self.texts:
+            batch.append(text)
+            if len(batch) == batch_size:
+                if batch_index % num_workers == worker_id:
+                    yield self._get_texts(batch)
+                batch = []
+                batch_index += 1
+        if len(batch) > 0 and batch_index % num_workers == worker_id:
+            yield self._get_texts(batch)
+
+    def __iter__(self):
+        remainder = np.empty(0, dtype=np.int64)
+        for texts in self._iter_text_batches():
+            input_ids = self.tokenizer(texts, return_attention_mask=False, return_token_type_ids=False)["input_ids"]
+            if self.separator_token_id is not None:
+                input_ids = [ids + [self.separator_token_id] for ids in input_ids]
+            tokens = np.fromiter(chain.from_iterable(input_ids), dtype=np.int64, count=sum(map(len, input_ids)))
+            tokens = np.concatenate([remainder, tokens])
+
+            num_blocks = len(tokens) // self.max_length
+            blocks = torch.from_numpy(tokens[: num_blocks * self.max_length].reshape(num_blocks, self.max_length))
+            for block in blocks:
+                yield {"input_ids": block, "labels": block.clone()}
+            remainder = tokens[num_blocks * self.max_length :]
+
+
 # In order to keep `trainer.py` compact and easy to understand, place any secondary PT Trainer
 # helper methods here
 
@@ -1175,6 +1688,44 @@ def remove_dummy_checkpoint(is_main_process, output_dir, filenames):
                 os.remove(file)
 
 
+class AsyncCheckpointWriter:
+    """
+    Runs the writing of checkpoints in a background thread, one checkpoint after the other, for
+    `TrainingArguments.save_async`.
+
+    Args:
+        max_pending (`int`, *optional*, defaults to 1):
+            The maximum number of checkpoints submitted and not yet written. Submitting one more blocks until the
+            oldest one is written.
+    """
+
+    def __init__(self, max_pending: int = 1):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint-writer")
+        self._pending = deque()
+
+    def __len__(self):
+        self._check_done()
+        return len(self._pending)
+
+    def _check_done(self):
+        # Re-raises in the training loop the errors that happened in the background
+        while self._pending and self._pending[0].done():
+            self._pending.popleft().result()
+
+    def submit(self, write_function, *args, **kwargs):
+        """Schedules `write_function(*args, **kwargs)`, after waiting for the oldest checkpoints if needed."""
+        self._check_done()
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+        self._pending.append(self._executor.submit(write_function, *args, **kwargs))
+
+    def wait(self):
+        """Waits until all the submitted checkpoints are written."""
+        while self._pending:
+            self._pending.popleft().result()
+
+
 if is_sagemaker_mp_enabled():
     import smdistributed.modelparallel.torch as smp
 
@@ -1252,6 +1803,11 @@ class AcceleratorConfig:
             Whether to use non-blocking CUDA calls to help minimize synchronization during
             distributed training with prepared `DataLoader` inputs being moved to device.
             Best if used with `pin_memory=True` in the `TrainingArguments`.
+        use_stateful_dataloader (`bool`, *optional*, defaults to `False`):
+            Whether or not to use a `torchdata.stateful_dataloader.StatefulDataLoader` for the training dataloader.
+            Its state (position in the epoch, sampler and dataset states) is then saved in the checkpoints, so that
+            resuming a training mid-epoch doesn't iterate again over the batches already trained on. Requires
+            `torchdata>=0.8.0` and accelerate v0.34.0.
         use_configured_state (`bool*, *optional*, defaults to `False`):
             Whether or not to use a pre-configured `AcceleratorState` or `PartialState` defined
             before calling `TrainingArguments`. If `True`, an `Accelerator` or `PartialState`
@@ -1305,6 +1861,15 @@ class AcceleratorConfig:
         },
     )
 
+    use_stateful_dataloader: bool = field(
+        default=False,
+        metadata={
+            "help": "Whether or not to use a `torchdata.stateful_dataloader.StatefulDataLoader` for the training dataloader. "
+            "Its state is then saved in the checkpoints, so that resuming a training mid-epoch doesn't iterate again "
+            "over the batches already trained on. Requires `torchdata>=0.8.0` and accelerate v0.34.0."
+        },
+    )
+
     gradient_accumulation_kwargs: Optional[dict] = field(
         default=None,
         metadata={
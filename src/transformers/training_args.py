@@ -372,6 +372,14 @@ class TrainingArguments:
             Note that when this is true, you won't be able to resume training from checkpoint.
             This enables you to save storage by not storing the optimizer, scheduler & rng state.
             You can only load the model using `from_pretrained` with this option set to `True`.
+        save_async (`bool`, *optional*, defaults to `False`):
+            Whether to write checkpoints in a background thread. The model, optimizer, scheduler and RNG states are
+            copied to the CPU and training resumes immediately, while the copy is written to a temporary folder that is
+            renamed to `checkpoint-xxx` once complete, before the older checkpoints are rotated. Not supported with
+            DeepSpeed, FSDP, TPUs, SageMaker model parallelism or `save_on_each_node`.
+        save_async_max_pending (`int`, *optional*, defaults to 1):
+            The maximum number of checkpoints being written in the background when `save_async=True`. Saving one more
+            waits for the oldest one to be written, which bounds the CPU memory used by the copies.
         restore_callback_states_from_checkpoint (`bool`, *optional*, defaults to `False`):
             Whether to restore the callback states from the checkpoint. If `True`, will override
             callbacks passed to the `Trainer` if they exist in the checkpoint."
@@ -619,8 +627,16 @@ class TrainingArguments:
             padding applied and be more efficient). Only useful if applying dynamic padding.
         length_column_name (`str`, *optional*, defaults to `"length"`):
             Column name for precomputed lengths. If the column exists, grouping by length will use these values rather
-            than computing them on train startup. Ignored unless `group_by_length` is `True` and the dataset is an
-            instance of `Dataset`.
+            than computing them on train startup. Ignored unless `group_by_length` is `True` or `max_tokens_per_batch`
+            is set, and the dataset is an instance of `Dataset`.
+        max_tokens_per_batch (`int`, *optional*):
+            If set, the training samples are packed into batches of at most this number of tokens per device (a
+            longer sample gets a batch of its own) instead of batches of `per_device_train_batch_size` samples, with
+            first-fit decreasing over shuffled windows of samples. Meant to be used with a padding-free collator like
+            [`DataCollatorWithFlattening`], so that every step processes about the same number of tokens. The
+            number of batches then varies a little from epoch to epoch, and unless `max_steps` is set, the number of
+            training steps and the learning rate schedule are computed from the first epoch. Can't be used with
+            `dataloader_drop_last`.
         report_to (`str` or `list[str]`, *optional*, defaults to `"all"`):
             The list of integrations to report the results and logs to. Supported platforms are `"azure_ml"`,
             `"clearml"`, `"codecarbon"`, `"comet_ml"`, `"dagshub"`, `"dvclive"`, `"flyte"`, `"mlflow"`, `"neptune"`,
@@ -1024,6 +1040,19 @@ class TrainingArguments:
             )
         },
     )
+    save_async: bool = field(
+        default=False,
+        metadata={
+            "help": (
+                "Whether to write checkpoints in a background thread from a CPU copy of the model, optimizer, scheduler"
+                " and RNG states, so that training resumes immediately."
+            )
+        },
+    )
+    save_async_max_pending: int = field(
+        default=1,
+        metadata={"help": "The maximum number of checkpoints being written in the background when `save_async=True`."},
+    )
     restore_callback_states_from_checkpoint: bool = field(
         default=False,
         metadata={
@@ -1298,6 +1327,13 @@ class TrainingArguments:
         default="length",
         metadata={"help": "Column name with precomputed lengths to use when grouping by length."},
     )
+    max_tokens_per_batch: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "If set, pack the training samples into batches of at most this number of tokens per device, "
+            "instead of batches of `per_device_train_batch_size` samples."
+        },
+    )
     report_to: Union[None, str, list[str]] = field(
         default=None, metadata={"help": "The list of integrations to report the results and logs to."}
     )
@@ -1883,6 +1919,21 @@ class TrainingArguments:
         elif not isinstance(self.report_to, list):
             self.report_to = [self.report_to]
 
+        if self.max_tokens_per_batch is not None:
+            if self.max_tokens_per_batch <= 0:
+                raise ValueError(f"--max_tokens_per_batch must be a positive integer: {self.max_tokens_per_batch}")
+            if self.group_by_length:
+                raise ValueError("--max_tokens_per_batch and --group_by_length can't be used together")
+            if self.dataloader_drop_last:
+                # The batches have a varying number of samples and are all kept, there is no incomplete last batch
+                raise ValueError("--max_tokens_per_batch and --dataloader_drop_last can't be used together")
+
+        if self.save_async:
+            if self.save_async_max_pending < 1:
+                raise ValueError(f"--save_async_max_pending must be at least 1: {self.save_async_max_pending}")
+            if self.save_on_each_node:
+                raise ValueError("--save_async and --save_on_each_node can't be used together")
+
         if self.warmup_ratio < 0 or self.warmup_ratio > 1:
             raise ValueError("warmup_ratio must lie in range [0,1]")
         elif self.warmup_ratio > 0 and self.warmup_steps > 0:
@@ -226,6 +226,13 @@ class Constraint(metaclass=DummyObject):
         requires_backends(self, ["torch"])
 
 
+class ConstraintAutomaton(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
 class ConstraintListState(metaclass=DummyObject):
     _backends = ["torch"]
 
@@ -415,6 +422,20 @@ class SequenceBiasLogitsProcessor(metaclass=DummyObject):
         requires_backends(self, ["torch"])
 
 
+class SortFreeMinPLogitsWarper(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
+class SortFreeTopPLogitsWarper(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
 class StoppingCriteria(metaclass=DummyObject):
     _backends = ["torch"]
 
@@ -642,6 +663,34 @@ class Trainer(metaclass=DummyObject):
         requires_backends(self, ["torch"])
 
 
+class PackedTextDataset(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
+class StreamingAccuracy(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
+class StreamingMetric(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
+class StreamingPerplexity(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
 def torch_distributed_zero_first(*args, **kwargs):
     requires_backends(torch_distributed_zero_first, ["torch"])
 
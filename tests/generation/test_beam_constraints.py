@@ -22,7 +22,12 @@ from transformers.testing_utils import require_torch
 if is_torch_available():
     import torch
 
-    from transformers.generation import DisjunctiveConstraint
+    from transformers.generation import (
+        ConstraintAutomaton,
+        ConstraintListState,
+        DisjunctiveConstraint,
+        PhrasalConstraint,
+    )
 
 
 @require_torch
@@ -112,3 +117,52 @@ class ConstraintTest(unittest.TestCase):
         self.assertTrue(dc.completed)  # Completed!
         self.assertTrue(dc.remaining() == 0)
         self.assertTrue(dc.current_seq == [1, 2, 5])
+
+    def test_constraint_list_state_copy(self):
+        # the search steps copies of the constraint states, they must carry the progress of the original state
+        state = ConstraintListState([PhrasalConstraint([1, 2]), DisjunctiveConstraint([[3], [4, 5]])])
+        state.add(1)
+
+        state_copy = state.copy(stateful=True)
+        self.assertEqual(state_copy.get_bank(), state.get_bank())
+        self.assertEqual(state_copy.advance(), [2])
+
+        state_copy.add(2)
+        state_copy.add(3)
+        self.assertTrue(state_copy.completed)
+        self.assertFalse(state.completed)
+        self.assertTrue(state_copy.copy(stateful=True).completed)
+        self.assertIsNone(state_copy.copy(stateful=True).advance())
+
+    def test_constraint_automaton(self):
+        constraints = [PhrasalConstraint([1, 2, 3]), DisjunctiveConstraint([[4, 5], [4, 6], [7]])]
+        automaton = ConstraintAutomaton(constraints)
+        self.assertEqual(automaton.max_advance_tokens, 3)
+
+        prompts = [[9, 9, 9, 9, 9], [9, 9, 9, 1, 2], [9, 9, 9, 1, 4], [1, 2, 3, 4, 6]]
+        states = automaton.init_states(torch.tensor(prompts))
+        self.assertListEqual(automaton.is_completed(states).tolist(), [False, False, False, True])
+
+        # same progress as `ConstraintListState`: after `[1, 4]`, 4 has reset the phrasal constraint without starting
+        # the disjunctive one
+        for state, token_ids in zip(states, prompts):
+            constraint_list_state = ConstraintListState(constraints)
+            constraint_list_state.reset(token_ids)
+            self.assertEqual(automaton.get_bank(state).item(), constraint_list_state.get_bank())
+
+            advance_ids, is_valid_advance = automaton.advance(state)
+            self.assertListEqual(
+                sorted(advance_ids[is_valid_advance].tolist()), sorted(constraint_list_state.advance() or [])
+            )
+
+        # stepping all the states at once, with one token each
+        next_states = automaton.step(states, torch.tensor([7, 3, 4, 1]))
+        self.assertListEqual(automaton.get_bank(next_states).tolist(), [3, 3, 2, 6])
+        self.assertListEqual(automaton.is_completed(next_states).tolist(), [False, False, False, True])
+
+    def test_constraint_automaton_disjunctive_branches(self):
+        # both branches of a disjunctive constraint can be taken from the same state
+        automaton = ConstraintAutomaton([DisjunctiveConstraint([[12, 13], [12, 14]])])
+        states = automaton.init_states(torch.tensor([[12], [12]]))
+        next_states = automaton.step(states, torch.tensor([13, 14]))
+        self.assertListEqual(automaton.is_completed(next_states).tolist(), [True, True])
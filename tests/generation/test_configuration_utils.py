@@ -192,6 +192,10 @@ class GenerationConfigTest(unittest.TestCase):
             GenerationConfig(do_sample=True, num_beams=2, constraints=["dummy"])
         with self.assertRaises(ValueError):
             GenerationConfig(do_sample=True, num_beams=2, force_words_ids=[[[1, 2, 3]]])
+        with self.assertRaises(ValueError):
+            GenerationConfig(allowed_token_ids=[])
+        with self.assertRaises(ValueError):
+            GenerationConfig(allowed_token_ids=[1, -2])
 
         # Passing `generate()`-only flags to `validate` will raise an exception
         with self.assertRaises(ValueError):
@@ -48,6 +48,8 @@ if is_torch_available():
         PrefixConstrainedLogitsProcessor,
         RepetitionPenaltyLogitsProcessor,
         SequenceBiasLogitsProcessor,
+        SortFreeMinPLogitsWarper,
+        SortFreeTopPLogitsWarper,
         SynthIDTextWatermarkLogitsProcessor,
         TemperatureLogitsWarper,
         TopKLogitsWarper,
@@ -408,6 +410,84 @@ class LogitsProcessorTest(unittest.TestCase):
         # first batch should keep two tokens, second batch would keep only 1, but due to `min_tokens_to_keep=2` keeps 2.
         self.assertListEqual((filtered_dist != 0.0).to(torch.long).sum(dim=-1).tolist(), [2, 2])
 
+    def test_sort_free_top_p_dist_warper(self):
+        input_ids = None
+        vocab_size = 10
+        batch_size = 2
+
+        dist = torch.log(
+            torch.tensor([[0.3, 0.1, 0.1, 0.5], [0.15, 0.3, 0.3, 0.25]], device=torch_device, dtype=torch.float)
+        )
+
+        top_p_warp = SortFreeTopPLogitsWarper(0.8)
+        filtered_dist = torch.exp(top_p_warp(input_ids, dist))
+
+        # same expectations as `TopPLogitsWarper`
+        EXPECTED_FILTERED_DIST = torch.tensor(
+            [[0.3, 0.0, 0.0, 0.5], [0.0, 0.3, 0.3, 0.25]], device=torch_device, dtype=torch.float
+        )
+        torch.testing.assert_close(filtered_dist, EXPECTED_FILTERED_DIST, rtol=1e-3, atol=1e-3)
+
+        # processor should not change logits in-place
+        self.assertFalse(torch.all(top_p_warp(input_ids, dist) == dist))
+
+        # check edge cases with negative and extreme logits
+        ramp_logits = torch.arange(vocab_size, device=torch_device, dtype=torch.float).unsqueeze(0).repeat(
+            batch_size, 1
+        ) - (vocab_size // 2)
+        ramp_logits[1] = ramp_logits[1] * 100.0
+        top_p_warp = SortFreeTopPLogitsWarper(0.9, min_tokens_to_keep=2, filter_value=0.0)
+        filtered_dist = top_p_warp(input_ids, ramp_logits)
+        self.assertListEqual((filtered_dist != 0.0).to(torch.long).sum(dim=-1).tolist(), [3, 2])
+
+        # the most likely token is kept even when `top_p` is 0
+        filtered_dist = SortFreeTopPLogitsWarper(0.0, filter_value=0.0)(input_ids, ramp_logits)
+        self.assertListEqual((filtered_dist != 0.0).to(torch.long).sum(dim=-1).tolist(), [1, 1])
+
+    @parameterized.expand([(1,), (3,)])
+    def test_sort_free_top_p_matches_top_p(self, min_tokens_to_keep):
+        # random logits have no ties, so the kept tokens should be exactly the ones of `TopPLogitsWarper`
+        torch.manual_seed(0)
+        scores = torch.randn((4, 1000), device=torch_device, dtype=torch.float) * 3
+        for top_p in [0.1, 0.5, 0.9, 0.95, 1.0]:
+            expected = TopPLogitsWarper(top_p, min_tokens_to_keep=min_tokens_to_keep)(None, scores)
+            filtered = SortFreeTopPLogitsWarper(top_p, min_tokens_to_keep=min_tokens_to_keep)(None, scores)
+            self.assertTrue(torch.equal(expected.isinf(), filtered.isinf()))
+
+    def test_sort_free_min_p_dist_warper(self):
+        input_ids = None
+        vocab_size = 10
+        batch_size = 2
+
+        dist = torch.log(
+            torch.tensor(
+                [[0.9, 0.0274, 0.047, 0.0274], [0.15, 0.3, 0.3, 0.25], [0.97, 0.01, 0.01, 0.01]],
+                device=torch_device,
+                dtype=torch.float,
+            )
+        )
+
+        min_p_warp = SortFreeMinPLogitsWarper(0.05)
+        filtered_dist = torch.exp(min_p_warp(input_ids, dist))
+
+        # same expectations as `MinPLogitsWarper`
+        EXPECTED_FILTERED_DIST = torch.tensor(
+            [[0.9, 0.0, 0.047, 0.0], [0.15, 0.3, 0.3, 0.25], [0.97, 0.0, 0.0, 0.0]],
+            device=torch_device,
+            dtype=torch.float,
+        )
+        torch.testing.assert_close(filtered_dist, EXPECTED_FILTERED_DIST, rtol=1e-3, atol=1e-3)
+
+        # processor should not change logits in-place
+        self.assertFalse(torch.all(min_p_warp(input_ids, dist) == dist))
+
+        ramp_logits = torch.arange(vocab_size, device=torch_device, dtype=torch.float) - (vocab_size // 2)
+        ramp_logits = ramp_logits.unsqueeze(0).repeat(batch_size, 1)
+        ramp_logits[1] = ramp_logits[1] * 100.0
+        min_p_warp = SortFreeMinPLogitsWarper(0.9, min_tokens_to_keep=2, filter_value=0.0)
+        filtered_dist = min_p_warp(input_ids, ramp_logits)
+        self.assertListEqual((filtered_dist != 0.0).to(torch.long).sum(dim=-1).tolist(), [2, 2])
+
     def test_typical_dist_warper(self):
         input_ids = None
         vocab_size = 10
@@ -4538,6 +4538,84 @@ class GenerationIntegrationTests(unittest.TestCase):
         )
         self.assertTrue(np.allclose(transition_scores, expected_scores, atol=1e-3))
 
+    @parameterized.expand([(False,), (True,)])
+    def test_output_logprobs(self, do_sample):
+        """
+        Test that `output_logprobs` records the same log-probabilities as `compute_transition_scores` with
+        `normalize_logits=True`, along with the top alternatives
+        """
+        articles = ["Justin Timberlake", "Michael Phelps"]
+        tokenizer = AutoTokenizer.from_pretrained("hf-internal-testing/tiny-random-gpt2", padding_side="left")
+        tokenizer.pad_token = tokenizer.eos_token
+        model = AutoModelForCausalLM.from_pretrained("hf-internal-testing/tiny-random-gpt2").to(torch_device)
+        input_ids = tokenizer(articles, return_tensors="pt", padding=True).input_ids.to(torch_device)
+
+        torch.manual_seed(0)
+        outputs = model.generate(
+            input_ids=input_ids,
+            max_new_tokens=5,
+            do_sample=do_sample,
+            top_k=10,
+            eos_token_id=None,
+            pad_token_id=tokenizer.eos_token_id,
+            output_scores=True,
+            output_logprobs=True,
+            num_top_logprobs=3,
+            return_dict_in_generate=True,
+        )
+        transition_scores = model.compute_transition_scores(outputs.sequences, outputs.scores, normalize_logits=True)
+
+        self.assertEqual(outputs.logprobs.shape, (2, 5))
+        self.assertEqual(outputs.top_logprobs.shape, (2, 5, 3))
+        self.assertEqual(outputs.top_logprobs_ids.shape, (2, 5, 3))
+        torch.testing.assert_close(outputs.logprobs, transition_scores)
+
+        expected_top_logprobs, expected_top_logprobs_ids = torch.topk(
+            torch.stack(outputs.scores, dim=1).log_softmax(dim=-1), k=3
+        )
+        torch.testing.assert_close(outputs.top_logprobs, expected_top_logprobs)
+        self.assertTrue(torch.equal(outputs.top_logprobs_ids, expected_top_logprobs_ids))
+
+    def test_output_logprobs_beam_search_raises(self):
+        model = AutoModelForCausalLM.from_pretrained("hf-internal-testing/tiny-random-gpt2").to(torch_device)
+        input_ids = torch.tensor([[1, 2, 3]], device=torch_device)
+        with self.assertRaises(ValueError):
+            model.generate(input_ids, max_new_tokens=3, num_beams=2, output_logprobs=True)
+
+    @parameterized.expand([(1,), (3,)])
+    def test_allowed_token_ids(self, num_beams):
+        """
+        Test that restricting the output vocabulary with `allowed_token_ids` matches generating over the full
+        vocabulary with the other tokens masked out, and that the original LM head is restored afterwards
+        """
+        model = AutoModelForCausalLM.from_pretrained("hf-internal-testing/tiny-random-gpt2").to(torch_device)
+        input_ids = torch.tensor([[10, 20, 30, 40], [50, 60, 70, 80]], device=torch_device)
+        allowed_token_ids = [4, 8, 15, 16, 23, 42]
+        vocab_mask = torch.full((model.config.vocab_size,), -float("inf"), device=torch_device)
+        vocab_mask[allowed_token_ids] = 0.0
+        original_lm_head = model.get_output_embeddings()
+
+        generation_kwargs = {
+            "max_new_tokens": 5,
+            "num_beams": num_beams,
+            "eos_token_id": 42,
+            "pad_token_id": 42,
+            "return_dict_in_generate": True,
+            "output_scores": True,
+        }
+        outputs = model.generate(input_ids, allowed_token_ids=allowed_token_ids, **generation_kwargs)
+        # beam search normalizes the scores before the logits processors, so the reference renormalizes them
+        masked_outputs = model.generate(
+            input_ids,
+            logits_processor=LogitsProcessorList([lambda input_ids, scores: (scores + vocab_mask).log_softmax(-1)]),
+            **generation_kwargs,
+        )
+
+        self.assertIs(model.get_output_embeddings(), original_lm_head)
+        self.assertTrue(torch.equal(outputs.sequences, masked_outputs.sequences))
+        self.assertTrue(set(outputs.sequences[:, input_ids.shape[1] :].flatten().tolist()) <= set(allowed_token_ids))
+        self.assertEqual(outputs.scores[0].shape[-1], model.config.vocab_size)
+
     def test_transition_scores_beam_search_encoder_decoder(self):
         """
         Test that `compute_transition_scores` is working as expected with beam search and encoder-decoder models
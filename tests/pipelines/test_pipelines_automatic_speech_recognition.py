@@ -12,7 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import os
+import tempfile
 import unittest
+from unittest.mock import patch
 
 import numpy as np
 import pytest
@@ -28,12 +32,15 @@ from transformers import (
     AutoProcessor,
     AutoTokenizer,
     Speech2TextForConditionalGeneration,
+    Wav2Vec2Config,
+    Wav2Vec2CTCTokenizer,
+    Wav2Vec2FeatureExtractor,
     Wav2Vec2ForCTC,
     WhisperForConditionalGeneration,
 )
 from transformers.pipelines import AutomaticSpeechRecognitionPipeline, pipeline
 from transformers.pipelines.audio_utils import chunk_bytes_iter, ffmpeg_microphone_live
-from transformers.pipelines.automatic_speech_recognition import chunk_iter
+from transformers.pipelines.automatic_speech_recognition import chunk_iter, chunk_stream_iter
 from transformers.testing_utils import (
     compare_pipeline_output_to_hub_spec,
     is_pipeline_test,
@@ -1727,6 +1734,113 @@ class AutomaticSpeechRecognitionPipelineTests(unittest.TestCase):
         # (85, 100)
         self.assertEqual(nested_simplify(input_values[:, 80:100]), nested_simplify(outs[4]["input_values"]))
 
+    @require_torch
+    def test_chunk_stream_iterator(self):
+        feature_extractor = AutoFeatureExtractor.from_pretrained("facebook/wav2vec2-base-960h")
+        inputs = np.arange(100, dtype=np.float32)
+        for chunk_len, stride_left, stride_right in [(100, 0, 0), (80, 0, 0), (105, 5, 5), (80, 20, 10), (30, 5, 5)]:
+            expected = list(chunk_iter(inputs, feature_extractor, chunk_len, stride_left, stride_right))
+            for buffer_len in [1, 7, 30, 100]:
+                buffers = [inputs[i : i + buffer_len] for i in range(0, len(inputs), buffer_len)]
+                outs = list(chunk_stream_iter(buffers, feature_extractor, chunk_len, stride_left, stride_right))
+                self.assertEqual([o["stride"] for o in outs], [o["stride"] for o in expected])
+                self.assertEqual([o["is_last"] for o in outs], [o["is_last"] for o in expected])
+                for out, expected_out in zip(outs, expected):
+                    self.assertTrue(torch.allclose(out["input_values"], expected_out["input_values"]))
+
+        # raw float32 bytes, as read from ffmpeg
+        buffers = [inputs[i : i + 30].tobytes() for i in range(0, len(inputs), 30)]
+        outs = list(chunk_stream_iter(buffers, feature_extractor, 36, 6, 6))
+        self.assertEqual([o["stride"] for o in outs], [(36, 0, 6), (36, 6, 6), (36, 6, 6), (28, 6, 0)])
+        self.assertEqual([o["input_values"].shape for o in outs], [(1, 36), (1, 36), (1, 36), (1, 28)])
+
+    @require_torch
+    def test_chunk_stream_iterator_unaligned_bytes(self):
+        feature_extractor = Wav2Vec2FeatureExtractor()
+        inputs = np.arange(100, dtype=np.float32)
+        expected = list(chunk_iter(inputs, feature_extractor, 36, 6, 6))
+
+        # Reads from a pipe can end in the middle of a sample
+        data = inputs.tobytes()
+        for buffer_len in [1, 3, 1001]:
+            buffers = [data[i : i + buffer_len] for i in range(0, len(data), buffer_len)]
+            outs = list(chunk_stream_iter(buffers, feature_extractor, 36, 6, 6))
+            self.assertEqual([o["stride"] for o in outs], [o["stride"] for o in expected])
+            for out, expected_out in zip(outs, expected):
+                self.assertTrue(torch.allclose(out["input_values"], expected_out["input_values"]))
+
+        # A stream can't end with a partial sample
+        with self.assertRaises(ValueError):
+            list(chunk_stream_iter([data[:-2]], feature_extractor, 36, 6, 6))
+
+    @require_torch
+    def test_stream_ctc(self):
+        speech_recognizer = pipeline(
+            task="automatic-speech-recognition",
+            model="hf-internal-testing/tiny-random-wav2vec2",
+        )
+        ds = load_dataset("hf-internal-testing/librispeech_asr_dummy", "clean", split="validation").sort("id")
+        audio = np.tile(ds[40]["audio"]["array"], 4).astype(np.float32)
+        expected = speech_recognizer(audio, chunk_length_s=2.0)["text"]
+
+        buffers = (audio[i : i + 4000] for i in range(0, len(audio), 4000))
+        pieces = [output["text"] for output in speech_recognizer.stream(buffers, chunk_length_s=2.0)]
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual("".join(pieces), expected)
+
+        speech_recognizer = pipeline(
+            task="automatic-speech-recognition", model="hf-internal-testing/tiny-random-speech-encoder-decoder"
+        )
+        with self.assertRaises(ValueError):
+            next(speech_recognizer.stream([audio], chunk_length_s=2.0))
+
+    @require_torch
+    def test_stream_ctc_word_delimiters(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vocab_file = os.path.join(tmp_dir, "vocab.json")
+            with open(vocab_file, "w") as f:
+                json.dump({"<pad>": 0, "<s>": 1, "</s>": 2, "<unk>": 3, "|": 4, "a": 5, "b": 6, "c": 7}, f)
+            tokenizer = Wav2Vec2CTCTokenizer(vocab_file)
+        config = Wav2Vec2Config(
+            vocab_size=8,
+            hidden_size=16,
+            num_hidden_layers=1,
+            num_attention_heads=2,
+            intermediate_size=16,
+            conv_dim=(8, 8),
+            conv_stride=(2, 2),
+            conv_kernel=(2, 2),
+            num_conv_pos_embeddings=4,
+            num_conv_pos_embedding_groups=2,
+        )
+        speech_recognizer = pipeline(
+            task="automatic-speech-recognition",
+            model=Wav2Vec2ForCTC(config),
+            tokenizer=tokenizer,
+            feature_extractor=Wav2Vec2FeatureExtractor(),
+        )
+
+        # Consecutive delimiters (or repeated tokens) on both sides of a piece boundary
+        rows = [[5, 4, 0], [4, 6, 6, 4], [4, 7, 4, 4], [4, 4], [0, 4, 5, 5]]
+        expected = tokenizer.decode(sum(rows, []))
+        self.assertEqual(expected, "a  b c  a")
+
+        def chunks(*args):
+            for i in range(len(rows)):
+                yield {"is_last": i == len(rows) - 1}
+
+        def forward(chunk, **kwargs):
+            row = rows[forward.calls]
+            forward.calls += 1
+            return {"tokens": torch.tensor([row]), "stride": (len(row), 0, 0), "is_last": chunk["is_last"]}
+
+        forward.calls = 0
+        with patch("transformers.pipelines.automatic_speech_recognition.chunk_stream_iter", chunks):
+            with patch.object(speech_recognizer, "forward", forward):
+                pieces = [output["text"] for output in speech_recognizer.stream([], chunk_length_s=2.0)]
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual("".join(pieces), expected)
+
     @require_torch
     def test_stride(self):
         speech_recognizer = pipeline(
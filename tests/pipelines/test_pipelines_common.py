@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import gc
+import itertools
 import logging
 import os
 import sys
@@ -29,6 +30,7 @@ from transformers import (
     AutomaticSpeechRecognitionPipeline,
     AutoModelForSequenceClassification,
     AutoTokenizer,
+    DistilBertConfig,
     DistilBertForSequenceClassification,
     MaskGenerationPipeline,
     T5ForConditionalGeneration,
@@ -37,7 +39,7 @@ from transformers import (
     TFAutoModelForSequenceClassification,
     pipeline,
 )
-from transformers.pipelines import PIPELINE_REGISTRY, get_task
+from transformers.pipelines import PIPELINE_REGISTRY, InMemoryPipelineCache, SQLitePipelineCache, get_task
 from transformers.pipelines.base import Pipeline, _pad
 from transformers.testing_utils import (
     TOKEN,
@@ -127,6 +129,171 @@ class CommonPipelineTest(unittest.TestCase):
         self.assertEqual(pipe._batch_size, 2)
         self.assertEqual(pipe._num_workers, 1)
 
+    @require_torch
+    def test_pipeline_num_processes(self):
+        pipe = pipeline("text-classification", model="hf-internal-testing/tiny-random-distilbert", framework="pt")
+        inputs = [f"This is test {i} " * (i % 7 + 1) for i in range(20)]
+        expected = pipe(inputs, batch_size=2)
+
+        outputs = pipe(inputs, batch_size=2, num_processes=2)
+        self.assertEqual(nested_simplify(outputs), nested_simplify(expected))
+        # The weights are shared with the workers rather than copied
+        self.assertTrue(all(param.is_shared() for param in pipe.model.parameters()))
+
+        outputs = pipe((text for text in inputs), num_processes=2)
+        self.assertEqual(nested_simplify(list(outputs)), nested_simplify(expected))
+        # Single inputs don't go through the workers
+        self.assertEqual(nested_simplify(pipe(inputs[0], num_processes=2)), nested_simplify([expected[0]]))
+
+    @require_torch
+    def test_pipeline_cache(self):
+        pipe = pipeline("text-classification", model="hf-internal-testing/tiny-random-distilbert", framework="pt")
+        inputs = [f"This is test {i} " * (i + 1) for i in range(5)]
+        expected = pipe(inputs)
+
+        forward_calls = []
+        for cache in [True, InMemoryPipelineCache(), os.path.join(tempfile.mkdtemp(), "cache.db")]:
+            cached_pipe = pipeline(
+                "text-classification", model="hf-internal-testing/tiny-random-distilbert", framework="pt", cache=cache
+            )
+            forward = cached_pipe._forward
+            cached_pipe._forward = lambda model_inputs, **kwargs: forward_calls.append(1) or forward(model_inputs)
+
+            forward_calls.clear()
+            # Duplicates within a batch only go through the model once
+            outputs = cached_pipe(inputs + inputs[::-1], batch_size=4)
+            self.assertEqual(nested_simplify(outputs), nested_simplify(expected + expected[::-1]))
+            self.assertLessEqual(len(forward_calls), 4)
+
+            forward_calls.clear()
+            self.assertEqual(nested_simplify(cached_pipe(inputs)), nested_simplify(expected))
+            self.assertEqual(nested_simplify(cached_pipe(inputs[0])), nested_simplify([expected[0]]))
+            self.assertEqual(forward_calls, [])
+
+    @require_torch
+    def test_pipeline_cache_model_fingerprint(self):
+        import torch
+
+        config = DistilBertConfig(vocab_size=99, dim=32, n_layers=1, n_heads=2, hidden_dim=37)
+
+        def get_prefix(model):
+            pipe = TextClassificationPipeline(model=model, framework="pt", cache=True)
+            return pipe._get_cache_key_prefix({})
+
+        # Models built from a config are told apart by their weights
+        torch.manual_seed(0)
+        model = DistilBertForSequenceClassification(config)
+        torch.manual_seed(1)
+        other_model = DistilBertForSequenceClassification(config)
+        self.assertEqual(get_prefix(model), get_prefix(model))
+        self.assertNotEqual(get_prefix(model), get_prefix(other_model))
+
+        # Models loaded from a local directory by their weight files
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model.save_pretrained(tmp_dir)
+            prefix = get_prefix(DistilBertForSequenceClassification.from_pretrained(tmp_dir))
+            self.assertEqual(prefix, get_prefix(DistilBertForSequenceClassification.from_pretrained(tmp_dir)))
+            other_model.save_pretrained(tmp_dir)
+            self.assertNotEqual(prefix, get_prefix(DistilBertForSequenceClassification.from_pretrained(tmp_dir)))
+
+    def test_pipeline_cache_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for cache in [
+                InMemoryPipelineCache(max_size=250),
+                SQLitePipelineCache(f"{tmp_dir}/cache.db", max_size=250),
+            ]:
+                cache.set("key0", b"x" * 100)
+                cache.set("key1", b"x" * 100)
+                # The least recently used entry is evicted first
+                self.assertEqual(cache.get("key0"), b"x" * 100)
+                cache.set("key2", b"y" * 100)
+                self.assertEqual(len(cache), 2)
+                self.assertIsNone(cache.get("key1"))
+                self.assertEqual(cache.get("key0"), b"x" * 100)
+                self.assertEqual(cache.get("key2"), b"y" * 100)
+                # Values larger than the cache are not stored
+                cache.set("key4", b"z" * 300)
+                self.assertIsNone(cache.get("key4"))
+                cache.clear()
+                self.assertEqual(len(cache), 0)
+
+            # The on-disk cache persists
+            cache = SQLitePipelineCache(f"{tmp_dir}/cache.db")
+            cache.set("key", b"value")
+            self.assertEqual(SQLitePipelineCache(f"{tmp_dir}/cache.db").get("key"), b"value")
+
+    @require_torch
+    def test_pipeline_cache_iterator(self):
+        from transformers.pipelines.pt_utils import PipelineCacheIterator
+
+        calls = []
+
+        def model_iterator_fn(items):
+            calls.append(items)
+            return ({"value": item * 10} for item in items)
+
+        def get_key(item):
+            # Negative items can't be cached
+            return None if item < 0 else str(item)
+
+        cache = InMemoryPipelineCache()
+        dataset = PipelineCacheIterator([1, 2, 1, -1, 3, -1], cache, get_key, model_iterator_fn, window_size=3)
+        self.assertEqual(list(dataset), [{"value": value} for value in [10, 20, 10, -10, 30, -10]])
+        self.assertEqual(calls, [[1, 2], [-1, 3, -1]])
+
+        calls.clear()
+        self.assertEqual(list(dataset), [{"value": value} for value in [10, 20, 10, -10, 30, -10]])
+        self.assertEqual(calls, [[-1, -1]])
+
+    @require_torch
+    def test_pipeline_cache_serialization(self):
+        import torch
+
+        from transformers.modeling_outputs import SequenceClassifierOutput
+        from transformers.pipelines.pt_utils import (
+            PipelineCacheIterator,
+            deserialize_model_outputs,
+            serialize_model_outputs,
+        )
+
+        logits = torch.randn(2, 3)
+        outputs = {
+            "model_outputs": SequenceClassifierOutput(logits=logits[0], hidden_states=(logits[1], logits[1])),
+            "input_ids": torch.tensor([[1, 2, 3]]),
+            "bf16": logits.to(torch.bfloat16),
+            "array": np.arange(4, dtype=np.float32),
+            "scalar": np.float32(0.5),
+            "offsets": [(0, 1), (1, 3)],
+            "text": "Hello",
+            "is_last": True,
+            "score": None,
+        }
+        loaded = deserialize_model_outputs(serialize_model_outputs(outputs))
+        self.assertIsInstance(loaded["model_outputs"], SequenceClassifierOutput)
+        self.assertIsInstance(loaded["model_outputs"].hidden_states, tuple)
+        self.assertEqual(nested_simplify(loaded), nested_simplify(outputs))
+        self.assertEqual(loaded["bf16"].dtype, torch.bfloat16)
+        self.assertIsInstance(loaded["scalar"], np.float32)
+        self.assertEqual(loaded["offsets"], [(0, 1), (1, 3)])
+
+        # Arbitrary objects are not serialized, and the outputs holding them are computed but not cached
+        with self.assertRaises(TypeError):
+            serialize_model_outputs({"object": object()})
+        # unless they are passed through from the inputs, which are given again when loading
+        inputs = {"object": object(), "input_ids": torch.tensor([[1, 2]])}
+        data = serialize_model_outputs({"logits": logits, **inputs}, inputs=inputs)
+        new_inputs = {"object": object(), "input_ids": torch.tensor([[1, 2]])}
+        loaded = deserialize_model_outputs(data, inputs=new_inputs)
+        self.assertEqual(list(loaded), ["logits", "object", "input_ids"])
+        self.assertIs(loaded["object"], new_inputs["object"])
+        self.assertIs(loaded["input_ids"], new_inputs["input_ids"])
+        torch.testing.assert_close(loaded["logits"], logits)
+        cache = InMemoryPipelineCache()
+        model_iterator_fn = lambda items: ({"value": item, "object": object()} for item in items)  # noqa: E731
+        dataset = PipelineCacheIterator([1, 1, 2], cache, str, model_iterator_fn, window_size=3)
+        self.assertEqual([output["value"] for output in dataset], [1, 1, 2])
+        self.assertEqual(len(cache), 0)
+
     @require_torch
     def test_pipeline_pathlike(self):
         pipe = pipeline(model="hf-internal-testing/tiny-random-distilbert")
@@ -433,6 +600,141 @@ class PipelineUtilsTest(unittest.TestCase):
             nested_simplify(outputs), [{"id": [[12, 22]]}, {"id": [[2, 3]]}, {"id": [[2, 4]]}, {"id": [[5]]}]
         )
 
+    @require_torch
+    def test_pipeline_dynamic_batch_iterator(self):
+        import torch
+
+        from transformers.pipelines.pt_utils import PipelineDynamicBatchIterator
+
+        lengths = [3, 8, 2, 8, 5, 1, 3]
+        dummy_dataset = [{"input_ids": torch.full((1, length), i)} for i, length in enumerate(lengths)]
+        batch_shapes = []
+
+        def collate(items):
+            max_length = max(item["input_ids"].shape[1] for item in items)
+            input_ids = torch.zeros((len(items), max_length), dtype=torch.long)
+            for i, item in enumerate(items):
+                input_ids[i, : item["input_ids"].shape[1]] = item["input_ids"][0]
+            return {"input_ids": input_ids}
+
+        def forward(batch):
+            batch_shapes.append(tuple(batch["input_ids"].shape))
+            return {"id": batch["input_ids"][:, 0]}
+
+        dataset = PipelineDynamicBatchIterator(dummy_dataset, forward, {}, collate, max_batch_tokens=16, window_size=5)
+        self.assertEqual(len(dataset), 7)
+
+        outputs = list(dataset)
+        # outputs come back in input order
+        self.assertEqual(nested_simplify(outputs), [{"id": [i]} for i in range(7)])
+        # first window sorted by length (8, 8, 5, 3, 2), then the rest (3, 1), under 16 tokens per padded batch
+        self.assertEqual(batch_shapes, [(2, 8), (3, 5), (2, 3)])
+
+    @require_torch
+    def test_pipeline_packed_iterator(self):
+        import torch
+
+        from transformers.pipelines.pt_utils import PipelinePackedIterator
+
+        lengths = [3, 2, 4, 1]
+        dummy_dataset = [
+            {"input_ids": torch.arange(length)[None] + 10 * i, "attention_mask": torch.ones(1, length), "id": i}
+            for i, length in enumerate(lengths)
+        ]
+        packed_batches = []
+
+        def forward(batch):
+            packed_batches.append(batch)
+            return {
+                "logits": batch["input_ids"][..., None].float(),
+                "pooled": batch["input_ids"].sum(-1),
+                "attention_mask": batch["attention_mask"],
+                "id": batch["id"],
+            }
+
+        dataset = PipelinePackedIterator(dummy_dataset, forward, {}, max_batch_tokens=5, position_offset=2)
+        outputs = list(dataset)
+
+        # consecutive sequences are packed while they fit in 5 tokens
+        self.assertEqual([batch["id"] for batch in packed_batches], [[0, 1], [2, 3]])
+        self.assertEqual(packed_batches[0]["input_ids"].tolist(), [[0, 1, 2, 10, 11]])
+        self.assertEqual(packed_batches[0]["position_ids"].tolist(), [[2, 3, 4, 2, 3]])
+        # block-diagonal attention mask
+        self.assertEqual(
+            packed_batches[1]["attention_mask"][0].tolist(),
+            [[1, 1, 1, 1, 0], [1, 1, 1, 1, 0], [1, 1, 1, 1, 0], [1, 1, 1, 1, 0], [0, 0, 0, 0, 1]],
+        )
+
+        self.assertEqual([output["id"] for output in outputs], [0, 1, 2, 3])
+        for output, item in zip(outputs, dummy_dataset):
+            self.assertEqual(output["logits"][..., 0].tolist(), item["input_ids"].tolist())
+            self.assertEqual(output["attention_mask"].tolist(), item["attention_mask"].tolist())
+            # outputs over the whole packed row are dropped
+            self.assertIsNone(output["pooled"])
+
+    @require_torch
+    def test_pipeline_prefetch_iterator(self):
+        from transformers.pipelines.pt_utils import PipelineIterator, PipelinePrefetchIterator
+
+        def dummy_dataset():
+            yield from range(10)
+
+        dataset = PipelinePrefetchIterator(PipelineIterator(dummy_dataset(), lambda x: x * 2, {}), max_prefetch=3)
+        iterator = iter(dataset)
+        # `islice` calls `iter` on the iterator again, which must not restart it
+        self.assertEqual(list(itertools.islice(iterator, 4)), [0, 2, 4, 6])
+        self.assertEqual(list(iterator), [8, 10, 12, 14, 16, 18])
+        self.assertEqual(list(iterator), [])
+
+        def failing_preprocess(x):
+            if x == 3:
+                raise ValueError("Invalid input")
+            return x
+
+        dataset = PipelinePrefetchIterator(PipelineIterator(dummy_dataset(), failing_preprocess, {}))
+        outputs = []
+        with self.assertRaises(ValueError):
+            for output in dataset:
+                outputs.append(output)
+        self.assertEqual(outputs, [0, 1, 2])
+
+    @require_torch
+    def test_pipeline_thread_pool_iterator(self):
+        import time
+
+        from transformers.pipelines.pt_utils import PipelineThreadPoolIterator
+
+        def slow_postprocess(x, delay):
+            # later items finish first
+            time.sleep(delay * (10 - x))
+            return x * 2
+
+        dataset = PipelineThreadPoolIterator(list(range(10)), slow_postprocess, {"delay": 0.002}, num_threads=3)
+        self.assertEqual(len(dataset), 10)
+        self.assertEqual(list(dataset), [2 * i for i in range(10)])
+
+        # The queued items are cancelled when the consumer stops early or `infer` raises
+        processed = []
+
+        def record(x):
+            time.sleep(0.01)
+            if x == 3:
+                raise ValueError("error")
+            processed.append(x)
+            return x
+
+        iterator = iter(PipelineThreadPoolIterator(list(range(100)), record, {}, num_threads=1))
+        self.assertEqual(next(iterator), 0)
+        iterator.close()
+        time.sleep(0.1)
+        self.assertLess(len(processed), 5)
+
+        processed.clear()
+        with self.assertRaises(ValueError):
+            list(PipelineThreadPoolIterator(list(range(100)), record, {}, num_threads=1))
+        time.sleep(0.1)
+        self.assertLess(len(processed), 10)
+
     @require_torch
     def test_pipeline_chunk_iterator(self):
         from transformers.pipelines.pt_utils import PipelineChunkIterator
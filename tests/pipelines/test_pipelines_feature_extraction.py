@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tempfile
 import unittest
 
 import numpy as np
@@ -96,6 +98,65 @@ class FeatureExtractionPipelineTests(unittest.TestCase):
         outputs = feature_extractor("This is a test", return_tensors=True)
         self.assertTrue(torch.is_tensor(outputs))
 
+    @require_torch
+    def test_pooling_pt(self):
+        feature_extractor = pipeline(
+            task="feature-extraction", model="hf-internal-testing/tiny-random-distilbert", framework="pt"
+        )
+        texts = ["This is a test", "This", "This is a longer test with more words"]
+        features = [torch.tensor(feature_extractor(text))[0] for text in texts]
+        expected = {
+            "mean": torch.stack([feature.mean(dim=0) for feature in features]),
+            "cls": torch.stack([feature[0] for feature in features]),
+            "last": torch.stack([feature[-1] for feature in features]),
+        }
+        for pooling, expected_embeddings in expected.items():
+            outputs = feature_extractor(texts, pooling=pooling, batch_size=2, return_tensors=True)
+            self.assertEqual([output.shape for output in outputs], [(1, 32)] * 3)
+            torch.testing.assert_close(torch.cat(outputs), expected_embeddings, rtol=1e-4, atol=1e-4)
+
+        with self.assertRaises(ValueError):
+            feature_extractor(texts, pooling="max")
+
+    @require_torch
+    def test_save_embeddings_pt(self):
+        feature_extractor = pipeline(
+            task="feature-extraction", model="hf-internal-testing/tiny-random-distilbert", framework="pt"
+        )
+        texts = [f"This is test {i} " * (i % 3 + 1) for i in range(10)]
+        expected = torch.cat(feature_extractor(texts, pooling="cls", return_tensors=True)).numpy()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for filename in ["embeddings.npy", "embeddings.safetensors"]:
+                path = os.path.join(tmp_dir, filename)
+                embeddings = feature_extractor.save_embeddings(texts, path, pooling="cls", batch_size=4)
+                self.assertEqual(embeddings.shape, (10, 32))
+                self.assertEqual(embeddings.dtype, np.float32)
+                np.testing.assert_allclose(embeddings, expected, rtol=1e-4, atol=1e-4)
+
+            def interrupted_texts():
+                yield from texts[:7]
+                raise KeyboardInterrupt
+
+            path = os.path.join(tmp_dir, "resumed.npy")
+            with self.assertRaises(KeyboardInterrupt):
+                feature_extractor.save_embeddings(
+                    interrupted_texts(), path, pooling="cls", num_inputs=10, checkpoint_interval=3
+                )
+            self.assertTrue(os.path.exists(f"{path}.progress"))
+
+            # Only the texts after the last saved progress are embedded again
+            forward = feature_extractor._forward
+            num_forwards = []
+            feature_extractor._forward = lambda *args, **kwargs: num_forwards.append(1) or forward(*args, **kwargs)
+            embeddings = feature_extractor.save_embeddings(texts, path, pooling="cls")
+            self.assertEqual(len(num_forwards), 4)
+            self.assertFalse(os.path.exists(f"{path}.progress"))
+            np.testing.assert_allclose(embeddings, expected, rtol=1e-4, atol=1e-4)
+
+            with self.assertRaises(ValueError):
+                feature_extractor.save_embeddings(texts, path, pooling="cls", dtype="float16")
+
     def get_shape(self, input_, shape=None):
         if shape is None:
             shape = []
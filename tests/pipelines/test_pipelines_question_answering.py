@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tempfile
 import unittest
 
 from huggingface_hub import QuestionAnsweringOutputElement
@@ -19,6 +21,9 @@ from huggingface_hub import QuestionAnsweringOutputElement
 from transformers import (
     MODEL_FOR_QUESTION_ANSWERING_MAPPING,
     TF_MODEL_FOR_QUESTION_ANSWERING_MAPPING,
+    BertConfig,
+    BertForQuestionAnswering,
+    BertTokenizer,
     LxmertConfig,
     QuestionAnsweringPipeline,
 )
@@ -173,6 +178,38 @@ class QAPipelineTests(unittest.TestCase):
 
         self.assertEqual(nested_simplify(outputs), {"score": 0.01, "start": 0, "end": 11, "answer": "HuggingFace"})
 
+    @require_torch
+    def test_small_model_pt_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vocab_file = os.path.join(tmp_dir, "vocab.txt")
+            with open(vocab_file, "w") as f:
+                f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "where", "is", "a", "test", "this"]))
+            tokenizer = BertTokenizer(vocab_file)
+        config = BertConfig(
+            vocab_size=10, hidden_size=32, num_hidden_layers=1, num_attention_heads=2, intermediate_size=37
+        )
+        model = BertForQuestionAnswering(config).eval()
+        question_answerer = QuestionAnsweringPipeline(model=model, tokenizer=tokenizer, framework="pt")
+        cached_question_answerer = QuestionAnsweringPipeline(
+            model=model, tokenizer=tokenizer, framework="pt", cache=True
+        )
+        forward = cached_question_answerer._forward
+        forward_calls = []
+        cached_question_answerer._forward = lambda inputs: forward_calls.append(1) or forward(inputs)
+
+        inputs = {"question": "where is this", "context": "this is a test where this is a test is a test"}
+        # Several chunks per example with `doc_stride`
+        for kwargs in [{}, {"doc_stride": 2, "max_seq_len": 12}]:
+            expected = question_answerer(**inputs, **kwargs)
+            forward_calls.clear()
+            self.assertEqual(cached_question_answerer(**inputs, **kwargs), expected)
+            self.assertGreater(len(forward_calls), 0)
+
+            # The `SquadExample` passed through the forward is not cached, but taken from the new inputs
+            forward_calls.clear()
+            self.assertEqual(cached_question_answerer(**inputs, **kwargs), expected)
+            self.assertEqual(forward_calls, [])
+
     @require_torch
     def test_small_model_pt_fp16(self):
         question_answerer = pipeline(
@@ -295,6 +332,46 @@ class QAPipelineTests(unittest.TestCase):
         answers = [output["answer"] for output in outputs]
         self.assertEqual(len(answers), len(set(answers)), "There are duplicate answers in the outputs.")
 
+    @require_torch
+    def test_select_starts_ends_batched(self):
+        import numpy as np
+
+        from transformers.pipelines.question_answering import select_starts_ends, select_starts_ends_batched
+
+        torch.manual_seed(0)
+        num_chunks, seq_len = 4, 32
+        start = torch.randn(num_chunks, seq_len) * 3
+        end = torch.randn(num_chunks, seq_len) * 3
+        # question tokens, and the padding of the last chunk
+        p_mask = torch.zeros(num_chunks, seq_len, dtype=torch.long)
+        p_mask[:, 1:6] = 1
+        p_mask[-1, 20:] = 1
+        attention_mask = torch.ones(num_chunks, seq_len, dtype=torch.long)
+        attention_mask[-1, 20:] = 0
+
+        for top_k, max_answer_len in [(1, 15), (5, 3), (10, 40)]:
+            starts, ends, scores, is_valid, min_null_score = select_starts_ends_batched(
+                start, end, p_mask, attention_mask, top_k, True, max_answer_len
+            )
+            expected_min_null_score = 1000000
+            for i in range(num_chunks):
+                expected_starts, expected_ends, expected_scores, expected_min_null_score = select_starts_ends(
+                    start[i : i + 1].numpy(),
+                    end[i : i + 1].numpy(),
+                    p_mask[i : i + 1].numpy(),
+                    attention_mask[i : i + 1].numpy(),
+                    expected_min_null_score,
+                    top_k,
+                    True,
+                    max_answer_len,
+                )
+                self.assertEqual(starts[i][is_valid[i]].tolist(), expected_starts.tolist())
+                self.assertEqual(ends[i][is_valid[i]].tolist(), expected_ends.tolist())
+                self.assertTrue(np.allclose(scores[i][is_valid[i]].numpy(), expected_scores, atol=1e-6))
+                # spans are in the context, and not longer than `max_answer_len`
+                self.assertTrue(((ends[i] - starts[i]) < max_answer_len).all())
+            self.assertAlmostEqual(min_null_score, expected_min_null_score, places=6)
+
     @slow
     @require_torch
     def test_large_model_pt(self):
@@ -789,6 +789,43 @@ class TokenClassificationPipelineTests(unittest.TestCase):
             ],
         )
 
+    @require_torch
+    def test_aggregate_from_offsets(self):
+        model_name = "sshleifer/tiny-dbmdz-bert-large-cased-finetuned-conll03-english"
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        token_classifier = pipeline(task="ner", model=model_name, tokenizer=tokenizer, framework="pt")
+
+        sentence = "Enzo works at the UN in Geneva, Switzerland"
+        tokens = tokenizer(sentence, return_special_tokens_mask=True, return_offsets_mapping=True)
+        offset_mapping = np.array(tokens["offset_mapping"])
+        special_tokens_mask = np.array(tokens["special_tokens_mask"])
+        input_ids = np.array(tokens["input_ids"])
+        rng = np.random.default_rng(0)
+        logits = rng.normal(scale=3.0, size=(len(input_ids), len(token_classifier.model.config.id2label)))
+        scores = np.exp(logits) / np.exp(logits).sum(-1, keepdims=True)
+
+        # Same entities as `gather_pre_entities` followed by `aggregate`, for every strategy
+        for aggregation_strategy in AggregationStrategy:
+            for ignore_labels in [["O"], []]:
+                pre_entities = token_classifier.gather_pre_entities(
+                    sentence, input_ids, scores, offset_mapping, special_tokens_mask, aggregation_strategy
+                )
+                expected = [
+                    entity
+                    for entity in token_classifier.aggregate(pre_entities, aggregation_strategy)
+                    if entity.get("entity") not in ignore_labels and entity.get("entity_group") not in ignore_labels
+                ]
+                entities = token_classifier.aggregate_from_offsets(
+                    sentence,
+                    input_ids,
+                    scores,
+                    offset_mapping,
+                    special_tokens_mask,
+                    aggregation_strategy,
+                    ignore_labels,
+                )
+                self.assertEqual(nested_simplify(entities), nested_simplify(expected))
+
     @require_torch
     def test_word_heuristic_leading_space(self):
         model_name = "hf-internal-testing/tiny-random-deberta-v2"
@@ -12,11 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tempfile
 import unittest
+import warnings
 
 from transformers import (
     MODEL_FOR_SEQUENCE_CLASSIFICATION_MAPPING,
     TF_MODEL_FOR_SEQUENCE_CLASSIFICATION_MAPPING,
+    BertConfig,
+    BertForSequenceClassification,
+    BertTokenizer,
     Pipeline,
     ZeroShotClassificationPipeline,
     pipeline,
@@ -118,6 +124,23 @@ class ZeroShotClassificationPipelineTests(unittest.TestCase):
             ],
         )
 
+        # Scoring all the candidate labels in a single forward pass gives the same results
+        for multi_label in [False, True]:
+            outputs = classifier(
+                ["I am happy", "I am sad"], ["positive", "negative", "neutral"], multi_label=multi_label
+            )
+            batched_outputs = classifier(
+                ["I am happy", "I am sad"],
+                ["positive", "negative", "neutral"],
+                multi_label=multi_label,
+                batch_candidate_labels=True,
+            )
+            for output, batched_output in zip(outputs, batched_outputs):
+                self.assertEqual(
+                    nested_simplify(dict(zip(output["labels"], output["scores"]))),
+                    nested_simplify(dict(zip(batched_output["labels"], batched_output["scores"]))),
+                )
+
         with self.assertRaises(ValueError):
             classifier("", candidate_labels="politics")
 
@@ -180,6 +203,49 @@ class ZeroShotClassificationPipelineTests(unittest.TestCase):
             "Who are you voting for in 2020?" * 100, candidate_labels=["politics", "public health", "science"]
         )
 
+    def get_local_pipeline(self):
+        # A randomly initialized model, which does not require the Hub
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vocab_file = os.path.join(tmp_dir, "vocab.txt")
+            with open(vocab_file, "w") as f:
+                f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "this", "is", "a", "test", "sport"]))
+            tokenizer = BertTokenizer(vocab_file)
+        config = BertConfig(
+            vocab_size=10,
+            hidden_size=32,
+            num_hidden_layers=1,
+            num_attention_heads=2,
+            intermediate_size=37,
+            id2label={0: "entailment", 1: "neutral", 2: "contradiction"},
+            label2id={"entailment": 0, "neutral": 1, "contradiction": 2},
+        )
+        return ZeroShotClassificationPipeline(
+            model=BertForSequenceClassification(config).eval(), tokenizer=tokenizer, framework="pt"
+        )
+
+    @require_torch
+    def test_no_dataloader_length_warnings(self):
+        classifier = self.get_local_pipeline()
+        sequences = ["this is a test", "a test", "this is"]
+        candidate_labels = ["sport", "test", "this"]
+        expected = classifier(sequences, candidate_labels=candidate_labels)
+
+        # Every sequence is split in one chunk per label, more items than the length reported by the dataloader
+        cached_classifier = ZeroShotClassificationPipeline(
+            model=classifier.model, tokenizer=classifier.tokenizer, framework="pt", cache=True
+        )
+        for pipe, kwargs in [
+            (classifier, {"postprocess_workers": 2}),
+            (classifier, {"postprocess_workers": 2, "batch_size": 2}),
+            (cached_classifier, {}),
+            (cached_classifier, {"batch_size": 2}),
+        ]:
+            with warnings.catch_warnings(record=True) as caught_warnings:
+                warnings.simplefilter("always")
+                outputs = pipe(sequences, candidate_labels=candidate_labels, **kwargs)
+            self.assertEqual([str(warning.message) for warning in caught_warnings], [])
+            self.assertEqual(nested_simplify(outputs), nested_simplify(expected))
+
     @require_torch
     def test_small_model_pt(self):
         zero_shot_classifier = pipeline(
@@ -200,6 +266,28 @@ class ZeroShotClassificationPipelineTests(unittest.TestCase):
             },
         )
 
+    @require_torch
+    def test_small_model_pt_batch_candidate_labels(self):
+        zero_shot_classifier = pipeline(
+            "zero-shot-classification",
+            model="sshleifer/tiny-distilbert-base-cased-distilled-squad",
+            framework="pt",
+            batch_candidate_labels=True,
+        )
+        outputs = zero_shot_classifier(
+            "Who are you voting for in 2020?", candidate_labels=["politics", "public health", "science"]
+        )
+
+        self.assertEqual(
+            nested_simplify(outputs),
+            {"sequence": "Who are you voting for in 2020?", "labels": ANY(list), "scores": [0.333, 0.333, 0.333]},
+        )
+        self.assertEqual(sorted(outputs["labels"]), ["politics", "public health", "science"])
+        # the hypotheses are tokenized once, and reused by the next calls
+        self.assertEqual(len(zero_shot_classifier._hypothesis_ids_cache), 3)
+        zero_shot_classifier(["I am happy", "I am sad"], candidate_labels=["politics", "public health", "science"])
+        self.assertEqual(len(zero_shot_classifier._hypothesis_ids_cache), 3)
+
     @require_torch
     def test_small_model_pt_fp16(self):
         zero_shot_classifier = pipeline(
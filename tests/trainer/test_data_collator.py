@@ -220,6 +220,56 @@ class DataCollatorIntegrationTest(unittest.TestCase):
         self.assertEqual(batch["seq_idx"].shape, batch["input_ids"].shape)
         self.assertEqual(batch["seq_idx"][0].tolist(), [0, 0, 0, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2])
 
+    def test_data_collator_with_flattening_arrays(self):
+        # Sequences given as arrays (e.g. from a dataset formatted as numpy) give the same batch as lists
+        features = [
+            {"input_ids": [10, 11, 12], "labels": [1, 2, 3]},
+            {"input_ids": [20, 21, 22, 23, 24, 25], "labels": [4, 5, 6, 7, 8, 9]},
+            {"input_ids": [30, 31, 32, 33, 34, 35, 36], "labels": [10, 11, 12, 13, 14, 15, 16]},
+        ]
+        array_features = [{key: np.array(value, dtype=np.int32) for key, value in f.items()} for f in features]
+        data_collator = DataCollatorWithFlattening(
+            return_tensors="pt", return_flash_attn_kwargs=True, return_seq_idx=True
+        )
+        batch = data_collator(features)
+        array_batch = data_collator(array_features)
+
+        self.assertEqual(batch.keys(), array_batch.keys())
+        for key, value in batch.items():
+            if isinstance(value, int):
+                self.assertEqual(array_batch[key], value)
+            else:
+                self.assertEqual(array_batch[key].dtype, value.dtype)
+                self.assertTrue(torch.equal(array_batch[key], value))
+        self.assertEqual(batch["labels"][0].tolist(), [-100, 2, 3, -100, 5, 6, 7, 8, 9, -100, 11, 12, 13, 14, 15, 16])
+        self.assertEqual(batch["input_ids"].dtype, torch.int64)
+        self.assertEqual(batch["seq_idx"].dtype, torch.int32)
+        self.assertEqual(batch["cu_seq_lens_q"].tolist(), [0, 3, 9, 16])
+        self.assertEqual(batch["max_length_q"], 7)
+
+    def test_data_collator_with_padding_matches_tokenizer_pad(self):
+        tokenizer = BertTokenizer(self.vocab_file)
+        features = [
+            {"input_ids": [0, 1, 2], "token_type_ids": [0, 0, 1], "special_tokens_mask": [1, 0, 1], "label": 1},
+            {"input_ids": [0, 1, 2, 3, 4, 5], "token_type_ids": [0] * 6, "special_tokens_mask": [0] * 6, "label": 0},
+            {"input_ids": [], "token_type_ids": [], "special_tokens_mask": [], "label": 2},
+        ]
+        for padding_side in ["right", "left"]:
+            tokenizer.padding_side = padding_side
+            for kwargs in [{}, {"pad_to_multiple_of": 4}, {"padding": "max_length", "max_length": 10}]:
+                batch = DataCollatorWithPadding(tokenizer, **kwargs)(features)
+                expected = tokenizer.pad(features, return_tensors="pt", **kwargs)
+                expected["labels"] = expected.pop("label")
+                self.assertEqual(list(batch.keys()), list(expected.keys()))
+                for key, value in expected.items():
+                    self.assertEqual(batch[key].dtype, value.dtype)
+                    self.assertTrue(torch.equal(batch[key], value), key)
+
+        # Falls back to `tokenizer.pad` for the inputs that it can't pad
+        features = [{"input_ids": [0, 1, 2], "label": 0.5}, {"input_ids": [0, 1, 2, 3], "label": 1.5}]
+        batch = DataCollatorWithPadding(tokenizer)(features)
+        self.assertEqual(batch["labels"].dtype, torch.float32)
+
     def test_data_collator_for_token_classification(self):
         tokenizer = BertTokenizer(self.vocab_file)
         features = [
@@ -41,6 +41,7 @@ from transformers import (
     AutoProcessor,
     AutoTokenizer,
     DataCollatorForLanguageModeling,
+    DataCollatorWithFlattening,
     IntervalStrategy,
     PretrainedConfig,
     TrainerCallback,
@@ -155,7 +156,7 @@ if is_torch_available():
         Trainer,
         TrainerState,
     )
-    from transformers.trainer_pt_utils import AcceleratorConfig
+    from transformers.trainer_pt_utils import AcceleratorConfig, StreamingMetric, StreamingPerplexity
 
     if is_safetensors_available():
         import safetensors.torch
@@ -165,9 +166,14 @@ if is_torch_available():
 require_accelerate_version_min_0_28 = partial(require_accelerate, min_version="0.28")
 require_accelerate_version_min_0_30 = partial(require_accelerate, min_version="0.30")
 GRAD_ACCUM_KWARGS_VERSION_AVAILABLE = is_accelerate_available("0.28")
+STATEFUL_DATALOADER_AVAILABLE = False
 if is_accelerate_available():
     from accelerate import Accelerator
     from accelerate.state import AcceleratorState
+if is_accelerate_available("0.34.0"):
+    from accelerate.utils import is_torchdata_stateful_dataloader_available
+
+    STATEFUL_DATALOADER_AVAILABLE = is_torchdata_stateful_dataloader_available()
 
 
 PATH_SAMPLE_TEXT = f"{get_tests_dir()}/fixtures/sample_text.txt"
@@ -362,6 +368,20 @@ class RegressionModelConfig(PretrainedConfig):
 
 if is_torch_available():
 
+    class AlmostAccuracyStreaming(StreamingMetric):
+        def __init__(self, thresh=0.25):
+            super().__init__()
+            self.thresh = thresh
+            self.add_state("correct", torch.tensor(0))
+            self.add_state("total", torch.tensor(0))
+
+        def update(self, predictions, labels, losses=None):
+            self.correct += (torch.abs(predictions - labels) <= self.thresh).sum()
+            self.total += labels.numel()
+
+        def compute(self):
+            return {"accuracy": (self.correct / self.total).item()}
+
     class SampleIterableDataset(IterableDataset):
         def __init__(self, a=2, b=3, length=64, seed=42, label_names=None):
             self.dataset = RegressionDataset(a=a, b=b, length=length, seed=seed, label_names=label_names)
@@ -1663,6 +1683,33 @@ class TrainerIntegrationTest(TestCasePlus, TrainerIntegrationCommon):
         new_eval_dataset = RegressionDataset(length=128)
         self.assertEqual(len(trainer.get_eval_dataloader(new_eval_dataset)), 128 // (32 * n_gpu))
 
+    def test_train_with_max_tokens_per_batch(self):
+        config = LlamaConfig(vocab_size=100, hidden_size=32, num_hidden_layers=2, num_attention_heads=4)
+        tiny_llama = LlamaForCausalLM(config)
+        lengths = torch.randint(1, 40, (64,)).tolist()
+        train_dataset = [{"input_ids": torch.randint(0, 100, (length,)).tolist()} for length in lengths]
+        args = TrainingArguments(
+            self.get_auto_remove_tmp_dir(), max_tokens_per_batch=64, num_train_epochs=2, report_to="none"
+        )
+        trainer = Trainer(tiny_llama, args, train_dataset=train_dataset, data_collator=DataCollatorWithFlattening())
+
+        train_dataloader = trainer.get_train_dataloader()
+        num_tokens = [batch["input_ids"].shape[1] for batch in train_dataloader]
+        self.assertEqual(len(num_tokens), len(train_dataloader))
+        self.assertEqual(sum(num_tokens), sum(lengths))
+        self.assertLessEqual(max(num_tokens), 64)
+        # Packing leaves little room in the batches
+        self.assertLess(len(num_tokens), sum(lengths) / 64 + 4)
+
+        # The number of training steps is computed from the first epoch
+        with CaptureLogger(logging.get_logger("transformers.trainer")) as cl:
+            train_output = trainer.train()
+        self.assertEqual(train_output.global_step, 2 * len(train_dataloader))
+        self.assertIn("the number of batches varies from epoch to epoch", cl.out)
+
+        with self.assertRaises(ValueError):
+            TrainingArguments(self.get_auto_remove_tmp_dir(), max_tokens_per_batch=64, dataloader_drop_last=True)
+
     # tests that we do not require dataloader to have a .dataset attribute
     def test_dataloader_without_dataset(self):
         train_dataset = RegressionDataset(length=128)
@@ -2594,6 +2641,47 @@ class TrainerIntegrationTest(TestCasePlus, TrainerIntegrationCommon):
             expected_acc = AlmostAccuracy()((pred + 1, y))["accuracy"]
             self.assertAlmostEqual(results["eval_accuracy"], expected_acc)
 
+    def test_evaluate_with_streaming_metric(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # With a number of elements not a round multiple of the batch size
+            trainer = get_regression_trainer(
+                a=1.5, b=2.5, eval_len=66, compute_metrics=AlmostAccuracyStreaming(), output_dir=tmp_dir
+            )
+            results = trainer.evaluate()
+
+            x, y = trainer.eval_dataset.x, trainer.eval_dataset.ys[0]
+            pred = 1.5 * x + 2.5
+            expected_loss = ((pred - y) ** 2).mean()
+            self.assertAlmostEqual(results["eval_loss"], expected_loss)
+            expected_acc = AlmostAccuracy()((pred, y))["accuracy"]
+            self.assertAlmostEqual(results["eval_accuracy"], expected_acc)
+
+            # The predictions are still returned by `predict`
+            output = trainer.predict(trainer.eval_dataset)
+            self.assertTrue(np.allclose(output.predictions, pred))
+            self.assertAlmostEqual(output.metrics["test_accuracy"], expected_acc)
+
+            # With logits preprocess
+            trainer = get_regression_trainer(
+                a=1.5,
+                b=2.5,
+                compute_metrics=AlmostAccuracyStreaming(),
+                preprocess_logits_for_metrics=lambda logits, labels: logits + 1,
+                output_dir=tmp_dir,
+            )
+            results = trainer.evaluate()
+
+            x, y = trainer.eval_dataset.x, trainer.eval_dataset.ys[0]
+            expected_acc = AlmostAccuracy()((1.5 * x + 2.5 + 1, y))["accuracy"]
+            self.assertAlmostEqual(results["eval_accuracy"], expected_acc)
+
+            # With a metric that only needs the losses
+            trainer = get_regression_trainer(
+                a=1.5, b=2.5, eval_len=66, compute_metrics=StreamingPerplexity(from_loss=True), output_dir=tmp_dir
+            )
+            results = trainer.evaluate()
+            self.assertAlmostEqual(results["eval_perplexity"], math.exp(results["eval_loss"]), places=5)
+
     def test_evaluate_with_jit(self):
         with tempfile.TemporaryDirectory() as tmp_dir:
             trainer = get_regression_trainer(
@@ -2859,6 +2947,68 @@ class TrainerIntegrationTest(TestCasePlus, TrainerIntegrationCommon):
         trainer.train()
         self.check_saved_checkpoints(tmp_dir, 5, int(self.n_epochs * 64 / self.batch_size), False)
 
+    def test_save_checkpoints_async(self):
+        tmp_dir = self.get_auto_remove_tmp_dir()
+        trainer = get_regression_trainer(output_dir=tmp_dir, save_steps=5, save_async=True)
+        trainer.train()
+        self.check_saved_checkpoints(tmp_dir, 5, int(self.n_epochs * 64 / self.batch_size))
+        self.assertFalse(any(name.startswith("tmp-") for name in os.listdir(tmp_dir)))
+
+        # The checkpoints are snapshots of the step they were saved at
+        sync_dir = self.get_auto_remove_tmp_dir()
+        trainer = get_regression_trainer(output_dir=sync_dir, save_steps=5)
+        trainer.train()
+        for step in [5, 10]:
+            async_state = safetensors.torch.load_file(os.path.join(tmp_dir, f"checkpoint-{step}", SAFE_WEIGHTS_NAME))
+            sync_state = safetensors.torch.load_file(os.path.join(sync_dir, f"checkpoint-{step}", SAFE_WEIGHTS_NAME))
+            for name in sync_state:
+                self.assertTrue(torch.equal(async_state[name], sync_state[name]))
+
+        # Rotation, with a regular model that is not a PreTrainedModel and several checkpoints being written
+        tmp_dir = self.get_auto_remove_tmp_dir()
+        trainer = get_regression_trainer(
+            output_dir=tmp_dir,
+            save_steps=2,
+            save_total_limit=2,
+            pretrained=False,
+            save_async=True,
+            save_async_max_pending=2,
+        )
+        trainer.train()
+        self.assertEqual(sorted(os.listdir(tmp_dir)), ["checkpoint-22", "checkpoint-24"])
+
+        # Training can be resumed from a checkpoint written in the background
+        kwargs = {"output_dir": tmp_dir, "train_len": 128, "save_steps": 5, "learning_rate": 0.1, "save_async": True}
+        trainer = get_regression_trainer(**kwargs)
+        trainer.train()
+        (a, b) = trainer.model.a.item(), trainer.model.b.item()
+        trainer = get_regression_trainer(**kwargs)
+        trainer.train(resume_from_checkpoint=os.path.join(tmp_dir, "checkpoint-15"))
+        self.assertEqual((a, b), (trainer.model.a.item(), trainer.model.b.item()))
+
+    def test_finalize_local_checkpoint_async(self):
+        tmp_dir = self.get_auto_remove_tmp_dir()
+        trainer = get_regression_trainer(output_dir=tmp_dir, save_async=True)
+        tmp_output_dir = os.path.join(tmp_dir, "tmp-checkpoint-5")
+        output_dir = os.path.join(tmp_dir, "checkpoint-5")
+
+        # The main process shares the filesystem, its writer finalizes the checkpoint
+        os.makedirs(tmp_output_dir)
+        for process_index in range(2):
+            torch.save({}, os.path.join(tmp_output_dir, f"rng_state_{process_index}.pth"))
+        trainer._finalize_local_checkpoint(tmp_output_dir, output_dir)
+        self.assertEqual(os.listdir(tmp_dir), ["tmp-checkpoint-5"])
+
+        # On another node, the states of its processes are moved to the checkpoint folder
+        os.remove(os.path.join(tmp_output_dir, "rng_state_0.pth"))
+        trainer._finalize_local_checkpoint(tmp_output_dir, output_dir)
+        self.assertEqual(os.listdir(tmp_dir), ["checkpoint-5"])
+        self.assertEqual(os.listdir(output_dir), ["rng_state_1.pth"])
+
+        # Nothing to do once the folder was renamed by the writer of the main process
+        trainer._finalize_local_checkpoint(tmp_output_dir, output_dir)
+        self.assertEqual(os.listdir(tmp_dir), ["checkpoint-5"])
+
     @require_safetensors
     def test_safe_checkpoints(self):
         for save_safetensors in [True, False]:
@@ -3308,6 +3458,37 @@ class TrainerIntegrationTest(TestCasePlus, TrainerIntegrationCommon):
             self.assertEqual(b, b1)
             self.check_trainer_state_are_the_same(state, state1)
 
+    @unittest.skipUnless(STATEFUL_DATALOADER_AVAILABLE, "test requires torchdata's StatefulDataLoader")
+    @require_torch_up_to_2_accelerators
+    def test_resume_training_with_stateful_dataloader(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            kwargs = {
+                "output_dir": tmpdir,
+                "train_len": 128,
+                "save_steps": 5,
+                "learning_rate": 0.1,
+                "accelerator_config": {"use_stateful_dataloader": True},
+            }
+            trainer = get_regression_trainer(**kwargs)
+            trainer.train()
+            (a, b) = trainer.model.a.item(), trainer.model.b.item()
+            state = dataclasses.asdict(trainer.state)
+
+            # The checkpoint saved mid-epoch knows where the dataloader stopped
+            checkpoint = os.path.join(tmpdir, "checkpoint-5")
+            self.assertTrue(os.path.isfile(os.path.join(checkpoint, "dataloader_state.pth")))
+
+            # Reinitialize trainer, the trained batches are not iterated over again
+            trainer = get_regression_trainer(**kwargs)
+            with patch("transformers.trainer.skip_first_batches") as skip_first_batches:
+                trainer.train(resume_from_checkpoint=checkpoint)
+            skip_first_batches.assert_not_called()
+            (a1, b1) = trainer.model.a.item(), trainer.model.b.item()
+            state1 = dataclasses.asdict(trainer.state)
+            self.assertEqual(a, a1)
+            self.assertEqual(b, b1)
+            self.check_trainer_state_are_the_same(state, state1)
+
     @require_safetensors
     @require_torch_up_to_2_accelerators
     def test_resume_training_with_safe_checkpoint(self):
@@ -16,6 +16,7 @@
 import os
 import shutil
 import tempfile
+import time
 import unittest
 from unittest.mock import patch
 
@@ -25,6 +26,7 @@ from transformers import (
     IntervalStrategy,
     PrinterCallback,
     ProgressCallback,
+    StepProfilerCallback,
     Trainer,
     TrainerCallback,
     TrainerState,
@@ -443,3 +445,43 @@ class TrainerCallbackTest(unittest.TestCase):
         trainer = self.get_trainer(max_steps=2, save_strategy="epoch", callbacks=[OnEndCallback])
         trainer.train()
         assert times_saved == 1
+
+    def test_step_profiler_callback(self):
+        class SlowStepCallback(TrainerCallback):
+            def on_step_begin(self, args, state, control, **kwargs):
+                if state.global_step == 15:
+                    time.sleep(0.5)
+
+        profiler = StepProfilerCallback(window_size=10, slow_step_factor=10, profile_steps=2)
+        trainer = self.get_trainer(
+            train_len=128, max_steps=20, logging_steps=5, save_strategy="no", callbacks=[SlowStepCallback, profiler]
+        )
+        # The statistics are added to the logs before they are reported
+        self.assertIs(trainer.callback_handler.callbacks[0], profiler)
+
+        # Other callbacks editing the logs come next, before the default ones
+        class LogEditorCallback(TrainerCallback):
+            _run_before_reporting = True
+
+        trainer.add_callback(LogEditorCallback)
+        self.assertIsInstance(trainer.callback_handler.callbacks[1], LogEditorCallback)
+        self.assertIsInstance(trainer.callback_handler.callbacks[2], DefaultFlowCallback)
+        trainer.remove_callback(LogEditorCallback)
+        trainer.train()
+
+        train_logs = [logs for logs in trainer.state.log_history if "loss" in logs]
+        self.assertEqual(len(train_logs), 4)
+        for logs in train_logs:
+            for key in StepProfilerCallback._phases + ["step_time", "step_time_max", "tokens_per_second"]:
+                self.assertIn(key, logs)
+            self.assertAlmostEqual(
+                logs["step_time"], sum(logs[phase] for phase in StepProfilerCallback._phases), delta=1e-3
+            )
+        # The slow step is in the window of the logs of step 20 only
+        self.assertGreater(train_logs[3]["step_time_max"], 0.5)
+        self.assertLess(train_logs[2]["step_time_max"], 0.5)
+        self.assertTrue(os.path.isfile(os.path.join(self.output_dir, "profiler", "trace_step_17-18.json")))
+
+        # The hooks are removed after training
+        self.assertEqual(len(trainer.model._forward_pre_hooks), 0)
+        self.assertEqual(len(trainer.model._forward_hooks), 0)
@@ -13,13 +13,14 @@
 # limitations under the License.
 
 import copy
+import threading
 import unittest
 
 import numpy as np
 
 from transformers.data.data_collator import default_data_collator
-from transformers.testing_utils import require_accelerate, require_torch
-from transformers.trainer_utils import RemoveColumnsCollator, find_executable_batch_size
+from transformers.testing_utils import require_accelerate, require_tokenizers, require_torch
+from transformers.trainer_utils import EvalPrediction, RemoveColumnsCollator, find_executable_batch_size
 from transformers.utils import is_torch_available
 
 
@@ -31,6 +32,7 @@ if is_torch_available():
     from transformers.modeling_outputs import SequenceClassifierOutput
     from transformers.tokenization_utils_base import BatchEncoding
     from transformers.trainer_pt_utils import (
+        AsyncCheckpointWriter,
         DistributedLengthGroupedSampler,
         DistributedSamplerWithLoop,
         DistributedTensorGatherer,
@@ -38,9 +40,18 @@ if is_torch_available():
         IterableDatasetShard,
         LabelSmoother,
         LengthGroupedSampler,
+        PackedTextDataset,
         SequentialDistributedSampler,
         ShardSampler,
+        StreamingAccuracy,
+        StreamingPerplexity,
+        TokenBudgetBatchSampler,
         get_parameter_names,
+        get_token_budget_batches,
+        nested_concat,
+        nested_concat_all,
+        nested_cpu_clone,
+        nested_numpify,
         numpy_pad_and_concatenate,
         torch_pad_and_concatenate,
     )
@@ -151,6 +162,36 @@ class TrainerUtilsTest(unittest.TestCase):
         for indices, seq_length in zip(actual_indices, sequence_lengths):
             self.assertTrue(np.array_equal(result[1][indices, :seq_length], predictions[indices, :seq_length]))
 
+        # The storage grows by doubling, but the result has the largest sequence length seen
+        gatherer = DistributedTensorGatherer(world_size=world_size, num_samples=num_samples)
+        for indices, seq_length in zip(input_indices, [5, 6, 7]):
+            gatherer.add_arrays([predictions[indices, :seq_length], predictions[indices]])
+        result = gatherer.finalize()
+        self.assertEqual(result[0].shape, (num_samples, 7))
+        self.assertEqual(result[1].shape, (num_samples, 13))
+        self.assertTrue(np.array_equal(result[0][input_indices[2][:-1], :7], predictions[input_indices[2][:-1], :7]))
+        self.assertTrue(np.all(result[0][input_indices[0], 5:] == -100))
+
+    def test_nested_concat_all(self):
+        batches = [
+            (torch.randn(4, 3), {"loss": torch.tensor(1.0)}, [torch.randint(0, 9, (4,))]),
+            (torch.randn(2, 5), {"loss": torch.tensor(2.0)}, [torch.randint(0, 9, (2,))]),
+            (torch.randn(3, 2), {"loss": torch.tensor(3.0)}, [torch.randint(0, 9, (3,))]),
+        ]
+        expected = nested_concat(nested_concat(batches[0], batches[1]), batches[2])
+        result = nested_concat_all(batches)
+        self.assertEqual(result[0].shape, (9, 5))
+        self.assertTrue(torch.equal(result[0], expected[0]))
+        self.assertTrue(torch.equal(result[1]["loss"], torch.tensor([1.0, 2.0, 3.0])))
+        self.assertTrue(torch.equal(result[2][0], expected[2][0]))
+
+        result = nested_concat_all([nested_numpify(batch) for batch in batches], padding_index=0)
+        self.assertIsInstance(result[0], np.ndarray)
+        self.assertTrue(np.all(result[0][:4, 3:] == 0))
+
+        # A single element is returned as is
+        self.assertIs(nested_concat_all(batches[:1]), batches[0])
+
     def test_label_smoothing(self):
         epsilon = 0.1
         num_labels = 12
@@ -234,6 +275,37 @@ class TrainerUtilsTest(unittest.TestCase):
         # The indices should be a permutation of range(100)
         self.assertEqual(sorted(indices_process_0 + indices_process_1), list(range(100)))
 
+    def test_token_budget_batches(self):
+        # Get some inputs of random lengths
+        lengths = torch.randint(1, 25, (100,)).tolist()
+        # Put one bigger than the budget to check it gets a batch of its own
+        lengths[32] = 50
+
+        batches = get_token_budget_batches(lengths, 40, window_size=30)
+        # The indices should be a permutation of range(100)
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(100)))
+        self.assertIn([32], batches)
+        for batch in batches:
+            if batch != [32]:
+                self.assertLessEqual(sum(lengths[i] for i in batch), 40)
+
+        batches = get_token_budget_batches(lengths, 40, window_size=30, num_replicas=7)
+        self.assertEqual(len(batches) % 7, 0)
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(100)))
+
+    def test_token_budget_batch_sampler(self):
+        data = [{"input_ids": list(range(length))} for length in torch.randint(1, 25, (50,)).tolist()]
+
+        sampler = TokenBudgetBatchSampler(40, dataset=data, seed=42)
+        batches = list(sampler)
+        self.assertEqual(len(batches), len(sampler))
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(50)))
+        # The next iteration packs another epoch, and the batches only depend on the seed and the epoch
+        self.assertNotEqual(list(sampler), batches)
+        sampler.set_epoch(0)
+        self.assertEqual(list(sampler), batches)
+        self.assertEqual(list(TokenBudgetBatchSampler(40, dataset=data, seed=42)), batches)
+
     def test_get_parameter_names(self):
         model = nn.Sequential(TstLayer(128), nn.ModuleList([TstLayer(128), TstLayer(128)]))
         # fmt: off
@@ -613,3 +685,154 @@ class TrainerUtilsTest(unittest.TestCase):
         self.assertEqual(len(arrays[2]), 2)
         self.assertEqual(arrays[2][0].shape, (8, 2, 3))
         self.assertEqual(arrays[2][1].shape, (8, 2))
+
+    def test_streaming_accuracy(self):
+        logits = torch.randn(6, 5, 10)
+        labels = torch.randint(0, 10, (6, 5))
+        labels[0, :2] = -100
+
+        metric = StreamingAccuracy()
+        for batch_logits, batch_labels in zip(logits.split(4), labels.split(4)):
+            metric.update(batch_logits, batch_labels)
+        mask = labels != -100
+        expected = ((logits.argmax(-1) == labels) & mask).sum() / mask.sum()
+        self.assertAlmostEqual(metric.compute()["accuracy"], expected.item())
+
+        # Predictions already reduced to ids, and labels shifted as for causal language models
+        metric = StreamingAccuracy(shift_labels=True)
+        metric.update(logits.argmax(-1), labels)
+        mask = labels[:, 1:] != -100
+        expected = ((logits.argmax(-1)[:, :-1] == labels[:, 1:]) & mask).sum() / mask.sum()
+        self.assertAlmostEqual(metric.compute()["accuracy"], expected.item())
+
+        # Reset between evaluations, and called like a `compute_metrics` function
+        eval_pred = EvalPrediction(predictions=logits.numpy(), label_ids=labels.numpy())
+        self.assertAlmostEqual(metric(eval_pred)["accuracy"], expected.item())
+
+    def test_streaming_perplexity(self):
+        logits = torch.randn(6, 5, 10)
+        labels = torch.randint(0, 10, (6, 5))
+        labels[:, :2] = -100
+
+        metric = StreamingPerplexity()
+        for batch_logits, batch_labels in zip(logits.split(4), labels.split(4)):
+            metric.update(batch_logits, batch_labels)
+        loss = nn.functional.cross_entropy(logits[:, :-1].flatten(0, 1), labels[:, 1:].flatten(), ignore_index=-100)
+        self.assertAlmostEqual(metric.compute()["perplexity"], loss.exp().item(), places=5)
+
+        metric = StreamingPerplexity(from_loss=True)
+        self.assertFalse(metric.requires_logits)
+        metric.update(None, None, losses=torch.tensor([1.0, 1.0, 1.0]))
+        metric.update(None, None, losses=torch.tensor([2.0]))
+        self.assertAlmostEqual(metric.compute()["perplexity"], np.exp(1.25), places=5)
+
+        # States are reduced across processes along the first dimension of the gathered tensors
+        metric.sync(lambda tensor: torch.cat([tensor, tensor]))
+        self.assertEqual(metric.count.item(), 8)
+        self.assertAlmostEqual(metric.compute()["perplexity"], np.exp(1.25), places=5)
+
+    def test_nested_cpu_clone(self):
+        model = nn.Linear(3, 3)
+        state_dict = {"weight": model.weight, "tied": model.weight, "step": 2, "groups": [{"lr": torch.tensor(0.1)}]}
+        clone = nested_cpu_clone(state_dict)
+        self.assertIs(clone["weight"], clone["tied"])
+        self.assertTrue(torch.equal(clone["weight"], model.weight))
+        self.assertFalse(clone["weight"].requires_grad)
+        self.assertEqual(clone["step"], 2)
+
+        # The copy is not affected by updates of the original tensors
+        with torch.no_grad():
+            model.weight.add_(1.0)
+        self.assertFalse(torch.equal(clone["weight"], model.weight))
+        state_dict["groups"][0]["lr"] += 1
+        self.assertEqual(clone["groups"][0]["lr"].item(), torch.tensor(0.1).item())
+
+    def test_async_checkpoint_writer(self):
+        release = threading.Event()
+        written = []
+
+        def write(step):
+            release.wait()
+            written.append(step)
+
+        writer = AsyncCheckpointWriter(max_pending=2)
+        writer.submit(write, 1)
+        writer.submit(write, 2)
+        self.assertEqual(len(writer), 2)
+        release.set()
+        # Submitting a third checkpoint waits for the first one
+        writer.submit(write, 3)
+        self.assertIn(1, written)
+        writer.wait()
+        self.assertEqual(written, [1, 2, 3])
+        self.assertEqual(len(writer), 0)
+
+        # Errors raised in the background are raised in the caller
+        def fail():
+            raise OSError("disk full")
+
+        writer.submit(fail)
+        with self.assertRaises(OSError):
+            writer.wait()
+
+    def _get_word_level_tokenizer(self):
+        from tokenizers import Tokenizer, models, pre_tokenizers
+
+        from transformers import PreTrainedTokenizerFast
+
+        vocab = {"[UNK]": 0, "</s>": 1, **{f"w{i}": i + 2 for i in range(20)}}
+        tokenizer_object = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+        tokenizer_object.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+        return PreTrainedTokenizerFast(tokenizer_object=tokenizer_object, unk_token="[UNK]", eos_token="</s>")
+
+    @require_tokenizers
+    def test_packed_text_dataset(self):
+        tokenizer = self._get_word_level_tokenizer()
+        texts = [" ".join(f"w{(i + j) % 20}" for j in range(i % 7 + 1)) for i in range(50)]
+        expected_tokens = []
+        for i in range(50):
+            expected_tokens += [(i + j) % 20 + 2 for j in range(i % 7 + 1)] + [1]
+        num_blocks = len(expected_tokens) // 8
+        expected_blocks = torch.tensor(expected_tokens[: num_blocks * 8]).view(num_blocks, 8)
+
+        dataset = PackedTextDataset(texts, tokenizer, max_length=8, tokenization_batch_size=6)
+        samples = list(dataset)
+        self.assertTrue(torch.equal(torch.stack([sample["input_ids"] for sample in samples]), expected_blocks))
+        self.assertTrue(torch.equal(torch.stack([sample["labels"] for sample in samples]), expected_blocks))
+
+        # Texts in dicts, from an iterable without length, split between dataloader workers: each worker packs the
+        # texts of its own batches
+        def iterate_texts():
+            for text in texts:
+                yield {"text": text}
+
+        expected_blocks = []
+        for worker_texts in [texts[:25], texts[25:]]:
+            worker_dataset = PackedTextDataset(worker_texts, tokenizer, max_length=8, tokenization_batch_size=25)
+            expected_blocks += [sample["input_ids"].tolist() for sample in worker_dataset]
+
+        for texts_to_pack in [texts, iterate_texts()]:
+            dataset = PackedTextDataset(texts_to_pack, tokenizer, max_length=8, tokenization_batch_size=25)
+            dataloader = torch.utils.data.DataLoader(dataset, batch_size=2, num_workers=2)
+            batches = [batch["input_ids"] for batch in dataloader]
+            self.assertEqual(batches[0].shape, (2, 8))
+            self.assertEqual(sorted(torch.cat(batches).tolist()), sorted(expected_blocks))
+
+    @require_tokenizers
+    def test_packed_text_dataset_from_iterable_dataset(self):
+        import datasets
+
+        tokenizer = self._get_word_level_tokenizer()
+        texts = [" ".join(f"w{(i + j) % 20}" for j in range(i % 7 + 1)) for i in range(50)]
+
+        # A `datasets.IterableDataset` already yields one shard in each dataloader worker, which packs all its texts
+        expected_blocks = []
+        for worker_texts in [texts[:25], texts[25:]]:
+            worker_dataset = PackedTextDataset(worker_texts, tokenizer, max_length=8, tokenization_batch_size=6)
+            expected_blocks += [sample["input_ids"].tolist() for sample in worker_dataset]
+
+        texts_to_pack = datasets.Dataset.from_dict({"text": texts}).to_iterable_dataset(num_shards=2)
+        dataset = PackedTextDataset(texts_to_pack, tokenizer, max_length=8, tokenization_batch_size=6)
+        dataloader = torch.utils.data.DataLoader(dataset, batch_size=2, num_workers=2)
+        batches = [batch["input_ids"] for batch in dataloader]
+        self.assertEqual(sorted(torch.cat(batches).tolist()), sorted(expected_blocks))
@@ -0,0 +1,128 @@
+# Copyright 2025 The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest.mock import patch
+
+from transformers import is_scipy_available, is_torch_available
+from transformers.testing_utils import require_scipy, require_torch
+
+
+if is_torch_available():
+    import torch
+
+    from transformers import LlamaConfig, LlamaForCausalLM
+    from transformers.loss.loss_for_object_detection import batched_linear_sum_assignment
+    from transformers.loss.loss_utils import (
+        LOSS_MAPPING,
+        ForCausalLMChunkedLoss,
+        ForCausalLMLoss,
+        _cross_entropy_grad,
+    )
+
+if is_scipy_available():
+    from scipy.optimize import linear_sum_assignment
+
+
+@require_torch
+class ChunkedCausalLMLossTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.hidden_states = torch.randn(2, 13, 16, dtype=torch.float64, requires_grad=True)
+        self.weight = torch.randn(50, 16, dtype=torch.float64, requires_grad=True)
+        self.bias = torch.randn(50, dtype=torch.float64, requires_grad=True)
+        self.labels = torch.randint(0, 50, (2, 13))
+        self.labels[0, :4] = -100
+
+    def _reference(self, num_items_in_batch=None):
+        logits = torch.nn.functional.linear(self.hidden_states, self.weight, self.bias)
+        loss = ForCausalLMLoss(logits, self.labels, 50, num_items_in_batch=num_items_in_batch)
+        return loss, torch.autograd.grad(loss, [self.hidden_states, self.weight, self.bias])
+
+    def test_chunked_loss_from_logits(self):
+        for num_items_in_batch in [None, 40]:
+            expected_loss, expected_grads = self._reference(num_items_in_batch)
+            logits = torch.nn.functional.linear(self.hidden_states, self.weight, self.bias)
+            loss = ForCausalLMChunkedLoss(logits, self.labels, 50, num_items_in_batch=num_items_in_batch, chunk_size=5)
+            grads = torch.autograd.grad(loss, [self.hidden_states, self.weight, self.bias])
+            torch.testing.assert_close(loss, expected_loss.float())
+            for grad, expected_grad in zip(grads, expected_grads):
+                torch.testing.assert_close(grad, expected_grad)
+
+    def test_chunked_loss_from_hidden_states(self):
+        for num_items_in_batch in [None, 40]:
+            expected_loss, expected_grads = self._reference(num_items_in_batch)
+            loss = ForCausalLMChunkedLoss(
+                labels=self.labels,
+                num_items_in_batch=num_items_in_batch,
+                hidden_states=self.hidden_states,
+                lm_head_weight=self.weight,
+                lm_head_bias=self.bias,
+                chunk_size=5,
+            )
+            grads = torch.autograd.grad(loss, [self.hidden_states, self.weight, self.bias])
+            torch.testing.assert_close(loss, expected_loss.float())
+            for grad, expected_grad in zip(grads, expected_grads):
+                torch.testing.assert_close(grad, expected_grad)
+
+        # Without gradients, only the loss is computed
+        logits = torch.nn.functional.linear(self.hidden_states, self.weight)
+        expected_loss = ForCausalLMLoss(logits, self.labels, 50).float().detach()
+        with patch("transformers.loss.loss_utils._cross_entropy_grad", wraps=_cross_entropy_grad) as grad_fn:
+            with torch.no_grad():
+                loss = ForCausalLMChunkedLoss(
+                    labels=self.labels, hidden_states=self.hidden_states, lm_head_weight=self.weight, chunk_size=5
+                )
+            torch.testing.assert_close(loss, expected_loss)
+            loss = ForCausalLMChunkedLoss(
+                labels=self.labels,
+                hidden_states=self.hidden_states.detach(),
+                lm_head_weight=self.weight.detach(),
+                chunk_size=5,
+            )
+            self.assertFalse(loss.requires_grad)
+            torch.testing.assert_close(loss, expected_loss)
+            grad_fn.assert_not_called()
+
+    def test_model_with_chunked_loss(self):
+        config = LlamaConfig(vocab_size=99, hidden_size=32, num_hidden_layers=2, num_attention_heads=4)
+        model = LlamaForCausalLM(config)
+        input_ids = torch.randint(0, 99, (2, 10))
+        expected_loss = model(input_ids, labels=input_ids).loss
+
+        model.loss_type = "ForCausalLMChunked"
+        self.assertIs(model.loss_function, LOSS_MAPPING["ForCausalLMChunked"])
+        loss = model(input_ids, labels=input_ids).loss
+        torch.testing.assert_close(loss, expected_loss)
+
+
+@require_scipy
+@require_torch
+class BatchedLinearSumAssignmentTest(unittest.TestCase):
+    def test_batched_linear_sum_assignment(self):
+        torch.manual_seed(0)
+        sizes = [3, 0, 7, 12]
+        cost_matrix = torch.randn(4, 10, sum(sizes))
+        indices = batched_linear_sum_assignment(cost_matrix, sizes)
+
+        self.assertEqual(len(indices), 4)
+        for image_index, (image_cost, (i, j)) in enumerate(zip(cost_matrix.split(sizes, -1), indices)):
+            expected_i, expected_j = linear_sum_assignment(image_cost[image_index])
+            self.assertEqual(i.dtype, torch.int64)
+            self.assertListEqual(i.tolist(), expected_i.tolist())
+            self.assertListEqual(j.tolist(), expected_j.tolist())
+
+        # Without any target in the batch
+        indices = batched_linear_sum_assignment(torch.randn(2, 10, 0), [0, 0])
+        self.assertListEqual([(len(i), len(j)) for i, j in indices], [(0, 0), (0, 0)])